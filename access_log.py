@@ -0,0 +1,154 @@
+"""
+日志输出与访问日志
+
+日志记录在请求线程中只做过滤并放入有界队列，格式化和写出由后台线程完成（QueueHandler + QueueListener），
+请求线程不会因为写终端或文件而阻塞；队列满时丢弃记录并计入 log_records_dropped_total。
+
+每个 HTTP 请求结束时（流式响应输出完毕时）写一条访问记录，字段 client、method、route、status、
+duration_ms、bytes 同时作为日志记录的属性，TOPV_LOG_FORMAT=json 时按 JSON 逐行输出。
+成功的请求按 TOPV_LOG_ACCESS_SAMPLE 的比例抽样，4xx/5xx 总是记录。
+
+处理函数中的明细日志（例如 query_history 的查询参数）按调用位置限速，每秒最多 TOPV_LOG_DETAIL_RATE 条，
+WARNING 及以上级别不受限制。
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+from metrics import Counter
+import config
+
+DROPPED = Counter('log_records_dropped_total', 'Log records dropped by sampling, rate limiting or a full queue.',
+                  ('reason',))
+
+# 输出明细日志、需要限速的模块
+DETAIL_LOGGERS = ('api_handler',)
+
+ACCESS_FIELDS = ('client', 'method', 'route', 'status', 'duration_ms', 'bytes')
+
+access_logger = logging.getLogger('access')
+
+_listener: Optional[QueueListener] = None
+
+
+class _LazyQueueHandler(QueueHandler):
+    """放入队列时不格式化消息，由后台线程格式化；队列满时丢弃
+
+    同一进程内传递记录对象，参数在格式化之前不会被序列化，调用方只应传入不可变的参数。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.labels('queue_full').inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出一行 JSON，访问记录附带各字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ACCESS_FIELDS:
+            if hasattr(record, field):
+                data[field] = getattr(record, field)
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """每个调用位置（文件与行号）每秒最多放行 rate 条 INFO 及以下级别的记录"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._lock = threading.Lock()
+        # 调用位置 -> (当前秒, 本秒已放行条数)
+        self._windows: Dict[Tuple[str, int], Tuple[int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        second = int(record.created)
+        with self._lock:
+            window, count = self._windows.get(key, (second, 0))
+            if window != second:
+                window, count = second, 0
+            allowed = count < self.rate
+            self._windows[key] = (window, count + 1 if allowed else count)
+        if not allowed:
+            DROPPED.labels('rate_limited').inc()
+        return allowed
+
+
+def setup_logging(background: bool = config.LOG_QUEUE, stream=None):
+    """配置根日志：background 为 True 时经队列由后台线程写出到 stream（默认 stderr）
+
+    可以重复调用（例如多进程模式下子进程重新配置），之前的后台线程会先停止。
+    后台线程在 fork 之后不存在，需要在子进程中调用。
+    """
+    global _listener
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(getattr(logging, config.LOG_LEVEL.upper(), logging.INFO))
+
+    output = logging.StreamHandler(stream)
+    if config.LOG_FORMAT == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    if background:
+        _listener = QueueListener(queue.Queue(config.LOG_QUEUE_SIZE), output, respect_handler_level=True)
+        root.addHandler(_LazyQueueHandler(_listener.queue))
+        _listener.start()
+    else:
+        root.addHandler(output)
+
+    for name in DETAIL_LOGGERS:
+        detail = logging.getLogger(name)
+        for old in [f for f in detail.filters if isinstance(f, RateLimitFilter)]:
+            detail.removeFilter(old)
+        detail.addFilter(RateLimitFilter(config.LOG_DETAIL_RATE))
+    access_logger.disabled = not config.LOG_ACCESS
+
+
+def stop_logging():
+    """停止后台线程，写出队列中剩余的记录"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def log_access(client: str, method: str, route: str, status: int, started: float, size: int):
+    """写一条访问记录；成功的请求按比例抽样"""
+    if access_logger.disabled or not access_logger.isEnabledFor(logging.INFO):
+        return
+    if status < 400 and config.LOG_ACCESS_SAMPLE < 1 and random.random() >= config.LOG_ACCESS_SAMPLE:
+        DROPPED.labels('sampled').inc()
+        return
+    duration_ms = round((time.perf_counter() - started) * 1000, 3)
+    access_logger.info('%s "%s %s" %d %.1fms %dB', client, method, route, status, duration_ms, size,
+                       extra={'client': client, 'method': method, 'route': route, 'status': status,
+                              'duration_ms': duration_ms, 'bytes': size})
\ No newline at end of file
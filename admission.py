@@ -0,0 +1,163 @@
+"""
+准入控制
+
+API 接口按开销分为四类，async 模式下每类有独立的工作线程、排队上限和最长排队时间：
+
+- realtime：find_last
+- write：set_value
+- history：query_history（流式响应的每一块也在这一类的线程中生成，输出期间一直占用这一类的一个名额）
+- catalog：query_points、query_devices
+
+一类接口再忙也只占用自己的线程，大量历史导出不会让 find_last 排在它们后面。线程数为 0 的类别
+直接在事件循环中执行，省去两次线程切换，但排队上限和最长排队时间不再生效，批量 find_last 和响应压缩
+也会阻塞事件循环，因此默认各类都有线程池。
+排队数达到上限的请求立即返回 503；排队时间超过最长排队时间的请求不再执行，同样返回 503（减载），
+两者都带 Retry-After。另可按客户端 IP 限速（令牌桶），超出时返回 429；sync 模式下只有限速生效。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from metrics import Counter, Gauge, Histogram
+import config
+
+REALTIME = "realtime"
+WRITE = "write"
+HISTORY = "history"
+CATALOG = "catalog"
+
+# 路径 -> 接口类别；不在表中的路径（/health、/metrics 等）不受准入控制
+ROUTE_CLASSES = {
+    '/api/find_last': REALTIME,
+    '/api/set_value': WRITE,
+    '/api/query_history': HISTORY,
+    '/api/query_points': CATALOG,
+    '/api/query_devices': CATALOG,
+}
+
+# 限速时记录的客户端数上限，超过时丢弃最久未访问的客户端
+MAX_CLIENTS = 10000
+
+REJECTED = Counter('http_admission_rejected_total', 'Requests rejected by admission control.',
+                   ('route_class', 'reason'))
+QUEUED = Gauge('http_admission_queued', 'Requests waiting for a worker thread.', ('route_class',))
+QUEUE_WAIT = Histogram('http_admission_wait_seconds', 'Time requests spent queued before a worker picked them up.',
+                       ('route_class',))
+
+
+class Overloaded(Exception):
+    """请求被准入控制拒绝，status 为 429 或 503，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, status: int, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class RouteClass:
+    """一类接口的工作线程池，线程数即并发预算，提交后尚未开始执行的请求即排队中的请求
+
+    workers 为 0 时没有线程池（executor 为 None），由调用方直接执行。
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int, max_wait: float):
+        self.name = name
+        self.workers = max(workers, 0)
+        self.queue_size = max(queue_size, 0)
+        self.max_wait = max_wait
+        self.executor = (ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'topv-{name}')
+                         if workers > 0 else None)
+        self.queued = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """提交到本类的线程池，线程都在忙且排队已满时抛出 Overloaded"""
+        with self._lock:
+            if self.queued + self.running >= self.workers + self.queue_size:
+                REJECTED.labels(self.name, 'queue_full').inc()
+                raise Overloaded(503, "Server busy, retry later")
+            self.queued += 1
+            QUEUED.labels(self.name).set(self.queued)
+        return self.executor.submit(self._run, time.monotonic(), fn, args)
+
+    def _run(self, enqueued: float, fn: Callable, args: Tuple):
+        waited = time.monotonic() - enqueued
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            QUEUED.labels(self.name).set(self.queued)
+        try:
+            QUEUE_WAIT.labels(self.name).observe(waited)
+            if waited > self.max_wait:
+                # 客户端多半已经等不及了，不再执行，把线程留给后面的请求
+                REJECTED.labels(self.name, 'deadline').inc()
+                raise Overloaded(503, "Server busy, retry later")
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        """在 with 块内占用本类的一个并发名额，用于已准入的流式响应：响应体逐块生成期间，
+        新的请求按这一名额已被占用排队或拒绝"""
+        with self._lock:
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+def create_route_classes() -> Dict[str, RouteClass]:
+    """按配置创建四类接口的线程池"""
+    return {
+        REALTIME: RouteClass(REALTIME, config.HTTP_REALTIME_WORKERS, config.HTTP_REALTIME_QUEUE,
+                             config.HTTP_REALTIME_MAX_WAIT),
+        WRITE: RouteClass(WRITE, config.HTTP_WRITE_WORKERS, config.HTTP_WRITE_QUEUE, config.HTTP_WRITE_MAX_WAIT),
+        HISTORY: RouteClass(HISTORY, config.HTTP_HISTORY_WORKERS, config.HTTP_HISTORY_QUEUE,
+                            config.HTTP_HISTORY_MAX_WAIT),
+        CATALOG: RouteClass(CATALOG, config.HTTP_CATALOG_WORKERS, config.HTTP_CATALOG_QUEUE,
+                            config.HTTP_CATALOG_MAX_WAIT),
+    }
+
+
+class RateLimiter:
+    """按客户端的令牌桶：每秒补充 rate 个令牌，最多积攒 burst 个"""
+
+    def __init__(self, rate: float = config.HTTP_RATE_LIMIT, burst: int = config.HTTP_RATE_BURST,
+                 max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst if burst > 0 else max(rate * 2, 1)
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        # 客户端 -> (令牌数, 更新时间)，按最近访问排序
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+    def check(self, client: str, route_class: str, now: Optional[float] = None):
+        """消耗一个令牌，令牌不足时抛出 Overloaded(429)；rate 为 0 时不限速"""
+        if self.rate <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.pop(client, None)
+            tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            REJECTED.labels(route_class, 'rate_limited').inc()
+            raise Overloaded(429, "Too many requests", (1 - tokens) / self.rate)
\ No newline at end of file
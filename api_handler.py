@@ -1,31 +1,60 @@
 import logging
-from datetime import datetime
-from typing import List, Dict, Any
-from models import ValueItem, DataItem, Result, HistoryResponse, TagPoint, Device
+from typing import Iterator, List, Dict, Any, Optional, Sequence, Tuple, Union
+from models import (ValueItem, DataItem, Result, EncodedResult, PackedResult, TagError, HistoryResponse, CachedJson,
+                    ItemStatus, BatchResponse, JsonModel, JSON, MSGPACK, pack_result)
+from history_store import to_epoch_ms, from_epoch_ms, window
+from downsample import AGGREGATES, downsample, parse_interval
+from write_pipeline import wait_all, WRITE_SUCCESS, WRITE_BUSY
+from projects import Project, projects
+from realtime_store import LatestValueStore
+from history_pool import history_pool
+import config
 
 logger = logging.getLogger(__name__)
 
+# 批量请求的汇总状态
+BATCH_SUCCESS = "success"
+BATCH_PARTIAL = "partial_failure"
+BATCH_FAILURE = "failure"
 
-def find_last(data: Dict[str, Any]) -> Dict[str, Any]:
-    """查询实时数据"""
+
+def _batch_code(failed: int, total: int) -> str:
+    """根据失败条目数给出整批状态"""
+    if failed == 0:
+        return BATCH_SUCCESS
+    if failed < total:
+        return BATCH_PARTIAL
+    return BATCH_FAILURE
+
+
+def find_last(data: Dict[str, Any]) -> Union[ValueItem, List[ValueItem], BatchResponse, Dict[str, Any]]:
+    """查询实时数据，请求包含 tags 列表时按批量查询处理"""
     try:
         if not data:
             return {"error": "Invalid request body"}
 
         project_id = data.get("projectID")
         tag = data.get("tag")
+        tags = data.get("tags")
         device = data.get("device", False)
 
-        logger.info(f"find_last: projectID={project_id}, tag={tag}, device={device}")
+        project = projects.get(project_id)
+
+        if tags is not None:
+            return _find_last_batch(project, tags, device)
 
-        now = datetime.now()
-        
+        logger.info("find_last: projectID=%s, tag=%s, device=%s", project_id, tag, device)
+
+        latest_values = project.latest_values
         if device:
             # 查询设备标签下的所有测点
-            response = [ValueItem(tag, now, "12.3", 1).to_dict()]
+            response = latest_values.get_device(tag)
         else:
             # 查询单个测点
-            response = ValueItem(tag, now, "12.3", 1).to_dict()
+            item = latest_values.get(tag)
+            if item is None:
+                return {"error": f"Tag not found: {tag}"}
+            response = item
 
         return response
 
@@ -34,18 +63,70 @@ def find_last(data: Dict[str, Any]) -> Dict[str, Any]:
         return {"error": str(e)}
 
 
-def set_value(data: Dict[str, Any]) -> Dict[str, Any]:
-    """设置值"""
+def _find_last_batch(project: Project, tags: Any, device: bool) -> Union[BatchResponse, Dict[str, Any]]:
+    """批量查询实时数据
+
+    结果按请求顺序排列：找到的测点为 ValueItem，device 为 true 时展开为设备下的全部测点；
+    未找到的标签以 ItemStatus(code=not_found) 占位，整批状态由 code 汇总。
+    """
+    if not isinstance(tags, list):
+        return {"error": "tags must be a list"}
+
+    logger.info("find_last: projectID=%s, tags=%d, device=%s", project.id, len(tags), device)
+
+    latest_values = project.latest_values
+    results = []
+    failed = 0
+    for tag in tags:
+        if device:
+            items = latest_values.get_device(tag)
+            if items:
+                results.extend(items)
+                continue
+        else:
+            item = latest_values.get(tag) if isinstance(tag, str) else None
+            if item is not None:
+                results.append(item)
+                continue
+        failed += 1
+        results.append(ItemStatus(tag, "not_found", "Device not found" if device else "Tag not found"))
+
+    return BatchResponse(results, _batch_code(failed, len(tags)))
+
+
+def set_value(data: Dict[str, Any]) -> Union[BatchResponse, Dict[str, Any]]:
+    """设置值，请求包含 writes 列表时按批量写入处理
+
+    写入交给写值流水线异步下发；ack 为 true（或配置 TOPV_WRITE_ACK）时等待写入真正完成再响应。
+    """
     try:
         if not data:
             return {"error": "Invalid request body"}
 
         project_id = data.get("projectID")
+        writes = data.get("writes")
+        ack = bool(data.get("ack", config.WRITE_ACK))
+        project = projects.get(project_id)
+
+        if writes is not None:
+            return _set_value_batch(project, writes, ack)
+
         tag = data.get("tag")
         value = data.get("value")
         time = data.get("time")
 
-        logger.info(f"set_value: projectID={project_id}, tag={tag}, value={value}, time={time}")
+        logger.info("set_value: projectID=%s, tag=%s, value=%s, time=%s", project_id, tag, value, time)
+
+        error = _validate_write(data, project.latest_values)
+        if error is not None:
+            return {"error": error}
+
+        futures = project.write_pipeline.submit([data])
+        if futures is None:
+            return _busy_response()
+        status = wait_all(futures, config.WRITE_ACK_TIMEOUT)[0] if ack else WRITE_SUCCESS
+        if status != WRITE_SUCCESS:
+            return {"code": status, "msg": f"Value not applied: {status}"}
 
         response = {
             "code": "success",
@@ -59,104 +140,218 @@ def set_value(data: Dict[str, Any]) -> Dict[str, Any]:
         return {"error": str(e)}
 
 
-def query_history(data: Dict[str, Any]) -> Dict[str, Any]:
+def _busy_response() -> Dict[str, Any]:
+    return {"code": WRITE_BUSY, "msg": "Write queue is full, retry later"}
+
+
+def _validate_write(write: Any, store: LatestValueStore) -> Optional[str]:
+    """检查单条写入请求，合法且最新值表能容纳时返回 None，否则返回错误说明"""
+    if not isinstance(write, dict):
+        return "Write must be an object"
+    if not isinstance(write.get("tag"), str) or not write["tag"]:
+        return "Missing tag"
+    if "value" not in write:
+        return "Missing value"
+    try:
+        to_epoch_ms(write.get("time"))
+    except (TypeError, ValueError):
+        return f"Invalid time: {write.get('time')}"
+    return store.check(write["tag"], write["value"])
+
+
+def _set_value_batch(project: Project, writes: Any, ack: bool) -> Union[BatchResponse, Dict[str, Any]]:
+    """批量设置值，每条写入独立校验，结果按请求顺序给出
+
+    校验通过的写入整批提交给写值流水线，待写表容纳不下时整批返回 busy。
+    """
+    if not isinstance(writes, list):
+        return {"error": "writes must be a list"}
+
+    logger.info("set_value: projectID=%s, writes=%d, ack=%s", project.id, len(writes), ack)
+
+    errors = [_validate_write(write, project.latest_values) for write in writes]
+    accepted = [write for write, error in zip(writes, errors) if error is None]
+    futures = project.write_pipeline.submit(accepted) if accepted else []
+    if futures is None:
+        return _busy_response()
+    statuses = iter(wait_all(futures, config.WRITE_ACK_TIMEOUT) if ack else [WRITE_SUCCESS] * len(futures))
+
+    results = []
+    failed = 0
+    for write, error in zip(writes, errors):
+        tag = write.get("tag") if isinstance(write, dict) else None
+        if error is not None:
+            failed += 1
+            results.append(ItemStatus(tag, "invalid", error))
+            continue
+        status = next(statuses)
+        if status != WRITE_SUCCESS:
+            failed += 1
+        results.append(ItemStatus(tag, status))
+
+    return BatchResponse(results, _batch_code(failed, len(writes)))
+
+
+def _query_tag_columns(project: Project, tag: str, start_ms: Optional[int], end_ms: Optional[int],
+                       interval_ms: Optional[int], aggregate: str, offset: int,
+                       limit: Optional[int], descending: bool) -> Tuple[Sequence[int], Sequence[float]]:
+    """查询单个标签的历史数据，返回 (毫秒时间戳列, 数值列)；指定 interval 时先降采样再分页"""
+    if not interval_ms:
+        return project.history.query(tag, start_ms, end_ms, offset, limit, descending)
+
+    times, values = project.history.query(tag, start_ms, end_ms)
+    buckets = downsample(times, values, interval_ms, start_ms)
+    bucket_times = buckets['time']
+    bucket_values = buckets[aggregate]
+    lo, hi = window(0, len(bucket_times), offset, limit, descending)
+    indices = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+    return [bucket_times[i] for i in indices], [bucket_values[i] for i in indices]
+
+
+def _query_tag_history(project: Project, tag: str, start_ms: Optional[int], end_ms: Optional[int],
+                       interval_ms: Optional[int], aggregate: str, offset: int,
+                       limit: Optional[int], descending: bool) -> Result:
+    """查询单个标签的历史数据"""
+    times, values = _query_tag_columns(project, tag, start_ms, end_ms, interval_ms, aggregate, offset, limit,
+                                       descending)
+    return Result(tag, [DataItem(value, from_epoch_ms(ts)) for ts, value in zip(times, values)])
+
+
+def _cached_tag_history(project: Project, tag: str, start_ms: Optional[int], end_ms: Optional[int],
+                        interval_ms: Optional[int], aggregate: str, offset: int,
+                        limit: Optional[int], descending: bool,
+                        fmt: str = JSON) -> Union[EncodedResult, PackedResult]:
+    """经结果缓存查询单个标签，参数先规范化，等价的写法共用一个缓存条目
+
+    fmt 为 MSGPACK 时直接按列编码，不经过 DataItem；两种格式分别缓存，需要另一种格式时按同样的参数
+    查询（或取缓存），不在两种编码之间换算时间。
+    """
+    offset = max(offset, 0)
+    if limit is not None and limit < 0:
+        limit = None
+    key = (tag, start_ms, end_ms, interval_ms or None, aggregate if interval_ms else None,
+           offset, limit, descending, fmt)
+    # 写入进度须在查询前读取：查询期间写入的新数据会让这个条目在下次访问时失效
+    watermark = project.history.watermark(tag)
+    args = (project, tag, start_ms, end_ms, interval_ms, aggregate, offset, limit, descending)
+    if fmt == MSGPACK:
+        data = project.history_cache.get(key, end_ms, watermark, lambda: pack_result(tag, *_query_tag_columns(*args)))
+        return PackedResult(tag, data, lambda: _cached_tag_history(*args, fmt=JSON).text)
+    text = project.history_cache.get(key, end_ms, watermark, lambda: _query_tag_history(*args)._encode(False))
+    return EncodedResult(tag, text, lambda: _cached_tag_history(*args, fmt=MSGPACK).data)
+
+
+def query_history(data: Dict[str, Any]) -> Union[HistoryResponse, Dict[str, Any]]:
     """查询历史数据"""
     try:
         if not data:
             return {"error": "Invalid request body"}
 
         project_id = data.get("projectID")
-        tags = data.get("tag", [])
+        tags = data.get("tag") or []
         interval = data.get("interval")
         start = data.get("start")
         end = data.get("end")
         offset = data.get("offset")
         limit = data.get("limit")
         order = data.get("order")
-
-        logger.info(f"query_history: projectID={project_id}, tags={tags}, interval={interval}, "
-                   f"start={start}, end={end}, offset={offset}, limit={limit}, order={order}")
-
-        results = []
-        if tags:
-            # 为每个标签创建结果
-            for tag in tags:
-                data_item = DataItem("12.3", datetime.now())
-                result = Result(tag, [data_item])
-                results.append(result)
-
-        response = HistoryResponse(results)
-        return response.to_dict()
+        aggregate = data.get("aggregate") or "avg"
+
+        # 只记录标签个数：标签列表可能有上万项
+        logger.info("query_history: projectID=%s, tags=%s, interval=%s, start=%s, end=%s, offset=%s, "
+                    "limit=%s, order=%s", project_id, len(tags) if isinstance(tags, list) else tags,
+                    interval, start, end, offset, limit, order)
+
+        project = projects.get(project_id)
+        start_ms = to_epoch_ms(start)
+        end_ms = to_epoch_ms(end)
+        interval_ms = parse_interval(interval)
+        descending = str(order or "").lower().startswith("desc")
+        offset = int(offset or 0)
+        limit = None if limit is None or limit == "" else int(limit)
+        if aggregate not in AGGREGATES:
+            return {"error": f"Invalid aggregate: {aggregate}"}
+        if not isinstance(tags, list):
+            return {"error": f"Invalid tag: {tags}"}
+        for tag in tags:
+            if not isinstance(tag, str):
+                return {"error": f"Invalid tag: {tag}"}
+
+        # 按时间范围、降采样和分页参数查询每个标签；结果在编码输出时才生成，各标签在线程池中并行查询，
+        # 按请求中的顺序输出，流式响应下同一时刻只有有限个标签的数据在内存中。
+        # 参数在此之前全部校验完毕：输出时已经离开了这里的 try，单个标签出错只能作为该标签的结果返回
+        def query(fmt: str) -> Iterator[JsonModel]:
+            def query_tag(tag: str) -> JsonModel:
+                try:
+                    return _cached_tag_history(project, tag, start_ms, end_ms, interval_ms, aggregate, offset,
+                                               limit, descending, fmt)
+                except Exception as e:
+                    logger.error(f"Error in query_history for tag {tag}: {e}")
+                    return TagError(tag, str(e))
+            return history_pool.map(query_tag, tags)
+
+        return HistoryResponse(query, count=len(tags))
 
     except Exception as e:
         logger.error(f"Error in query_history: {e}")
         return {"error": str(e)}
 
 
-def query_points(data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """查询测点标签"""
+def _optional_int(data: Dict[str, Any], name: str, minimum: int) -> Optional[int]:
+    """读取可选的整数参数，不合法时抛出 ValueError"""
+    value = data.get(name)
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).lstrip('-').isdigit():
+        raise ValueError(f"Invalid {name}: {value}")
+    value = int(value)
+    if value < minimum:
+        raise ValueError(f"Invalid {name}: {value}")
+    return value
+
+
+def query_points(data: Dict[str, Any]) -> Union[CachedJson, List[Dict[str, Any]]]:
+    """查询设备下的测点标签，给出 limit 时分页返回 {"items": [...], "nextCursor": ...}"""
     try:
         if not data:
             return [{"error": "Invalid request body"}]
 
         project_id = data.get("projectID")
         parent_tag = data.get("parentTag")
+        cursor = data.get("cursor")
+        limit = _optional_int(data, "limit", 1)
 
-        logger.info(f"query_points: projectID={project_id}, parentTag={parent_tag}")
+        logger.info("query_points: projectID=%s, parentTag=%s, cursor=%s, limit=%s",
+                    project_id, parent_tag, cursor, limit)
 
-        points = [
-            TagPoint(f"{parent_tag}.a", "a"),
-            TagPoint(f"{parent_tag}.b", "b"),
-            TagPoint(f"{parent_tag}.c", "c")
-        ]
-
-        response = [point.to_dict() for point in points]
-        return response
+        return projects.get(project_id).device_tree.snapshot().point_list(parent_tag, cursor, limit)
 
     except Exception as e:
         logger.error(f"Error in query_points: {e}")
         return [{"error": str(e)}]
 
 
-def query_devices(data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """查询设备标签"""
+def query_devices(data: Dict[str, Any]) -> Union[CachedJson, List[Dict[str, Any]]]:
+    """查询设备树
+
+    parentTag 指定时从该节点的子节点开始，depth 指定展开的层数（1 表示只返回这一层），
+    给出 limit 时按这一层的节点分页返回 {"items": [...], "nextCursor": ...}。
+    """
     try:
         if not data:
             return [{"error": "Invalid request body"}]
 
         project_id = data.get("projectID")
+        parent_tag = data.get("parentTag")
+        depth = _optional_int(data, "depth", 1)
+        cursor = data.get("cursor")
+        limit = _optional_int(data, "limit", 1)
 
-        logger.info(f"query_devices: projectID={project_id}")
-
-        devices = []
-
-        # Group 1
-        group1_children = [
-            Device("group1.dev1", "dev1", [], True),
-            Device("group1.dev2", "dev2", [], True),
-            Device("group1.dev3", "dev3", [], True)
-        ]
-        devices.append(Device("group1", "group1", group1_children, False))
-
-        # Group 2
-        group2_children = [
-            Device("group2.dev1", "dev1", [], True),
-            Device("group2.dev2", "dev2", [], True),
-            Device("group2.dev3", "dev3", [], True)
-        ]
-        devices.append(Device("group2", "group2", group2_children, False))
-
-        # Group 3
-        group3_children = [
-            Device("group3.dev1", "dev1", [], True),
-            Device("group3.dev2", "dev2", [], True),
-            Device("group3.dev3", "dev3", [], True)
-        ]
-        devices.append(Device("group3", "group3", group3_children, False))
-
-        response = [device.to_dict() for device in devices]
-        return response
+        logger.info("query_devices: projectID=%s, parentTag=%s, depth=%s, cursor=%s, limit=%s",
+                    project_id, parent_tag, depth, cursor, limit)
+
+        return projects.get(project_id).device_tree.snapshot().devices(parent_tag, depth, cursor, limit)
 
     except Exception as e:
         logger.error(f"Error in query_devices: {e}")
-        return [{"error": str(e)}] 
\ No newline at end of file
+        return [{"error": str(e)}]
\ No newline at end of file
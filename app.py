@@ -1,140 +1,146 @@
 import asyncio
-import json
 import logging
+import os
 import signal
+import socket
 import sys
 import threading
-from datetime import datetime
+import time
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
-from api_handler import find_last, set_value, query_history, query_points, query_devices
+from urllib.parse import urlparse
+import config
+from routes import CORS_HEADERS, dispatch, overloaded_response
+from admission import ROUTE_CLASSES, Overloaded, RateLimiter
+from access_log import setup_logging, stop_logging
+from async_server import AsyncHTTPServer
 from nats_service import NatsPushService
+from nats_requests import NatsRequestService
+from projects import projects
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 配置日志：导入时直接输出，启动服务时再切换为后台线程输出（多进程模式下在各子进程中切换）
+setup_logging(background=False)
 logger = logging.getLogger(__name__)
 
-# NATS 服务实例
-nats_service = None
+# NATS 服务实例，每个项目一个推送服务
+nats_services = []
+nats_requests = None
 nats_task = None
+# sync 模式按客户端限速（并发预算和排队只在 async 模式下生效）
+rate_limiter = RateLimiter()
 
 
 class TopVRequestHandler(BaseHTTPRequestHandler):
     """自定义 HTTP 请求处理器"""
     
-    def _set_response(self, status_code=200, content_type='application/json'):
+    def _set_response(self, status_code=200, content_type='application/json', headers=()):
         """设置响应头"""
         self.send_response(status_code)
         self.send_header('Content-Type', content_type)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
+        for name, value in headers:
+            self.send_header(name, value)
         self.end_headers()
     
     def _read_request_body(self):
         """读取请求体"""
         content_length = int(self.headers.get('Content-Length', 0))
         if content_length > 0:
-            return self.rfile.read(content_length).decode('utf-8')
+            return self.rfile.read(content_length)
         return None
     
-    def _send_json_response(self, data, status_code=200):
-        """发送 JSON 响应"""
-        self._set_response(status_code)
-        response = json.dumps(data, ensure_ascii=False)
-        self.wfile.write(response.encode('utf-8'))
+    def _send_response(self, response):
+        """发送响应，流式响应逐块写出（HTTP/1.0 下以关闭连接表示响应结束）"""
+        headers = list(response.headers)
+        if response.body is not None:
+            headers.append(('Content-Length', str(len(response.body))))
+        self._set_response(response.status, response.content_type, headers)
+        
+        if response.streaming:
+            try:
+                for chunk in response.chunks:
+                    self.wfile.write(chunk)
+            except (ConnectionError, BrokenPipeError):
+                logger.info(f"{self.address_string()} - client disconnected during streaming")
+            except Exception as e:
+                logger.error(f"Error streaming response: {e}")
+            finally:
+                response.close()
+                self.close_connection = True
+        elif response.body:
+            self.wfile.write(response.body)
+    
+    def _handle(self, method):
+        """读取请求并交给路由分发"""
+        parsed_url = urlparse(self.path)
+        path = parsed_url.path
+        
+        # /health 不读取请求体
+        body = None if path == '/health' else self._read_request_body()
+        route_class = ROUTE_CLASSES.get(path)
+        if route_class is not None:
+            try:
+                rate_limiter.check(self.client_address[0], route_class)
+            except Overloaded as e:
+                self._send_response(overloaded_response(method, path, e, self.client_address[0]))
+                return
+        self._send_response(dispatch(method, path, body, self.headers, parsed_url.query, self.client_address[0]))
     
     def do_OPTIONS(self):
         """处理 OPTIONS 请求（CORS 预检）"""
-        self._set_response()
+        self._handle('OPTIONS')
     
     def do_POST(self):
         """处理 POST 请求"""
-        try:
-            parsed_url = urlparse(self.path)
-            path = parsed_url.path
-            
-            # 读取请求体
-            body = self._read_request_body()
-            request_data = json.loads(body) if body else {}
-            
-            # 根据路径分发到不同的处理器
-            if path == '/api/set_value':
-                response = set_value(request_data)
-            elif path == '/api/query_history':
-                response = query_history(request_data)
-            else:
-                self._send_json_response({"error": "Not found"}, 404)
-                return
-            
-            self._send_json_response(response)
-            
-        except json.JSONDecodeError:
-            self._send_json_response({"error": "Invalid JSON"}, 400)
-        except Exception as e:
-            logger.error(f"Error handling POST request: {e}")
-            self._send_json_response({"error": "Internal server error"}, 500)
+        self._handle('POST')
     
     def do_GET(self):
         """处理 GET 请求"""
-        try:
-            parsed_url = urlparse(self.path)
-            path = parsed_url.path
-            
-            if path == '/health':
-                self._send_json_response({"status": "healthy", "service": "topv-adaptor-python"})
-                return
-            
-            # 读取请求体（GET 请求也可能包含 body）
-            body = self._read_request_body()
-            request_data = json.loads(body) if body else {}
-            
-            # 根据路径分发到不同的处理器
-            if path == '/api/find_last':
-                response = find_last(request_data)
-            elif path == '/api/query_points':
-                response = query_points(request_data)
-            elif path == '/api/query_devices':
-                response = query_devices(request_data)
-            else:
-                self._send_json_response({"error": "Not found"}, 404)
-                return
-            
-            self._send_json_response(response)
-            
-        except json.JSONDecodeError:
-            self._send_json_response({"error": "Invalid JSON"}, 400)
-        except Exception as e:
-            logger.error(f"Error handling GET request: {e}")
-            self._send_json_response({"error": "Internal server error"}, 500)
+        self._handle('GET')
     
+    def log_request(self, code='-', size='-'):
+        """访问记录由 routes.dispatch 在请求结束时写出"""
 
-    
     def log_message(self, format, *args):
-        """重写日志方法，使用我们的 logger"""
-        logger.info(f"{self.address_string()} - {format % args}")
+        """重写日志方法，使用我们的 logger（只剩下错误信息）"""
+        logger.info("%s - %s", self.address_string(), format % args)
 
 
-async def start_nats_service():
-    """启动 NATS 服务"""
-    global nats_service, nats_task
+async def start_nats_service(shard=0, shards=1):
+    """启动 NATS 服务，每个项目一个推送服务，多进程模式下只负责第 shard 个分片的测点"""
+    global nats_requests
     try:
-        nats_service = NatsPushService()
-        await nats_service.connect()
-        await nats_service.start_realtime_push()
-        logger.info("NATS service started successfully")
+        for project in projects:
+            nats_services.append(NatsPushService(
+                config.NATS_URL, store=project.latest_values, history=project.history,
+                subject_prefix=project.subject_prefix, catalog=project.load_catalog(),
+                shard=shard, shards=shards, buffer_size=project.buffer_size))
+        # 先启动推送循环：连上 NATS 之前的数据进入重放缓冲区，连上后补发
+        for service in nats_services:
+            await service.start_realtime_push()
+        await asyncio.gather(*[service.connect_with_retry() for service in nats_services])
+        if config.NATS_REQUESTS:
+            for project in projects:
+                if (config.NATS_REQUEST_PREFIX + '.').startswith(project.subject_prefix + '.'):
+                    logger.warning(f"NATS request prefix {config.NATS_REQUEST_PREFIX} overlaps the realtime "
+                                   f"subjects of project {project.id} ({project.subject_prefix})")
+            # 请求中带有 projectID，由处理函数按项目路由，一个订阅即可
+            nats_requests = NatsRequestService(nats_services[0].nc)
+            await nats_requests.start()
+            # 第一个项目的连接关闭后重新建立时，跟随到新连接上
+            nats_services[0].connect_callbacks.append(nats_requests.rebind)
+        logger.info(f"NATS service started successfully for {len(nats_services)} project(s)")
     except Exception as e:
         logger.error(f"Failed to start NATS service: {e}")
 
 
 async def stop_nats_service():
     """停止 NATS 服务"""
-    global nats_service
-    if nats_service:
-        await nats_service.close()
+    if nats_requests:
+        await nats_requests.close()
+    for service in nats_services:
+        await service.close()
+    if nats_services:
         logger.info("NATS service stopped")
 
 
@@ -143,20 +149,151 @@ def signal_handler(signum, frame):
     logger.info(f"Received signal {signum}, shutting down...")
     if nats_task and not nats_task.done():
         nats_task.cancel()
+    # 下发尚未处理的写值请求，写出尚未落盘的历史数据
+    for project in projects:
+        project.close()
     sys.exit(0)
 
 
-def run_nats_service():
-    """在新线程中运行 NATS 服务"""
+def run_nats_service(shard=0, shards=1):
+    """在新线程（或多进程模式下的推送进程）中运行 NATS 服务"""
     global nats_task
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    nats_task = loop.create_task(start_nats_service())
+    nats_task = loop.create_task(start_nats_service(shard, shards))
     loop.run_forever()
 
 
+class ReusePortHTTPServer(HTTPServer):
+    """多进程模式下各工作进程共同监听同一端口，由内核分配连接"""
+    allow_reuse_port = True
+
+
+def run_http_server(reuse_port=False):
+    """以单线程 http.server 模式运行 HTTP 服务"""
+    server_address = (config.HTTP_HOST, config.HTTP_PORT)
+    httpd = (ReusePortHTTPServer if reuse_port else HTTPServer)(server_address, TopVRequestHandler)
+    
+    logger.info(f"Starting HTTP server on port {config.HTTP_PORT}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down server...")
+        httpd.shutdown()
+
+
+def run_async_http_server(reuse_port=False):
+    """以 asyncio 并发模式运行 HTTP 服务"""
+    if config.HTTP_SWITCH_INTERVAL > 0:
+        sys.setswitchinterval(config.HTTP_SWITCH_INTERVAL)
+    server = AsyncHTTPServer(
+        config.HTTP_HOST,
+        config.HTTP_PORT,
+        max_workers=config.HTTP_WORKERS,
+        keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+        max_keepalive_requests=config.HTTP_KEEPALIVE_MAX_REQUESTS,
+        max_body_size=config.HTTP_MAX_BODY_SIZE,
+        reuse_port=reuse_port,
+    )
+    
+    logger.info(f"Starting async HTTP server on port {config.HTTP_PORT} "
+                f"with {config.HTTP_WORKERS} workers")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Shutting down server...")
+
+
+def _run_child(role, shard):
+    """子进程入口：nats 进程运行第 shard 个分片的推送循环，http 进程运行 HTTP 服务；不返回"""
+    setup_logging()
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    code = 0
+    try:
+        if role == 'nats':
+            run_nats_service(shard, config.NATS_SHARDS)
+        elif config.HTTP_MODE == 'async':
+            run_async_http_server(reuse_port=True)
+        else:
+            run_http_server(reuse_port=True)
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 0
+    except BaseException as e:
+        logger.error(f"{role} process failed: {e}")
+        code = 1
+    finally:
+        # os._exit 不执行 atexit，先写出日志队列中剩余的记录
+        stop_logging()
+        logging.shutdown()
+    # 不执行主进程的退出清理（例如删除共享内存）
+    os._exit(code)
+
+
+def run_prefork():
+    """多进程模式
+
+    主进程只负责创建共享内存（导入 projects 时已为各项目创建）和管理子进程，自身不启动任何线程，
+    可以安全地 fork：TOPV_NATS_SHARDS 个子进程按测点分片运行 NATS 推送循环，TOPV_HTTP_PROCESSES
+    个子进程各自通过 SO_REUSEPORT 监听同一端口。子进程意外退出时重新启动；收到退出信号时通知全部子进程退出。
+    """
+    children = {}
+    stopping = False
+
+    def spawn(role, shard=0):
+        pid = os.fork()
+        if pid == 0:
+            _run_child(role, shard)
+        children[pid] = (role, shard)
+        logger.info(f"Started {role} process {pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        logger.info(f"Received signal {signum}, stopping {len(children)} processes...")
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        for shard in range(max(config.NATS_SHARDS, 1)):
+            spawn('nats', shard)
+        for _ in range(config.HTTP_PROCESSES):
+            spawn('http')
+
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            child = children.pop(pid, None)
+            if child is not None and not stopping:
+                logger.warning(f"{child[0]} process {pid} exited with status {status}, restarting")
+                time.sleep(1)
+                if not stopping:
+                    spawn(*child)
+    finally:
+        # 主进程异常退出时也删除各项目的共享内存，避免残留在 /dev/shm
+        for project in projects:
+            project.latest_values.close(unlink=True)
+    logger.info("All processes stopped")
+
+
 def main():
     """主函数"""
+    if config.HTTP_PROCESSES > 1:
+        if hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT'):
+            run_prefork()
+            return
+        logger.error("Multi-process mode requires fork and SO_REUSEPORT, falling back to a single process")
+
+    setup_logging()
+
     # 设置信号处理器
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -166,16 +303,10 @@ def main():
     nats_thread.start()
     
     # 启动 HTTP 服务器
-    server_address = ('', 8080)
-    httpd = HTTPServer(server_address, TopVRequestHandler)
-    
-    logger.info("Starting HTTP server on port 8080")
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        logger.info("Shutting down server...")
-        httpd.shutdown()
-
+    if config.HTTP_MODE == 'async':
+        run_async_http_server()
+    else:
+        run_http_server()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,288 @@
+"""
+基于 asyncio 的并发 HTTP 服务
+
+连接的读写运行在事件循环上，API 处理函数和 JSON 编码在有界线程池中执行：
+四类 API 接口各有自己的线程池和排队上限（见 admission.py），其余路径使用公共线程池，
+一个耗时的 query_history 不会阻塞其他连接上的 find_last 轮询。
+支持 HTTP/1.1 keep-alive，路由与同步模式共用 routes 模块。
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+from routes import CORS_HEADERS, Response, dispatch, json_response, overloaded_response
+from admission import ROUTE_CLASSES, Overloaded, RateLimiter, RouteClass, create_route_classes
+
+logger = logging.getLogger(__name__)
+
+# 请求行加请求头的最大字节数
+MAX_HEADER_SIZE = 64 * 1024
+
+
+class BadRequest(Exception):
+    """请求报文无法解析"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def parse_request_head(head: bytes) -> Tuple[str, str, str, Dict[str, str]]:
+    """解析请求行和请求头，返回 (方法, 请求目标, 协议版本, 请求头)
+
+    请求头名称统一转为小写。
+    """
+    try:
+        text = head.decode('latin-1')
+    except UnicodeDecodeError:
+        raise BadRequest(400, "Bad request")
+
+    lines = text.split('\r\n')
+    parts = lines[0].split(' ')
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise BadRequest(400, "Bad request line")
+    method, target, version = parts
+
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise BadRequest(400, "Bad header line")
+        headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def wants_keep_alive(version: str, headers: Dict[str, str]) -> bool:
+    """根据协议版本和 Connection 头判断是否保持连接"""
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.1':
+        return 'close' not in connection
+    return 'keep-alive' in connection
+
+
+class AsyncHTTPServer:
+    def __init__(self, host: str = '', port: int = 8080, max_workers: int = 32,
+                 keepalive_timeout: float = 15.0, max_keepalive_requests: int = 0,
+                 max_body_size: int = 16 * 1024 * 1024, reuse_port: bool = False,
+                 route_classes: Optional[Dict[str, RouteClass]] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.host = host or None
+        self.port = port
+        self.reuse_port = reuse_port
+        self.keepalive_timeout = keepalive_timeout
+        self.max_keepalive_requests = max_keepalive_requests
+        self.max_body_size = max_body_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='topv-http')
+        self.route_classes = route_classes if route_classes is not None else create_route_classes()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.server: Optional[asyncio.AbstractServer] = None
+        # 活动连接：处理任务 -> writer，关闭服务时一并关闭
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self):
+        """开始监听端口"""
+        self.server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port,
+            limit=MAX_HEADER_SIZE, reuse_address=True, reuse_port=self.reuse_port or None)
+
+    async def serve_forever(self):
+        """启动并持续运行，直到任务被取消"""
+        if self.server is None:
+            await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """停止监听，关闭活动连接和线程池"""
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        connections = list(self._connections.items())
+        for _, writer in connections:
+            writer.close()
+        if connections:
+            await asyncio.wait([task for task, _ in connections], timeout=self.keepalive_timeout)
+        self.executor.shutdown(wait=False)
+        for route_class in self.route_classes.values():
+            route_class.shutdown()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接上的全部请求"""
+        peer = writer.get_extra_info('peername')
+        client = peer[0] if peer else '-'
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        served = 0
+
+        try:
+            while True:
+                # 第一个请求之后的等待视为 keep-alive 空闲
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keepalive_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._send_error(writer, 431, "Request header fields too large")
+                    break
+
+                try:
+                    method, target, version, headers = parse_request_head(head[:-4])
+                    body = await self._read_body(reader, writer, headers)
+                except BadRequest as e:
+                    await self._send_error(writer, e.status, e.message)
+                    break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                served += 1
+                keep_alive = wants_keep_alive(version, headers)
+                if self.max_keepalive_requests and served >= self.max_keepalive_requests:
+                    keep_alive = False
+
+                url = urlparse(target)
+                route_class = self.route_classes.get(ROUTE_CLASSES.get(url.path))
+                if route_class is None:
+                    executor = self.executor
+                    response = await loop.run_in_executor(
+                        executor, dispatch, method, url.path, body, headers, url.query, client)
+                else:
+                    executor = route_class.executor or self.executor
+                    try:
+                        self.rate_limiter.check(client, route_class.name)
+                        if route_class.executor is None:
+                            response = dispatch(method, url.path, body, headers, url.query, client)
+                        else:
+                            response = await asyncio.wrap_future(route_class.submit(
+                                dispatch, method, url.path, body, headers, url.query, client))
+                    except Overloaded as e:
+                        response = overloaded_response(method, url.path, e, client)
+
+                if response.streaming:
+                    # HTTP/1.0 客户端不支持分块编码，以关闭连接表示响应结束
+                    chunked = version == 'HTTP/1.1'
+                    keep_alive = keep_alive and chunked
+                    if route_class is None:
+                        completed = await self._send_streaming_response(writer, response, keep_alive, chunked,
+                                                                        executor)
+                    else:
+                        # 生成响应体与处理请求一样占用本类的名额，直到输出结束
+                        with route_class.hold():
+                            completed = await self._send_streaming_response(writer, response, keep_alive,
+                                                                            chunked, executor)
+                    keep_alive = keep_alive and completed
+                else:
+                    await self._send_response(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logger.error(f"Error handling connection from {client}: {e}")
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_body(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                         headers: Dict[str, str]) -> Optional[bytes]:
+        """按 Content-Length 读取请求体"""
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise BadRequest(411, "Length required")
+
+        try:
+            content_length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise BadRequest(400, "Invalid Content-Length")
+        if content_length < 0:
+            raise BadRequest(400, "Invalid Content-Length")
+        if content_length > self.max_body_size:
+            raise BadRequest(413, "Request body too large")
+        if content_length == 0:
+            return None
+
+        if headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await writer.drain()
+        return await reader.readexactly(content_length)
+
+    def _response_head(self, response: Response, keep_alive: bool, length_header: str) -> bytes:
+        """生成响应行和响应头"""
+        lines = [
+            f"HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}",
+            f"Content-Type: {response.content_type}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in CORS_HEADERS)
+        lines.extend(f"{name}: {value}" for name, value in response.headers)
+        if length_header:
+            lines.append(length_header)
+        if keep_alive:
+            lines.append("Connection: keep-alive")
+            lines.append(f"Keep-Alive: timeout={int(self.keepalive_timeout)}")
+        else:
+            lines.append("Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+    async def _send_response(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        """写出响应行、响应头和响应体"""
+        payload = response.body
+        head = self._response_head(response, keep_alive, f"Content-Length: {len(payload) if payload else 0}")
+        writer.write(head + payload if payload else head)
+        await writer.drain()
+
+    async def _send_streaming_response(self, writer: asyncio.StreamWriter, response: Response,
+                                       keep_alive: bool, chunked: bool, executor: ThreadPoolExecutor) -> bool:
+        """逐块写出流式响应，每块在 executor 的线程中生成，写出后等待 drain 以适应客户端速度
+
+        返回 False 表示响应未能完整写出，连接需要关闭。
+        """
+        loop = asyncio.get_running_loop()
+        chunks = response.chunks
+        writer.write(self._response_head(response, keep_alive,
+                                         "Transfer-Encoding: chunked" if chunked else ""))
+        try:
+            while True:
+                chunk = await loop.run_in_executor(executor, next, chunks, None)
+                if chunk is None:
+                    break
+                if not chunk:
+                    continue
+                if chunked:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                else:
+                    writer.write(chunk)
+                await writer.drain()
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+            return True
+        except ConnectionError:
+            return False
+        except Exception as e:
+            # 响应头已发出，只能中断连接让客户端感知到响应不完整
+            logger.error(f"Error streaming response: {e}")
+            return False
+        finally:
+            try:
+                response.close()
+            except ValueError:
+                # 生成器仍在工作线程中执行（任务被取消），由其自行结束
+                pass
+
+    async def _send_error(self, writer: asyncio.StreamWriter, status_code: int, message: str):
+        """发送错误响应并关闭连接"""
+        try:
+            await self._send_response(writer, json_response({"error": message}, status_code), False)
+        except ConnectionError:
+            pass
\ No newline at end of file
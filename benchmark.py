@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+性能基准测试
+
+三组测试，结果以 JSON 输出，便于不同版本之间对比：
+
+- serialization: models.py 各模型的 JSON 编码耗时
+- push_loop: NatsPushService 一轮推送（更新最新值表、写历史、编码、发布）的吞吐，
+  使用进程内的假 NATS 客户端，无需 NATS 服务器，测点数可从 30 扩展到 100 万
+- http: 对各接口并发发送请求，统计每个接口的 p50/p99 延迟和每秒请求数；
+  默认在进程内启动服务并写入模拟数据，也可用 --url 压测已运行的服务
+
+用法：
+    python benchmark.py                               # 全部测试，结果输出到标准输出
+    python benchmark.py --suite push_loop --tags 30,1000,100000 --output result.json
+    python benchmark.py --suite http --mode async --concurrency 16 --duration 10
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import platform
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from datetime import datetime
+from http.server import HTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from models import ValueItem, DataItem, Result, HistoryResponse, Device
+from realtime_store import LatestValueStore, latest_values
+from history_store import HistoryStore, history_store
+
+DEFAULT_TAG_COUNTS = (30, 1000, 10000, 100000, 1000000)
+
+# 压测的接口：(名称, 方法, 路径, 请求体)
+HTTP_ROUTES = (
+    ("health", "GET", "/health", None),
+    ("find_last", "GET", "/api/find_last", {"projectID": "bench", "tag": "group1.dev1.p0"}),
+    ("find_last_device", "GET", "/api/find_last", {"projectID": "bench", "tag": "group1.dev1", "device": True}),
+    ("find_last_batch", "GET", "/api/find_last",
+     {"projectID": "bench", "tags": [f"group1.dev{j}.p0" for j in range(1, 11)]}),
+    ("query_history", "POST", "/api/query_history", {"projectID": "bench", "tag": ["group1.dev1.p0"]}),
+    ("query_points", "GET", "/api/query_points", {"projectID": "bench", "parentTag": "group1.dev1"}),
+    ("query_devices", "GET", "/api/query_devices", {"projectID": "bench"}),
+    ("set_value", "POST", "/api/set_value", {"projectID": "bench", "tag": "group1.dev1.p1", "value": 1}),
+)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序数据的分位数（最近秩法）"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(q * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def make_items(count: int, now: Optional[datetime] = None) -> List[ValueItem]:
+    """生成 count 个测点的一轮数据，标签按 group/dev/点 三级组织，每个设备 10 个点"""
+    now = now or datetime.now()
+    items = []
+    for n in range(count):
+        device, point = divmod(n, 10)
+        group, device = divmod(device, 10)
+        items.append(ValueItem(f"group{group + 1}.dev{device + 1}.p{point}", now, float(n), 1))
+    return items
+
+
+# ---------------------------------------------------------------- serialization
+
+def bench_serialization(number: int) -> List[Dict[str, Any]]:
+    """各模型 to_json 的单次耗时"""
+    now = datetime.now()
+    history = Result("group1.dev1.p0", [DataItem(float(i), now) for i in range(1000)])
+    cases = {
+        "ValueItem": ValueItem("group1.dev1.p0", now, 12.5, 1),
+        "DataItem": DataItem(12.5, now),
+        "Result[1000]": history,
+        "HistoryResponse[10x1000]": HistoryResponse([history] * 10),
+        "Device[3x3]": Device("group1", "group1",
+                              [Device(f"group1.dev{j}", f"dev{j}", [], True) for j in range(1, 4)]),
+    }
+    results = []
+    for name, model in cases.items():
+        loops = max(number // 1000, 10) if name.startswith(("Result", "HistoryResponse")) else number
+        elapsed = min(timeit.repeat(model.to_json, number=loops, repeat=3))
+        results.append({"model": name, "loops": loops, "us_per_op": elapsed / loops * 1e6})
+    return results
+
+
+# ---------------------------------------------------------------- push loop
+
+class FakeNats:
+    """进程内的假 NATS 客户端，只统计发布的消息数和字节数"""
+
+    is_connected = True
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.flushes = 0
+
+    async def publish(self, subject: str, payload: bytes):
+        self.messages += 1
+        self.bytes += len(payload)
+
+    async def flush(self, timeout: float = None):
+        self.flushes += 1
+
+
+def bench_push_loop(tag_counts: List[int], ticks: int, publish_mode: str) -> List[Dict[str, Any]]:
+    """对每个测点规模执行若干轮推送，统计单轮耗时和每秒处理的测点数"""
+    from nats_service import NatsPushService
+
+    results = []
+    for count in tag_counts:
+        service = NatsPushService(store=LatestValueStore(), history=HistoryStore(capacity=ticks),
+                                  publish_mode=publish_mode)
+        service.nc = fake = FakeNats()
+        items = make_items(count)
+
+        async def run() -> List[float]:
+            durations = []
+            for tick in range(ticks):
+                # 每轮时间戳递增，保证写入历史数据
+                now = datetime.fromtimestamp(1_700_000_000 + tick)
+                for item in items:
+                    item.timestamp = now
+                started = time.perf_counter()
+                await service.publish_tick(items)
+                durations.append(time.perf_counter() - started)
+            return durations
+
+        durations = sorted(asyncio.run(run()))
+        mean = sum(durations) / len(durations)
+        results.append({
+            "tags": count,
+            "ticks": ticks,
+            "publish_mode": publish_mode,
+            "tick_p50_ms": percentile(durations, 0.5) * 1000,
+            "tick_max_ms": durations[-1] * 1000,
+            "tags_per_sec": count / mean,
+            "messages": fake.messages,
+            "bytes": fake.bytes,
+            # 1 Hz 推送时一轮能否在周期内完成
+            "fits_1hz": durations[-1] < 1.0,
+        })
+    return results
+
+
+# ---------------------------------------------------------------- http
+
+def populate(tags: int, points: int):
+    """写入模拟的最新值和历史数据，供进程内服务压测"""
+    items = make_items(tags)
+    latest_values.update_many(items)
+    base = 1_700_000_000_000
+    for item in items:
+        for i in range(points):
+            history_store.append(item.tag, base + i * 1000, float(i))
+
+
+def start_server(mode: str) -> Tuple[str, callable]:
+    """在后台线程中启动 HTTP 服务（随机端口），返回 (地址, 停止函数)"""
+    if mode == "async":
+        from async_server import AsyncHTTPServer
+        server = AsyncHTTPServer("127.0.0.1", 0)
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(server.start())
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        port = server.server.sockets[0].getsockname()[1]
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+        return f"http://127.0.0.1:{port}", stop
+
+    from app import TopVRequestHandler
+    httpd = HTTPServer(("127.0.0.1", 0), TopVRequestHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_address[1]}", httpd.shutdown
+
+
+def _load_worker(host: str, port: int, method: str, path: str, body: Optional[bytes],
+                 deadline: float, latencies: List[float], errors: List[int]):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                # 404/400 等说明请求本身不对，同样计为错误，避免把错误响应的延迟当作接口性能
+                if response.status >= 400:
+                    errors[0] += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+                conn.close()
+                continue
+            latencies.append(time.perf_counter() - started)
+    finally:
+        conn.close()
+
+
+def bench_http(url: str, concurrency: int, duration: float) -> List[Dict[str, Any]]:
+    """逐个接口压测，每个接口 concurrency 个连接持续 duration 秒"""
+    parsed = urlparse(url)
+    results = []
+    for name, method, path, payload in HTTP_ROUTES:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        per_worker = [[] for _ in range(concurrency)]
+        errors = [[0] for _ in range(concurrency)]
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        workers = [threading.Thread(target=_load_worker,
+                                    args=(parsed.hostname, parsed.port, method, path, body,
+                                          deadline, per_worker[i], errors[i]))
+                   for i in range(concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for worker in per_worker for latency in worker)
+        results.append({
+            "route": name,
+            "method": method,
+            "path": path,
+            "requests": len(latencies),
+            "errors": sum(error[0] for error in errors),
+            "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        })
+    return results
+
+
+# ---------------------------------------------------------------- main
+
+def environment() -> Dict[str, Any]:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                  text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="TopV Adaptor Python benchmarks")
+    parser.add_argument("--suite", action="append", choices=("serialization", "push_loop", "http"),
+                        help="要运行的测试，可重复指定，默认全部")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--number", type=int, default=100000, help="serialization 单个模型的循环次数")
+    parser.add_argument("--tags", default=",".join(map(str, DEFAULT_TAG_COUNTS)),
+                        help="push_loop 的测点规模，逗号分隔")
+    parser.add_argument("--ticks", type=int, default=5, help="push_loop 每个规模的轮数")
+    parser.add_argument("--publish-mode", default="tag", help="push_loop 的发布模式")
+    parser.add_argument("--url", help="压测已运行的服务，默认在进程内启动")
+    parser.add_argument("--mode", default="async", choices=("sync", "async"), help="进程内服务的模式")
+    parser.add_argument("--concurrency", type=int, default=8, help="http 并发连接数")
+    parser.add_argument("--duration", type=float, default=5.0, help="http 每个接口的压测秒数")
+    parser.add_argument("--verbose", action="store_true", help="保留 INFO 日志（默认关闭，避免日志输出影响结果）")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    suites = args.suite or ["serialization", "push_loop", "http"]
+    report: Dict[str, Any] = {"environment": environment(), "results": {}}
+
+    if "serialization" in suites:
+        report["results"]["serialization"] = bench_serialization(args.number)
+
+    if "push_loop" in suites:
+        tag_counts = [int(n) for n in args.tags.split(",") if n.strip()]
+        report["results"]["push_loop"] = bench_push_loop(tag_counts, args.ticks, args.publish_mode)
+
+    if "http" in suites:
+        url, stop = args.url, None
+        if url is None:
+            populate(tags=300, points=600)
+            url, stop = start_server(args.mode)
+        try:
+            report["results"]["http"] = {
+                "url": url if args.url else f"in-process ({args.mode})",
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "routes": bench_http(url, args.concurrency, args.duration),
+            }
+        finally:
+            if stop is not None:
+                stop()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+测点目录
+
+推送循环要发布哪些测点、各自的发布周期由测点目录给出。目录可以从 JSON 文件加载：
+
+    {
+      "groups": [
+        {"name": "fast", "period": 0.5, "tags": ["line1.motor1.speed", ...]},
+        {"name": "slow", "period": 10, "deadband": 0.5, "maxSilence": 300,
+         "tags": ["line1.env.temp", {"tag": "line1.env.hum", "period": 60, "deadbandPercent": 1}]}
+      ]
+    }
+
+组的 period 省略时使用默认周期；单个测点也可以指定自己的 period。
+按变化发布的参数 deadband（绝对死区）、deadbandPercent（相对上次发布值的百分比死区）和
+maxSilence（最长静默秒数）同样可以在组或测点上设置，未设置的使用全局配置。
+未配置文件时按 组 × 设备 × 测点 生成，默认与原来的 3 × 10 个 groupN.devM.a 一致。
+加载后按周期归并为调度组，同一周期的测点在同一个调度任务中发布。
+"""
+
+import json
+import zlib
+from string import ascii_lowercase
+from typing import Dict, List, Optional
+import config
+
+# 测点的发布参数（JSON 中的键名）
+OPTION_KEYS = ('deadband', 'deadbandPercent', 'maxSilence')
+
+
+class ScheduleGroup:
+    """同一发布周期的一组测点
+
+    options 只记录设置了发布参数的测点：标签 -> {参数名: 值}，同一 JSON 组的测点共用一个字典。
+    """
+    __slots__ = ('name', 'period', 'tags', 'options')
+
+    def __init__(self, name: str, period: float, tags: List[str],
+                 options: Optional[Dict[str, Dict[str, float]]] = None):
+        self.name = name
+        self.period = period
+        self.tags = tags
+        self.options = options if options is not None else {}
+
+    def __repr__(self) -> str:
+        return f"ScheduleGroup({self.name!r}, period={self.period}, tags={len(self.tags)})"
+
+
+def point_name(index: int) -> str:
+    """生成测点名：前 26 个为 a-z，之后为 p26、p27 ..."""
+    return ascii_lowercase[index] if index < len(ascii_lowercase) else f"p{index}"
+
+
+def device_of(tag: str) -> str:
+    """测点所属设备标签（去掉最后一段）"""
+    return tag.rpartition('.')[0] or tag
+
+
+def shard_of(tag: str, shards: int) -> int:
+    """按设备分片，同一设备的测点总在同一分片，device 发布模式下不会被拆成多条消息"""
+    if shards <= 1:
+        return 0
+    return zlib.crc32(device_of(tag).encode('utf-8')) % shards
+
+
+def _options(entry: Dict, inherited: Optional[Dict[str, float]] = None) -> Optional[Dict[str, float]]:
+    """读取组或测点上的发布参数，测点上的设置覆盖组上的设置"""
+    own = {key: float(entry[key]) for key in OPTION_KEYS if key in entry}
+    for key, value in own.items():
+        if value < 0:
+            raise ValueError(f"Invalid {key}: {value}")
+    if not own:
+        return inherited
+    return {**inherited, **own} if inherited else own
+
+
+class TagCatalog:
+    def __init__(self, groups: List[ScheduleGroup]):
+        self.groups = groups
+
+    def __len__(self) -> int:
+        return sum(len(group.tags) for group in self.groups)
+
+    def tags(self) -> List[str]:
+        return [tag for group in self.groups for tag in group.tags]
+
+    @classmethod
+    def generate(cls, groups: int, devices: int, points: int, period: float) -> 'TagCatalog':
+        """按 group{i}.dev{j}.<测点> 生成目录"""
+        tags = [f"group{i + 1}.dev{j + 1}.{point_name(k)}"
+                for i in range(groups) for j in range(devices) for k in range(points)]
+        return cls([ScheduleGroup("default", period, tags)])
+
+    @classmethod
+    def from_dict(cls, data: Dict, default_period: float) -> 'TagCatalog':
+        """从 JSON 结构加载，按周期归并为调度组，组的顺序和测点顺序保持文件中的顺序"""
+        by_period: Dict[float, ScheduleGroup] = {}
+        for index, group in enumerate(data.get("groups", [])):
+            group_period = float(group.get("period", default_period))
+            name = group.get("name") or f"group{index + 1}"
+            group_options = _options(group)
+            for entry in group.get("tags", []):
+                if isinstance(entry, dict):
+                    tag = entry["tag"]
+                    period = float(entry.get("period", group_period))
+                    options = _options(entry, group_options)
+                else:
+                    tag, period, options = entry, group_period, group_options
+                if period <= 0:
+                    raise ValueError(f"Invalid period for {tag}: {period}")
+                schedule = by_period.get(period)
+                if schedule is None:
+                    schedule = by_period[period] = ScheduleGroup(name, period, [])
+                schedule.tags.append(tag)
+                if options:
+                    schedule.options[tag] = options
+        return cls(list(by_period.values()))
+
+    @classmethod
+    def load(cls, path: str, default_period: float) -> 'TagCatalog':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f), default_period)
+
+    def shard(self, index: int, shards: int) -> 'TagCatalog':
+        """返回第 index 个分片（共 shards 个）负责的子目录"""
+        if shards <= 1:
+            return self
+        # options 按标签查找，分片共用原字典即可
+        return TagCatalog([ScheduleGroup(group.name, group.period,
+                                         [tag for tag in group.tags if shard_of(tag, shards) == index],
+                                         group.options)
+                           for group in self.groups])
+
+
+def load_catalog(path: Optional[str] = None) -> TagCatalog:
+    """按配置加载测点目录：配置了文件时从文件加载，否则按规模参数生成"""
+    path = path if path is not None else config.CATALOG_FILE
+    if path:
+        return TagCatalog.load(path, config.PUSH_PERIOD)
+    return TagCatalog.generate(config.CATALOG_GROUPS, config.CATALOG_DEVICES,
+                               config.CATALOG_POINTS, config.PUSH_PERIOD)
\ No newline at end of file
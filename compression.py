@@ -0,0 +1,70 @@
+"""
+HTTP 响应压缩
+
+根据请求的 Accept-Encoding 协商 gzip 或 deflate。完整响应体小于阈值时不压缩；
+流式响应逐块压缩，每块后同步刷新，客户端可以边收边解压。
+"""
+
+import zlib
+from typing import Dict, Iterator, Optional
+
+# 同等 q 值时的优先顺序
+SUPPORTED_ENCODINGS = ('gzip', 'deflate')
+
+# zlib wbits：gzip 带 gzip 头，deflate 按 HTTP 规范为 zlib 格式
+_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+def parse_weights(header: Optional[str]) -> Dict[str, float]:
+    """解析 Accept / Accept-Encoding 这类带 q 值的列表头，返回 名称（小写）-> q 值，未写 q 值时为 1"""
+    weights = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    return weights
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """解析 Accept-Encoding，返回选中的编码，不接受任何支持的编码时返回 None"""
+    if not accept_encoding:
+        return None
+
+    weights = parse_weights(accept_encoding)
+    best = None
+    best_q = 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data: bytes, encoding: str, level: int = 6) -> bytes:
+    """一次性压缩完整响应体"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_chunks(chunks: Iterator[bytes], encoding: str, level: int = 6) -> Iterator[bytes]:
+    """逐块压缩流式响应"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""
+运行配置
+
+所有配置项均可通过同名环境变量覆盖，未设置时使用默认值。
+"""
+
+import os
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# HTTP 服务
+HTTP_HOST = _env_str("TOPV_HTTP_HOST", "")
+HTTP_PORT = _env_int("TOPV_HTTP_PORT", 8080)
+# 服务模式：sync 为单线程 http.server，async 为基于 asyncio 的并发服务（支持 keep-alive）
+HTTP_MODE = _env_str("TOPV_HTTP_MODE", "sync")
+# async 模式下执行 API 处理函数的工作线程数
+HTTP_WORKERS = _env_int("TOPV_HTTP_WORKERS", 32)
+# keep-alive 连接的空闲超时（秒）
+HTTP_KEEPALIVE_TIMEOUT = _env_float("TOPV_HTTP_KEEPALIVE_TIMEOUT", 15.0)
+# 单个连接上允许处理的最大请求数，0 表示不限制
+HTTP_KEEPALIVE_MAX_REQUESTS = _env_int("TOPV_HTTP_KEEPALIVE_MAX_REQUESTS", 0)
+# 请求体最大字节数
+HTTP_MAX_BODY_SIZE = _env_int("TOPV_HTTP_MAX_BODY_SIZE", 16 * 1024 * 1024)
+# 历史查询默认使用流式响应（也可通过 ?stream=1 或 Accept: application/x-ndjson 按请求开启）
+HTTP_STREAM_HISTORY = _env_bool("TOPV_HTTP_STREAM_HISTORY", False)
+# 流式响应每个分块的目标字节数
+HTTP_STREAM_CHUNK_SIZE = _env_int("TOPV_HTTP_STREAM_CHUNK_SIZE", 64 * 1024)
+# 按 Accept-Encoding 协商 gzip/deflate 压缩响应
+HTTP_COMPRESSION = _env_bool("TOPV_HTTP_COMPRESSION", True)
+# 压缩级别 1-9
+HTTP_COMPRESSION_LEVEL = _env_int("TOPV_HTTP_COMPRESSION_LEVEL", 6)
+# 小于该字节数的完整响应不压缩（流式响应总是压缩）
+HTTP_COMPRESSION_MIN_SIZE = _env_int("TOPV_HTTP_COMPRESSION_MIN_SIZE", 1024)
+# 准入控制（async 模式）：每类接口独立的工作线程数、排队上限和最长排队时间（秒），
+# 排队已满或等待超过最长排队时间的请求直接返回 503（见 admission.py）；
+# 线程数为 0 时直接在事件循环中执行，不受排队上限和最长排队时间限制，只适合单测点的 find_last
+HTTP_REALTIME_WORKERS = _env_int("TOPV_HTTP_REALTIME_WORKERS", 2)
+HTTP_REALTIME_QUEUE = _env_int("TOPV_HTTP_REALTIME_QUEUE", 1000)
+HTTP_REALTIME_MAX_WAIT = _env_float("TOPV_HTTP_REALTIME_MAX_WAIT", 0.1)
+HTTP_WRITE_WORKERS = _env_int("TOPV_HTTP_WRITE_WORKERS", 4)
+HTTP_WRITE_QUEUE = _env_int("TOPV_HTTP_WRITE_QUEUE", 1000)
+HTTP_WRITE_MAX_WAIT = _env_float("TOPV_HTTP_WRITE_MAX_WAIT", 1.0)
+HTTP_HISTORY_WORKERS = _env_int("TOPV_HTTP_HISTORY_WORKERS", 2)
+HTTP_HISTORY_QUEUE = _env_int("TOPV_HTTP_HISTORY_QUEUE", 16)
+HTTP_HISTORY_MAX_WAIT = _env_float("TOPV_HTTP_HISTORY_MAX_WAIT", 5.0)
+HTTP_CATALOG_WORKERS = _env_int("TOPV_HTTP_CATALOG_WORKERS", 2)
+HTTP_CATALOG_QUEUE = _env_int("TOPV_HTTP_CATALOG_QUEUE", 64)
+HTTP_CATALOG_MAX_WAIT = _env_float("TOPV_HTTP_CATALOG_MAX_WAIT", 2.0)
+# async 模式下 Python 线程切换间隔（秒），0 表示不修改（Python 默认 0.005）。这是进程级设置，影响进程内所有线程：
+# 调小后历史查询等计算密集的线程更频繁地让出 GIL，实时查询的尾延迟更低，代价是线程切换更多、
+# 计算密集任务的总吞吐下降。需要时显式开启，例如 0.001
+HTTP_SWITCH_INTERVAL = _env_float("TOPV_HTTP_SWITCH_INTERVAL", 0.0)
+# 每个客户端（按 IP）每秒允许的请求数，0 表示不限速；超出时返回 429
+HTTP_RATE_LIMIT = _env_float("TOPV_HTTP_RATE_LIMIT", 0.0)
+# 限速的突发容量（请求数），0 表示取每秒请求数的 2 倍
+HTTP_RATE_BURST = _env_int("TOPV_HTTP_RATE_BURST", 0)
+
+# 日志级别
+LOG_LEVEL = _env_str("TOPV_LOG_LEVEL", "INFO")
+# 日志格式：text 或 json（每条一行 JSON，访问记录附带各字段）
+LOG_FORMAT = _env_str("TOPV_LOG_FORMAT", "text")
+# 日志经有界队列由后台线程写出，请求线程不等待输出（见 access_log.py）
+LOG_QUEUE = _env_bool("TOPV_LOG_QUEUE", True)
+# 日志队列容量（条），满时丢弃
+LOG_QUEUE_SIZE = _env_int("TOPV_LOG_QUEUE_SIZE", 10000)
+# 每个 HTTP 请求结束时写一条访问记录
+LOG_ACCESS = _env_bool("TOPV_LOG_ACCESS", True)
+# 成功请求的访问记录抽样比例（0-1），4xx/5xx 总是记录
+LOG_ACCESS_SAMPLE = _env_float("TOPV_LOG_ACCESS_SAMPLE", 1.0)
+# 处理函数明细日志每个调用位置每秒最多输出的条数，0 表示不限制
+LOG_DETAIL_RATE = _env_float("TOPV_LOG_DETAIL_RATE", 10.0)
+
+# 历史数据：每个测点在内存中保留的最大点数（1 Hz 数据默认保留 1 小时）
+HISTORY_RETENTION = _env_int("TOPV_HISTORY_RETENTION", 3600)
+# 历史数据持久化目录，为空时不落盘
+HISTORY_DATA_DIR = _env_str("TOPV_HISTORY_DATA_DIR", "")
+# 段文件时间窗口（毫秒），每个测点每个窗口一个文件
+HISTORY_SEGMENT_WINDOW = _env_int("TOPV_HISTORY_SEGMENT_WINDOW", 3600 * 1000)
+# 缓冲数据写入段文件的间隔（秒）
+HISTORY_FLUSH_INTERVAL = _env_float("TOPV_HISTORY_FLUSH_INTERVAL", 1.0)
+# 每个数据目录同时保持打开的段文件数上限，超过时关闭最久未写的文件
+HISTORY_MAX_OPEN_FILES = _env_int("TOPV_HISTORY_MAX_OPEN_FILES", 1024)
+# 历史查询结果缓存的内存上限（字节），0 表示不缓存
+HISTORY_CACHE_SIZE = _env_int("TOPV_HISTORY_CACHE_SIZE", 64 * 1024 * 1024)
+# 时间窗口延伸到当前的结果最多缓存多少秒（即使没有观察到新数据，例如数据由其他进程写入）
+HISTORY_CACHE_OPEN_TTL = _env_float("TOPV_HISTORY_CACHE_OPEN_TTL", 1.0)
+# 结束时间早于当前时间该秒数的窗口视为已封闭，之后不再失效
+HISTORY_CACHE_SETTLE = _env_float("TOPV_HISTORY_CACHE_SETTLE", 5.0)
+# 多测点历史查询的线程数，不大于 1 时在请求线程中逐个查询
+HISTORY_QUERY_WORKERS = _env_int("TOPV_HISTORY_QUERY_WORKERS", min(os.cpu_count() or 1, 8))
+# 单个请求同时查询的测点数上限，0 表示与线程数相同
+HISTORY_QUERY_PARALLELISM = _env_int("TOPV_HISTORY_QUERY_PARALLELISM", 0)
+
+# NATS
+NATS_URL = _env_str("TOPV_NATS_URL", "nats://127.0.0.1:4222")
+# 实时数据主题前缀，测点主题为 <前缀>.<标签>
+NATS_SUBJECT_PREFIX = _env_str("TOPV_NATS_SUBJECT_PREFIX", "rtdb.iotopo")
+# 发布模式：tag 每个测点一条消息；device 每个设备一条（<前缀>.device.<设备>）；tick 每轮一条（<前缀>.tick）
+NATS_PUBLISH_MODE = _env_str("TOPV_NATS_PUBLISH_MODE", "tag")
+# 每轮推送后 flush 的超时（秒）
+NATS_FLUSH_TIMEOUT = _env_float("TOPV_NATS_FLUSH_TIMEOUT", 5.0)
+# 实时数据消息格式：json 或 msgpack（紧凑的二进制格式，时间为毫秒时间戳）
+NATS_PAYLOAD_FORMAT = _env_str("TOPV_NATS_PAYLOAD_FORMAT", "json")
+# 按变化发布：只发布变化超过死区、质量码变化或超过最长静默时间的测点；默认关闭，每轮发布全部测点，
+# 开启后订阅方不再每轮收到不变的值，需按心跳（最长静默时间）判断数据源是否在线
+NATS_REPORT_BY_EXCEPTION = _env_bool("TOPV_NATS_REPORT_BY_EXCEPTION", False)
+# 默认绝对死区，0 表示任何变化都发布
+NATS_DEADBAND = _env_float("TOPV_NATS_DEADBAND", 0.0)
+# 默认百分比死区（相对上次发布的值）
+NATS_DEADBAND_PERCENT = _env_float("TOPV_NATS_DEADBAND_PERCENT", 0.0)
+# 值不变时最长多少秒重新发布一次（心跳），0 表示不发心跳
+NATS_MAX_SILENCE = _env_float("TOPV_NATS_MAX_SILENCE", 60.0)
+# 连接失败后的重试间隔（秒），首次连接失败时按指数退避增长到 NATS_RECONNECT_MAX_WAIT
+NATS_RECONNECT_WAIT = _env_float("TOPV_NATS_RECONNECT_WAIT", 1.0)
+NATS_RECONNECT_MAX_WAIT = _env_float("TOPV_NATS_RECONNECT_MAX_WAIT", 30.0)
+# 断线期间缓存的测点值个数上限
+NATS_BUFFER_SIZE = _env_int("TOPV_NATS_BUFFER_SIZE", 100000)
+# 缓冲区满时的策略：drop_oldest、drop_newest、latest（每个测点只保留最新值）
+NATS_BUFFER_POLICY = _env_str("TOPV_NATS_BUFFER_POLICY", "drop_oldest")
+# 重新连上后每批重放的测点值个数
+NATS_REPLAY_BATCH_SIZE = _env_int("TOPV_NATS_REPLAY_BATCH_SIZE", 5000)
+# NATS 请求-应答接口：订阅 <前缀>.<操作>，与 HTTP 查询接口共用处理函数；
+# 前缀不能落在实时数据主题之下，否则订阅实时数据的客户端（如 rtdb.iotopo.>）也会收到请求
+NATS_REQUESTS = _env_bool("TOPV_NATS_REQUESTS", True)
+NATS_REQUEST_PREFIX = _env_str("TOPV_NATS_REQUEST_PREFIX", "topv.adaptor.req")
+# 队列组：多个实例订阅同一个队列组，每个请求只由其中一个实例处理
+NATS_REQUEST_QUEUE = _env_str("TOPV_NATS_REQUEST_QUEUE", "topv-adaptor")
+# 处理请求的线程数
+NATS_REQUEST_WORKERS = _env_int("TOPV_NATS_REQUEST_WORKERS", 4)
+# 应答超过该字节数时分块发送（不超过服务器的 max_payload）
+NATS_REPLY_CHUNK_SIZE = _env_int("TOPV_NATS_REPLY_CHUNK_SIZE", 512 * 1024)
+
+# 写值流水线：待写测点数上限，超过时 set_value 返回 503
+WRITE_QUEUE_SIZE = _env_int("TOPV_WRITE_QUEUE_SIZE", 10000)
+# 合并同一测点写入的刷新窗口（秒）
+WRITE_FLUSH_INTERVAL = _env_float("TOPV_WRITE_FLUSH_INTERVAL", 0.05)
+# 每批下发给 sink 的最大写入数
+WRITE_BATCH_SIZE = _env_int("TOPV_WRITE_BATCH_SIZE", 1000)
+# 默认等待写入真正完成后再响应（也可按请求用 "ack": true 开启）
+WRITE_ACK = _env_bool("TOPV_WRITE_ACK", False)
+# 等待写入完成的超时（秒）
+WRITE_ACK_TIMEOUT = _env_float("TOPV_WRITE_ACK_TIMEOUT", 5.0)
+
+# 多进程模式：HTTP 工作进程数，大于 1 时各进程通过 SO_REUSEPORT 共同监听端口，
+# 另有一个进程负责 NATS 推送，最新值表放在共享内存中（仅支持 Linux 等提供 fork 的系统）
+HTTP_PROCESSES = _env_int("TOPV_HTTP_PROCESSES", 1)
+# 共享内存最新值表可容纳的测点数
+SHARED_VALUES_CAPACITY = _env_int("TOPV_SHARED_VALUES_CAPACITY", 200000)
+
+# 测点目录文件（JSON），为空时按下面的规模参数生成 group{i}.dev{j}.<测点>
+CATALOG_FILE = _env_str("TOPV_CATALOG_FILE", "")
+CATALOG_GROUPS = _env_int("TOPV_CATALOG_GROUPS", 3)
+CATALOG_DEVICES = _env_int("TOPV_CATALOG_DEVICES", 10)
+CATALOG_POINTS = _env_int("TOPV_CATALOG_POINTS", 1)
+# 多项目配置文件（JSON），为空时只有一个使用全局配置的默认项目（见 projects.py）
+PROJECTS_FILE = _env_str("TOPV_PROJECTS_FILE", "")
+# 检查测点目录文件是否变化的间隔（秒），变化后重建 query_devices / query_points 的设备树
+CATALOG_RELOAD_INTERVAL = _env_float("TOPV_CATALOG_RELOAD_INTERVAL", 5.0)
+# 默认发布周期（秒）
+PUSH_PERIOD = _env_float("TOPV_PUSH_PERIOD", 1.0)
+# 多进程模式下运行推送循环的进程数，测点按设备分片，单个进程一轮发布不完时增加
+NATS_SHARDS = _env_int("TOPV_NATS_SHARDS", 1)
\ No newline at end of file
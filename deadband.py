@@ -0,0 +1,148 @@
+"""
+按变化发布（report by exception）
+
+推送循环每轮生成一个调度组全部测点的数据，DeadbandFilter 从中挑出需要发布的测点：
+
+- 值与上次发布的值之差超过死区：死区取绝对死区 deadband 与 上次发布值 × deadbandPercent% 中较大者，
+  两者都为 0 时任何变化都发布，值不变则不发布
+- 质量码变化：总是发布
+- 距上次发布超过 maxSilence 秒：即使不变也重新发布一次（心跳），0 表示不发心跳
+
+过滤器的状态按调度组的测点顺序存放在数组中，安装了 NumPy 时整轮数据一次向量化比较；
+否则退回纯 Python 实现，结果一致。无法转换为数值的数据（None、普通字符串等）按是否相等判断变化；
+质量码不是整数（或超出 int64 范围）时同样退回纯 Python 实现，按是否相等判断。
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Sequence
+from models import ValueItem
+import config
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 未安装 NumPy 时使用纯 Python 实现
+    np = None
+
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _as_float(value: Any) -> Optional[float]:
+    """按 NumPy 的规则转换为 float，无法转换时返回 None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DeadbandFilter:
+    """一个调度组的按变化发布过滤器，select 的输入须与 tags 顺序一致"""
+
+    def __init__(self, tags: Sequence[str], options: Optional[Dict[str, Dict[str, float]]] = None,
+                 deadband: float = config.NATS_DEADBAND, percent: float = config.NATS_DEADBAND_PERCENT,
+                 max_silence: float = config.NATS_MAX_SILENCE):
+        n = len(tags)
+        absolute = [deadband] * n
+        relative = [percent / 100] * n
+        silence = [max_silence] * n
+        for i, tag in enumerate(tags):
+            tag_options = options.get(tag) if options else None
+            if tag_options:
+                absolute[i] = tag_options.get('deadband', deadband)
+                relative[i] = tag_options.get('deadbandPercent', percent) / 100
+                silence[i] = tag_options.get('maxSilence', max_silence)
+        # 不发心跳即静默时间无限长
+        silence = [s if s > 0 else math.inf for s in silence]
+
+        self.size = n
+        # 非数值测点上次发布的值：下标 -> 值
+        self._objects: Dict[int, Any] = {}
+        # 上次发布的质量码不是 int64 整数的测点：下标 -> 质量码
+        self._other_qualities: Dict[int, Any] = {}
+        if np is not None:
+            self.absolute = np.array(absolute, dtype=np.float64)
+            self.relative = np.array(relative, dtype=np.float64)
+            self.silence = np.array(silence, dtype=np.float64)
+            # 上次发布的值、质量码和时间；从未发布过的测点时间为 -inf，第一轮一定发布
+            self.values = np.full(n, np.nan)
+            self.qualities = np.full(n, -1, dtype=np.int64)
+            self.sent = np.full(n, -np.inf)
+        else:
+            self.absolute = absolute
+            self.relative = relative
+            self.silence = silence
+            self.values = [math.nan] * n
+            self.qualities = [-1] * n
+            self.sent = [-math.inf] * n
+
+    def select(self, items: Sequence[ValueItem], now: float) -> List[ValueItem]:
+        """返回本轮需要发布的测点，并把它们记为已发布；now 为单调时钟秒数"""
+        if len(items) != self.size:
+            raise ValueError(f"Expected {self.size} items, got {len(items)}")
+        if np is not None:
+            try:
+                values = np.fromiter([item.value for item in items], dtype=np.float64, count=self.size)
+            except (TypeError, ValueError):
+                # 本轮含非数值数据，逐个比较
+                return self._select_python(items, now)
+            qualities = np.array([item.quality for item in items])
+            if qualities.dtype.kind != 'i' or self._objects or self._other_qualities:
+                # 质量码不全是整数，或此前发布过非数值的值、质量码，需要逐个比较
+                return self._select_python(items, now)
+            return self._select_numpy(items, values, qualities.astype(np.int64, copy=False), now)
+        return self._select_python(items, now)
+
+    def _select_numpy(self, items: Sequence[ValueItem], values, qualities, now: float) -> List[ValueItem]:
+        last = self.values
+        band = np.maximum(self.absolute, self.relative * np.abs(last))
+        with np.errstate(invalid='ignore'):
+            publish = np.abs(values - last) > band
+        publish |= np.isnan(values) != np.isnan(last)
+        publish |= qualities != self.qualities
+        publish |= (now - self.sent) >= self.silence
+
+        indices = np.flatnonzero(publish)
+        if len(indices) == self.size:
+            self.values = values
+            self.qualities = qualities
+            self.sent.fill(now)
+            return list(items)
+        last[indices] = values[indices]
+        self.qualities[indices] = qualities[indices]
+        self.sent[indices] = now
+        return [items[i] for i in indices.tolist()]
+
+    def _select_python(self, items: Sequence[ValueItem], now: float) -> List[ValueItem]:
+        selected = []
+        objects = self._objects
+        other_qualities = self._other_qualities
+        for i, item in enumerate(items):
+            value = _as_float(item.value)
+            last = float(self.values[i])
+            if value is None or i in objects:
+                # 非数值数据，或上次发布的是非数值
+                changed = i not in objects or objects[i] != item.value
+            elif math.isnan(value) or math.isnan(last):
+                changed = math.isnan(value) != math.isnan(last)
+            else:
+                band = max(float(self.absolute[i]), float(self.relative[i]) * abs(last))
+                changed = abs(value - last) > band
+            quality = item.quality
+            last_quality = other_qualities[i] if i in other_qualities else self.qualities[i]
+            if not (changed or quality != last_quality or now - self.sent[i] >= self.silence[i]):
+                continue
+            if value is None:
+                objects[i] = item.value
+                self.values[i] = math.nan
+            else:
+                objects.pop(i, None)
+                self.values[i] = value
+            if type(quality) is int and _INT64_MIN <= quality <= _INT64_MAX:
+                other_qualities.pop(i, None)
+                self.qualities[i] = quality
+            else:
+                other_qualities[i] = quality
+            self.sent[i] = now
+            selected.append(item)
+        return selected
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+设备/测点树
+
+query_devices 和 query_points 的数据来自测点目录：标签去掉最后一段为设备，设备标签的每个前缀为上级节点，
+直接挂有测点的节点 isDevice 为 true。
+
+树在目录变化时才重建为一个不可变的快照，各请求共用；同一参数的编码结果缓存在快照中并带有 ETag，
+重复请求直接返回缓存的字节（客户端带 If-None-Match 时返回 304）。配置了目录文件时，
+每隔 CATALOG_RELOAD_INTERVAL 秒检查一次文件的修改时间，变化后重新加载。
+
+两个接口都支持分页：limit 为每页条数，cursor 为上一页返回的 nextCursor（即上一页最后一个节点的标签）；
+query_devices 另支持 parentTag（从该节点的子节点开始）和 depth（展开的层数）。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from catalog import TagCatalog, load_catalog
+from models import CachedJson, Device, Page, TagPoint, dumps
+import config
+
+logger = logging.getLogger(__name__)
+
+# 每个快照缓存的编码结果个数
+RESPONSE_CACHE_SIZE = 256
+
+
+class TreeSnapshot:
+    """某一版本测点目录对应的设备树，构建后不再修改"""
+
+    def __init__(self, tags: List[str]):
+        self.roots: List[Device] = []
+        self.nodes: Dict[str, Device] = {}
+        self.points: Dict[str, List[TagPoint]] = {}
+        for tag in tags:
+            device, _, name = tag.rpartition('.')
+            if not device:
+                continue
+            points = self.points.get(device)
+            if points is None:
+                points = self.points[device] = []
+                self._node(device).is_device = True
+            points.append(TagPoint(tag, name))
+        self._positions: Dict[Optional[str], Dict[str, int]] = {}
+        self._responses: 'OrderedDict[Tuple, CachedJson]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _node(self, tag: str) -> Device:
+        """返回节点，不存在时连同上级节点一起创建"""
+        node = self.nodes.get(tag)
+        if node is not None:
+            return node
+        parent_tag, _, name = tag.rpartition('.')
+        node = self.nodes[tag] = Device(tag, name, [], False)
+        if parent_tag:
+            node.parent_tag = parent_tag
+            self._node(parent_tag).children.append(node)
+        else:
+            self.roots.append(node)
+        return node
+
+    def children(self, parent_tag: Optional[str]) -> List[Device]:
+        if not parent_tag:
+            return self.roots
+        node = self.nodes.get(parent_tag)
+        return node.children if node is not None else []
+
+    def _page(self, key: Optional[str], items: List, tags: List[str], cursor: Optional[str],
+              limit: Optional[int]) -> Tuple[List, Optional[str]]:
+        """按游标（上一页最后一项的标签）取一页，返回 (本页, 下一页游标)"""
+        start = 0
+        if cursor:
+            positions = self._positions.get(key)
+            if positions is None:
+                positions = self._positions[key] = {tag: i for i, tag in enumerate(tags)}
+            position = positions.get(cursor)
+            if position is None:
+                raise ValueError(f"Invalid cursor: {cursor}")
+            start = position + 1
+        if limit is None:
+            return items[start:], None
+        end = start + limit
+        return items[start:end], (tags[end - 1] if end < len(items) else None)
+
+    def devices(self, parent_tag: Optional[str], depth: Optional[int], cursor: Optional[str],
+                limit: Optional[int]) -> CachedJson:
+        key = ('devices', parent_tag, depth, cursor, limit)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        nodes = self.children(parent_tag)
+        page, next_cursor = self._page(parent_tag, nodes, [node.tag for node in nodes], cursor, limit)
+        if depth is not None:
+            page = [_expand(node, depth) for node in page]
+        return self._store(key, page if limit is None else Page(page, next_cursor))
+
+    def point_list(self, parent_tag: str, cursor: Optional[str], limit: Optional[int]) -> CachedJson:
+        key = ('points', parent_tag, cursor, limit)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        points = self.points.get(parent_tag, [])
+        page, next_cursor = self._page(('points', parent_tag), points, [point.tag for point in points],
+                                       cursor, limit)
+        return self._store(key, page if limit is None else Page(page, next_cursor))
+
+    def _cached(self, key: Tuple) -> Optional[CachedJson]:
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is not None:
+                self._responses.move_to_end(key)
+            return cached
+
+    def _store(self, key: Tuple, data) -> CachedJson:
+        cached = CachedJson(dumps(data, ensure_ascii=False).encode('utf-8'))
+        with self._lock:
+            self._responses[key] = cached
+            if len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        return cached
+
+
+def _expand(node: Device, depth: int) -> Device:
+    """只保留 depth 层的副本，未展开的节点标记 hasChildren"""
+    if depth <= 1:
+        return Device(node.tag, node.name, [], node.is_device, bool(node.children))
+    return Device(node.tag, node.name, [_expand(child, depth - 1) for child in node.children],
+                  node.is_device)
+
+
+class DeviceTree:
+    """持有当前快照，测点目录变化时重建
+
+    给定 catalog 时直接使用；否则按配置加载，配置了目录文件时检查文件是否变化。
+    """
+
+    def __init__(self, catalog: Optional[TagCatalog] = None, path: Optional[str] = None,
+                 reload_interval: float = config.CATALOG_RELOAD_INTERVAL):
+        self.catalog = catalog
+        self.path = path if path is not None else config.CATALOG_FILE
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._snapshot: Optional[TreeSnapshot] = None
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked = 0.0
+
+    def set_catalog(self, catalog: TagCatalog):
+        """替换测点目录，下次查询时重建快照"""
+        with self._lock:
+            self.catalog = catalog
+            self._snapshot = None
+
+    def snapshot(self) -> TreeSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and not self._file_changed():
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._snapshot is snapshot:
+                self._rebuild()
+            return self._snapshot
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _file_changed(self) -> bool:
+        """每隔 reload_interval 秒比较一次目录文件的修改时间和大小"""
+        if self.catalog is not None or not self.path:
+            return False
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return False
+        self._checked = now
+        return self._file_signature() != self._signature
+
+    def _rebuild(self):
+        started = time.perf_counter()
+        catalog = self.catalog
+        if catalog is None:
+            if self.path:
+                self._signature = self._file_signature()
+                self._checked = time.monotonic()
+            try:
+                catalog = load_catalog(self.path)
+            except (OSError, ValueError) as e:
+                if self._snapshot is None:
+                    raise
+                # 文件正在编辑等原因加载失败时继续使用旧快照，文件再次变化时重试
+                logger.error(f"Failed to reload catalog {self.path}: {e}")
+                return
+        self._snapshot = TreeSnapshot(catalog.tags())
+        logger.info(f"Built device tree: {len(self._snapshot.nodes)} nodes, {len(catalog)} points "
+                    f"in {time.perf_counter() - started:.3f}s")
+
+
+# 进程内共享的设备树
+device_tree = DeviceTree()
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+历史数据降采样
+
+按固定时间间隔分桶，一次性计算每个桶的 avg/min/max/first/last/count。
+安装了 NumPy 时使用 reduceat 向量化计算；否则退回纯 Python 实现，结果一致。
+"""
+
+import re
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 未安装 NumPy 时使用纯 Python 实现
+    np = None
+
+AGGREGATES = ('avg', 'min', 'max', 'first', 'last', 'count')
+
+_UNITS = {'ms': 1, 's': 1000, 'm': 60 * 1000, 'h': 3600 * 1000, 'd': 24 * 3600 * 1000}
+_INTERVAL_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h|d)?\s*$')
+
+
+def parse_interval(value: Any) -> Optional[int]:
+    """将 interval 参数转换为毫秒
+
+    支持毫秒数（数字或数字字符串）以及带单位的字符串，如 500ms、10s、5m、1h、1d。
+    None、空字符串和 0 表示不降采样。
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid interval: {value}")
+    if isinstance(value, (int, float)):
+        ms = int(value)
+    else:
+        match = _INTERVAL_RE.match(str(value))
+        if not match:
+            raise ValueError(f"Invalid interval: {value}")
+        ms = int(float(match.group(1)) * _UNITS[match.group(2) or 'ms'])
+    if ms < 0:
+        raise ValueError(f"Invalid interval: {value}")
+    return ms or None
+
+
+def downsample(times: Sequence[int], values: Sequence[float], interval_ms: int,
+               origin_ms: Optional[int] = None) -> Dict[str, List]:
+    """按 interval_ms 对升序时间序列分桶聚合
+
+    桶边界以 origin_ms 对齐（默认对齐到 Unix 纪元）。返回的字典包含 time（桶起始时间）
+    以及 AGGREGATES 中的每一列，均为 Python 列表，可直接序列化。
+    """
+    origin = origin_ms or 0
+    if len(times) == 0:
+        return {name: [] for name in ('time',) + AGGREGATES}
+    if np is not None:
+        return _downsample_numpy(times, values, interval_ms, origin)
+    return _downsample_python(times, values, interval_ms, origin)
+
+
+def _downsample_numpy(times, values, interval_ms: int, origin: int) -> Dict[str, List]:
+    t = np.asarray(times, dtype=np.int64)
+    v = np.asarray(values, dtype=np.float64)
+    buckets = (t - origin) // interval_ms
+
+    # 输入已按时间升序，桶号变化的位置即为分组边界
+    edges = np.flatnonzero(buckets[1:] != buckets[:-1]) + 1
+    starts = np.concatenate((np.zeros(1, dtype=np.intp), edges))
+    ends = np.concatenate((edges, np.array([len(t)], dtype=np.intp)))
+    counts = ends - starts
+
+    sums = np.add.reduceat(v, starts)
+    return {
+        'time': (buckets[starts] * interval_ms + origin).tolist(),
+        'avg': (sums / counts).tolist(),
+        'min': np.minimum.reduceat(v, starts).tolist(),
+        'max': np.maximum.reduceat(v, starts).tolist(),
+        'first': v[starts].tolist(),
+        'last': v[ends - 1].tolist(),
+        'count': counts.tolist(),
+    }
+
+
+def _downsample_python(times, values, interval_ms: int, origin: int) -> Dict[str, List]:
+    result = {name: [] for name in ('time',) + AGGREGATES}
+    points = zip(times, values)
+    for bucket, group in groupby(points, key=lambda p: (p[0] - origin) // interval_ms):
+        group_values = [value for _, value in group]
+        result['time'].append(bucket * interval_ms + origin)
+        result['avg'].append(sum(group_values) / len(group_values))
+        result['min'].append(min(group_values))
+        result['max'].append(max(group_values))
+        result['first'].append(group_values[0])
+        result['last'].append(group_values[-1])
+        result['count'].append(len(group_values))
+    return result
\ No newline at end of file
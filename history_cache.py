@@ -0,0 +1,133 @@
+"""
+历史查询结果缓存
+
+大屏常由多个浏览器在同一时刻发出相同的 query_history 请求。结果按测点缓存编码后的 JSON（str）或 MessagePack（bytes），
+键为规范化的查询参数 (标签, 起止毫秒时间戳, 降采样间隔, 聚合方式, offset, limit, 顺序)，
+时间写法不同（ISO 8601 / 毫秒时间戳）或测点顺序不同的请求也能共用；缓存按 LRU 淘汰，
+编码后的总字节数不超过 HISTORY_CACHE_SIZE。
+
+- 同一键的查询正在计算时，后到的请求等待并共用其结果，不重复计算
+- 已封闭的窗口（结束时间早于测点最后一个点，或早于当前时间 HISTORY_CACHE_SETTLE 秒）
+  不会再有新数据落入，一直缓存到被淘汰
+- 延伸到当前的窗口（未给出 end 或 end 不早于最后一个点）在测点写入新数据后失效，
+  另外最多缓存 HISTORY_CACHE_OPEN_TTL 秒，覆盖数据由其他进程写入段文件的情况
+
+只有内存环形缓冲区时，已封闭窗口中后来被挤出内存的旧数据仍会留在缓存中，直到条目被淘汰。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Union
+from metrics import Counter, Gauge
+import config
+
+LOOKUPS = Counter('history_cache_lookups_total', 'Per-tag query_history cache lookups by result.', ('result',))
+CACHE_BYTES = Gauge('history_cache_bytes', 'Size of the encoded query_history results held in the cache.')
+
+
+def _encoded_size(text: Union[str, bytes]) -> int:
+    """结果编码后的字节数（str 按 UTF-8），ASCII 文本不需要另行编码"""
+    if isinstance(text, bytes) or text.isascii():
+        return len(text)
+    return len(text.encode('utf-8'))
+
+
+class _Entry:
+    __slots__ = ('text', 'size', 'closed', 'watermark', 'created')
+
+    def __init__(self, text: Union[str, bytes], closed: bool, watermark: Any, created: float):
+        self.text = text
+        self.size = _encoded_size(text)
+        self.closed = closed
+        self.watermark = watermark
+        self.created = created
+
+
+class HistoryCache:
+    """线程安全的 LRU 缓存，值为单个测点编码后的结果"""
+
+    def __init__(self, max_bytes: int = config.HISTORY_CACHE_SIZE,
+                 open_ttl: float = config.HISTORY_CACHE_OPEN_TTL, settle: float = config.HISTORY_CACHE_SETTLE):
+        self.max_bytes = max(max_bytes, 0)
+        self.open_ttl = open_ttl
+        self.settle = settle
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._pending: Dict[Hashable, Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+        CACHE_BYTES.set(0)
+
+    def get(self, key: Hashable, end_ms: Optional[int], watermark: Optional[Tuple],
+            compute: Callable[[], Union[str, bytes]]) -> Union[str, bytes]:
+        """返回缓存的结果，没有或已失效时调用 compute 计算
+
+        watermark 为计算前读取的测点写入进度（HistoryStore.watermark），与缓存时不同说明有新数据。
+        """
+        if not self.max_bytes:
+            return compute()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.closed or (entry.watermark == watermark
+                                                       and now - entry.created < self.open_ttl)):
+                self._entries.move_to_end(key)
+                LOOKUPS.labels('hit').inc()
+                return entry.text
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+        if not owner:
+            LOOKUPS.labels('coalesced').inc()
+            return future.result()
+
+        LOOKUPS.labels('miss').inc()
+        try:
+            text = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+        self._store(key, _Entry(text, self._closed(end_ms, watermark), watermark, now))
+        future.set_result(text)
+        return text
+
+    def _closed(self, end_ms: Optional[int], watermark: Optional[Tuple]) -> bool:
+        """新数据的时间不早于最后一个点，结束时间早于它的窗口不会再变化"""
+        if end_ms is None:
+            return False
+        last = watermark[0] if watermark is not None else None
+        if last is not None and end_ms < last:
+            return True
+        return end_ms < (time.time() - self.settle) * 1000
+
+    def _store(self, key: Hashable, entry: _Entry):
+        with self._lock:
+            del self._pending[key]
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+            # 超过上限的单个结果不缓存，避免把其他条目全部挤掉
+            if entry.size <= self.max_bytes:
+                self._entries[key] = entry
+                self.bytes += entry.size
+                while self.bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.bytes -= evicted.size
+            size = self.bytes
+        CACHE_BYTES.set(size)
+
+
+# 进程内共享的历史查询结果缓存
+history_cache = HistoryCache()
\ No newline at end of file
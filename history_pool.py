@@ -0,0 +1,65 @@
+"""
+多测点历史查询的并行执行
+
+query_history 的每个测点独立查询（范围读取、降采样、编码）。测点较多时，按测点的查询提交到共享的线程池，
+每个请求同时在途的测点数不超过 HISTORY_QUERY_PARALLELISM，结果仍按请求中的测点顺序输出：
+流式响应边查询边输出，内存中最多只有这么多个测点的结果。
+
+响应被关闭（客户端断开、流式输出中途出错）时，尚未开始的测点查询被取消；已经开始的查询不能中断，
+最多还有 HISTORY_QUERY_PARALLELISM 个在后台执行完。
+
+线程池只在查询会让出 GIL 时（读取段文件、外部存储）缩短耗时，纯 Python 的聚合计算仍受 GIL 限制。
+HISTORY_QUERY_WORKERS 不大于 1 时不创建线程池，在请求线程中逐个查询。
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, TypeVar
+from metrics import Counter
+import config
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+CANCELLED = Counter('history_query_cancelled_total',
+                    'Per-tag history queries cancelled before they started because the response was closed.')
+
+
+class HistoryPool:
+    """按测点并行查询的线程池，workers 为线程数，parallelism 为单个请求同时在途的测点数上限"""
+
+    def __init__(self, workers: int, parallelism: int = 0):
+        self.workers = max(workers, 0)
+        self.parallelism = parallelism if parallelism > 0 else max(self.workers, 1)
+        self.executor = (ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='topv-history-query')
+                         if self.workers > 1 else None)
+
+    def map(self, fn: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        """按 items 的顺序返回 fn(item)，第一次取结果时才开始提交
+
+        返回的生成器被关闭或回收时，取消尚未开始的查询。
+        """
+        if self.executor is None or self.parallelism <= 1:
+            for item in items:
+                yield fn(item)
+            return
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(self.executor.submit(fn, item))
+                if len(pending) >= self.parallelism:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            cancelled = sum(1 for future in pending if future.cancel())
+            if cancelled:
+                CANCELLED.inc(cancelled)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 所有项目共用的线程池；线程在第一次提交时才创建，多进程模式下 fork 之前不会启动
+history_pool = HistoryPool(config.HISTORY_QUERY_WORKERS, config.HISTORY_QUERY_PARALLELISM)
\ No newline at end of file
@@ -0,0 +1,298 @@
+"""
+历史数据存储
+
+每个测点使用两列紧凑数组（时间戳 int64 毫秒、数值 float64）组成的环形缓冲区，
+保留最近 capacity 个点，内存占用有上限且可预估。
+时间范围查询使用二分查找，offset/limit/order 先换算为下标区间，只复制命中的部分。
+"""
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from models import ValueItem
+from segment_store import SegmentStore, SegmentWriter
+import config
+
+
+def to_epoch_ms(value: Any) -> Optional[int]:
+    """将请求中的时间转换为 Unix 毫秒时间戳
+
+    支持毫秒时间戳（数字或数字字符串）、datetime 和 ISO 8601 字符串，None 原样返回。
+    响应中的时间是带 Z 后缀的本地时间（见 models.format_time），为了能用响应中的时间直接查询，
+    结尾的 Z 同样按本地时间解析；带 +08:00 这类显式偏移的时间按偏移换算。
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid time: {value}")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, str):
+        text = value.strip()
+        if text.lstrip('-').isdigit():
+            return int(text)
+        if text.endswith('Z'):
+            text = text[:-1]
+        return int(datetime.fromisoformat(text).timestamp() * 1000)
+    raise ValueError(f"Invalid time: {value}")
+
+
+def from_epoch_ms(ms: int) -> datetime:
+    """将毫秒时间戳转换为本地时间，与推送数据的时间格式保持一致"""
+    return datetime.fromtimestamp(ms / 1000)
+
+
+def window(lo: int, hi: int, offset: int = 0, limit: Optional[int] = None,
+           descending: bool = False) -> Tuple[int, int]:
+    """在下标区间 [lo, hi) 上应用 offset/limit/order，返回新的下标区间
+
+    降序时 offset 从区间末尾开始计算。
+    """
+    offset = max(offset or 0, 0)
+    if descending:
+        hi = max(hi - offset, lo)
+        if limit is not None and limit >= 0:
+            lo = max(hi - limit, lo)
+    else:
+        lo = min(lo + offset, hi)
+        if limit is not None and limit >= 0:
+            hi = min(lo + limit, hi)
+    return lo, hi
+
+
+class TagHistory:
+    """单个测点的环形缓冲区
+
+    未写满前数组按需增长，写满后覆盖最旧的数据。
+    物理上最多分为两段有序区间：[start, len) 和 [0, start)。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(capacity, 1)
+        self.times = array('q')
+        self.values = array('d')
+        self.start = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def last_time(self) -> Optional[int]:
+        n = len(self.times)
+        if n == 0:
+            return None
+        return self.times[(self.start - 1) % n]
+
+    def first_time(self) -> Optional[int]:
+        if not self.times:
+            return None
+        return self.times[self.start]
+
+    def watermark(self) -> Tuple[Optional[int], int, int]:
+        """(最后一个点的时间, 点数, 写入位置)，有新数据写入后一定改变"""
+        with self.lock:
+            return self.last_time(), len(self.times), self.start
+
+    def append(self, ts: int, value: float) -> bool:
+        """追加一个点，时间早于最后一个点时丢弃并返回 False"""
+        with self.lock:
+            return self._append(ts, value)
+
+    def _append(self, ts: int, value: float) -> bool:
+        times = self.times
+        n = len(times)
+        if n and ts < times[(self.start - 1) % n]:
+            return False
+        if n < self.capacity:
+            times.append(ts)
+            self.values.append(value)
+        else:
+            pos = self.start
+            times[pos] = ts
+            self.values[pos] = value
+            self.start = (pos + 1) % n
+        return True
+
+    def _bisect(self, ts: int, right: bool) -> int:
+        """返回逻辑下标，left 为第一个 >= ts 的位置，right 为第一个 > ts 的位置"""
+        times = self.times
+        n = len(times)
+        start = self.start
+        search = bisect_right if right else bisect_left
+        if start == 0:
+            return search(times, ts, 0, n)
+        tail = times[n - 1]
+        if ts > tail or (right and ts == tail):
+            # 落在回绕后的第二段 [0, start)
+            return (n - start) + search(times, ts, 0, start)
+        return search(times, ts, start, n) - start
+
+    def index_range(self, start_ms: Optional[int], end_ms: Optional[int]) -> Tuple[int, int]:
+        """返回时间范围 [start_ms, end_ms] 对应的逻辑下标区间 [lo, hi)"""
+        lo = 0 if start_ms is None else self._bisect(start_ms, False)
+        hi = len(self.times) if end_ms is None else self._bisect(end_ms, True)
+        return lo, max(lo, hi)
+
+    def read(self, lo: int, hi: int) -> Tuple[array, array]:
+        """复制逻辑下标区间 [lo, hi) 的两列数据"""
+        n = len(self.times)
+        if hi <= lo:
+            return array('q'), array('d')
+        a = (self.start + lo) % n
+        b = (self.start + hi) % n or n
+        if a < b:
+            return self.times[a:b], self.values[a:b]
+        return self.times[a:] + self.times[:b], self.values[a:] + self.values[:b]
+
+    def query(self, start_ms: Optional[int], end_ms: Optional[int], offset: int = 0,
+              limit: Optional[int] = None, descending: bool = False) -> Tuple[array, array]:
+        """按时间范围、offset/limit/order 查询，返回 (时间戳列, 数值列)"""
+        with self.lock:
+            lo, hi = self.index_range(start_ms, end_ms)
+            lo, hi = window(lo, hi, offset, limit, descending)
+            times, values = self.read(lo, hi)
+        if descending:
+            times.reverse()
+            values.reverse()
+        return times, values
+
+
+class HistoryStore:
+    """内存环形缓冲区，可选叠加段文件持久化
+
+    配置了 segments 时所有数据同时交给后台线程写入段文件，写入方不做文件 I/O；查询起点早于内存中最早的数据时，
+    较早的部分从段文件读取，与内存部分拼接后再应用 offset/limit/order。
+    """
+
+    def __init__(self, capacity: int = config.HISTORY_RETENTION, segments: Optional[SegmentStore] = None):
+        self.capacity = capacity
+        self.segments = segments
+        self._writer = SegmentWriter(segments) if segments is not None else None
+        self._lock = threading.Lock()
+        self._series: Dict[str, TagHistory] = {}
+
+    def __contains__(self, tag: str) -> bool:
+        return tag in self._series
+
+    def tags(self) -> List[str]:
+        return list(self._series)
+
+    def series(self, tag: str) -> Optional[TagHistory]:
+        return self._series.get(tag)
+
+    def watermark(self, tag: str) -> Optional[Tuple[Optional[int], int, int]]:
+        """测点在内存中的写入进度，测点不存在时返回 None"""
+        series = self._series.get(tag)
+        return series.watermark() if series is not None else None
+
+    def _get_or_create(self, tag: str) -> TagHistory:
+        series = self._series.get(tag)
+        if series is None:
+            with self._lock:
+                series = self._series.get(tag)
+                if series is None:
+                    series = TagHistory(self.capacity)
+                    self._series[tag] = series
+        return series
+
+    def append(self, tag: str, ts: int, value: Any) -> bool:
+        """追加一个点，非数值数据不进入历史库"""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        if not self._get_or_create(tag).append(ts, value):
+            return False
+        if self._writer is not None:
+            self._writer.submit([(tag, ts, value)])
+        return True
+
+    def append_many(self, items: Iterable[ValueItem]):
+        """批量写入实时数据，同一时间戳只换算一次
+
+        与逐个调用 append 等价，但内联了查找和写入，大批量时每个点的开销更小。
+        """
+        series_map = self._series
+        records = [] if self._writer is not None else None
+        last_time = None
+        ts = 0
+        for item in items:
+            if item.timestamp is not last_time:
+                last_time = item.timestamp
+                ts = to_epoch_ms(last_time)
+            value = item.value
+            if type(value) is not float:
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+            series = series_map.get(item.tag)
+            if series is None:
+                series = self._get_or_create(item.tag)
+            with series.lock:
+                if not series._append(ts, value):
+                    continue
+            if records is not None:
+                records.append((item.tag, ts, value))
+        if records:
+            self._writer.submit(records)
+
+    def close(self):
+        """写出尚未落盘的数据"""
+        if self._writer is not None:
+            self._writer.close()
+
+    def query(self, tag: str, start_ms: Optional[int], end_ms: Optional[int], offset: int = 0,
+              limit: Optional[int] = None, descending: bool = False) -> Tuple[array, array]:
+        """查询单个测点，测点不存在时返回空列"""
+        series = self._series.get(tag)
+        if self.segments is not None:
+            first = series.first_time() if series is not None else None
+            # 与 first 时间戳相同的点可能已被挤出内存，起点等于 first 时也需要查询段文件
+            if first is None or start_ms is None or start_ms <= first:
+                return self._query_tiered(series, first, tag, start_ms, end_ms, offset, limit, descending)
+        if series is None:
+            return array('q'), array('d')
+        return series.query(start_ms, end_ms, offset, limit, descending)
+
+    def _query_tiered(self, series: Optional[TagHistory], first: Optional[int], tag: str,
+                      start_ms: Optional[int], end_ms: Optional[int], offset: int,
+                      limit: Optional[int], descending: bool) -> Tuple[array, array]:
+        """段文件提供内存中最早数据 first 之前的部分，内存提供其余部分
+
+        时间戳等于 first 的点可能同时存在于两处，段文件只提供内存中没有的那几个。
+        """
+        if series is None or first is None or (end_ms is not None and end_ms < first):
+            with self.segments.open_range(tag, start_ms, end_ms) as disk:
+                lo, hi = window(0, disk.count, offset, limit, descending)
+                times, values = disk.read(lo, hi)
+        else:
+            with self.segments.open_range(tag, start_ms, first) as disk:
+                with self.segments.open_range(tag, first, first) as overlap:
+                    n_overlap = overlap.count
+                with series.lock:
+                    ram_lo, ram_hi = series.index_range(first, end_ms)
+                    first_lo, first_hi = series.index_range(first, first)
+                    n_disk = disk.count - min(n_overlap, first_hi - first_lo)
+                    lo, hi = window(0, n_disk + ram_hi - ram_lo, offset, limit, descending)
+                    a = max(lo - n_disk, 0)
+                    b = hi - n_disk
+                    ram_times, ram_values = series.read(ram_lo + a, ram_lo + b)
+                times, values = disk.read(lo, min(hi, n_disk))
+                times.extend(ram_times)
+                values.extend(ram_values)
+
+        if descending:
+            times.reverse()
+            values.reverse()
+        return times, values
+
+
+# 进程内共享的历史数据存储，配置了数据目录时启用段文件持久化
+history_store = HistoryStore(
+    segments=SegmentStore(config.HISTORY_DATA_DIR, config.HISTORY_SEGMENT_WINDOW, config.HISTORY_FLUSH_INTERVAL,
+                          config.HISTORY_MAX_OPEN_FILES) if config.HISTORY_DATA_DIR else None)
\ No newline at end of file
@@ -1,9 +1,79 @@
 from datetime import datetime
-from typing import List, Optional, Any, Dict
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, Optional, Any, Dict, Union
+from json.encoder import encode_basestring, encode_basestring_ascii
+import hashlib
 import json
+import math
+from msgpack_codec import array_header, epoch_ms, map_header, pack_column, pack_float, pack_int, pack_str, packb
 
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+def format_time(time: datetime) -> str:
+    """格式化时间，相同时间只格式化一次"""
+    if time.tzinfo is None:
+        return _format_naive_time(time)
+    return time.strftime(TIME_FORMAT)
+
+
+@lru_cache(maxsize=4096)
+def _format_naive_time(time: datetime) -> str:
+    if time.year >= 1000:
+        # 与 strftime(TIME_FORMAT) 结果相同，但快得多
+        return time.isoformat(timespec='microseconds') + 'Z'
+    return time.strftime(TIME_FORMAT)
+
+
+def _encode_value(value: Any, ensure_ascii: bool) -> str:
+    """按 json.dumps 的规则编码单个值，常见类型走快速路径"""
+    value_type = type(value)
+    if value_type is str:
+        return encode_basestring_ascii(value) if ensure_ascii else encode_basestring(value)
+    if value_type is float and math.isfinite(value):
+        return float.__repr__(value)
+    if value_type is int:
+        return int.__repr__(value)
+    if value is None:
+        return 'null'
+    return json.dumps(value, ensure_ascii=ensure_ascii)
+
+
+def dumps(obj: Any, ensure_ascii: bool = True) -> str:
+    """将模型对象（或模型列表）直接编码为 JSON，不经过中间字典
+
+    输出与 json.dumps(obj.to_dict()) 逐字节一致，其他类型交给 json.dumps。
+    """
+    if isinstance(obj, JsonModel):
+        return obj._encode(ensure_ascii)
+    if isinstance(obj, list) and obj and isinstance(obj[0], JsonModel):
+        return '[' + ', '.join([item._encode(ensure_ascii) for item in obj]) + ']'
+    return json.dumps(obj, ensure_ascii=ensure_ascii)
+
+
+class JsonModel:
+    __slots__ = ()
+
+    def to_dict(self) -> Dict:
+        raise NotImplementedError
+
+    def _encode(self, ensure_ascii: bool) -> str:
+        raise NotImplementedError
+
+    def to_json(self) -> str:
+        return self._encode(True)
+
+    def to_json_bytes(self, ensure_ascii: bool = False) -> bytes:
+        return self._encode(ensure_ascii).encode('utf-8')
+
+    def to_msgpack(self) -> bytes:
+        """MessagePack 编码（见 msgpack_codec），默认与 to_dict 的结构相同"""
+        return packb(self.to_dict())
+
+
+class ValueItem(JsonModel):
+    __slots__ = ('tag', 'timestamp', 'value', 'quality')
 
-class ValueItem:
     def __init__(self, tag: str, timestamp: datetime, value: Any, quality: int = 1):
         self.tag = tag
         self.timestamp = timestamp
@@ -13,16 +83,101 @@ class ValueItem:
     def to_dict(self) -> Dict:
         return {
             "tag": self.tag,
-            "timestamp": self.timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "timestamp": format_time(self.timestamp),
             "value": self.value,
             "quality": self.quality
         }
 
-    def to_json(self) -> str:
-        return json.dumps(self.to_dict())
+    def _encode(self, ensure_ascii: bool) -> str:
+        return (f'{{"tag": {_encode_value(self.tag, ensure_ascii)}, '
+                f'"timestamp": "{format_time(self.timestamp)}", '
+                f'"value": {_encode_value(self.value, ensure_ascii)}, '
+                f'"quality": {_encode_value(self.quality, ensure_ascii)}}}')
+
+    def to_msgpack(self) -> bytes:
+        """按位置编码为 [tag, timestamp, value, quality]，时间为毫秒时间戳"""
+        return packb([self.tag, self.timestamp, self.value, self.quality])
+
+
+class ValueItemEncoder:
+    """批量编码 ValueItem，输出与逐个调用 to_json 完全一致
+
+    缓存每个标签的 JSON 前缀，同一时间戳只格式化一次；数值为有限浮点数、质量码为整数时
+    只需拼接一次字符串，其他情况退回 to_json。适合测点固定、每轮重复编码的推送循环。
+    """
+
+    def __init__(self):
+        self._prefixes: Dict[str, str] = {}
+
+    def encode(self, items: List[ValueItem]) -> List[str]:
+        prefixes = self._prefixes
+        last_time = None
+        time_text = ''
+        encoded = []
+        for item in items:
+            value = item.value
+            quality = item.quality
+            if type(value) is not float or type(quality) is not int or not math.isfinite(value):
+                encoded.append(item.to_json())
+                continue
+            if item.timestamp is not last_time:
+                last_time = item.timestamp
+                time_text = format_time(last_time)
+            prefix = prefixes.get(item.tag)
+            if prefix is None:
+                prefix = prefixes[item.tag] = f'{{"tag": {_encode_value(item.tag, True)}, "timestamp": "'
+            encoded.append(f'{prefix}{time_text}", "value": {float.__repr__(value)}, '
+                           f'"quality": {int.__repr__(quality)}}}')
+        return encoded
+
+
+_FIXINTS = [bytes((i,)) for i in range(0x80)]
+
+
+class ValueItemPacker:
+    """批量编码 ValueItem 为 MessagePack，输出与逐个调用 to_msgpack 完全一致
+
+    缓存每个标签的数组头和标签，同一时间戳只转换一次，与 ValueItemEncoder 用法相同。
+    """
+
+    def __init__(self):
+        self._prefixes: Dict[str, bytes] = {}
+
+    def encode(self, items: List[ValueItem]) -> List[bytes]:
+        prefixes = self._prefixes
+        last_time = None
+        time_packed = b''
+        encoded = []
+        for item in items:
+            if item.timestamp is not last_time:
+                last_time = item.timestamp
+                time_packed = pack_int(epoch_ms(last_time))
+            prefix = prefixes.get(item.tag)
+            if prefix is None:
+                prefix = prefixes[item.tag] = b'\x94' + pack_str(item.tag)
+            value = item.value
+            quality = item.quality
+            if type(value) is float and type(quality) is int and 0 <= quality < 0x80:
+                encoded.append(prefix + time_packed + pack_float(value) + _FIXINTS[quality])
+            else:
+                encoded.append(prefix + time_packed + packb(value) + packb(quality))
+        return encoded
+
+
+_TAG_KEY = pack_str("tag")
+_TIME_KEY = pack_str("time")
+_VALUE_KEY = pack_str("value")
 
 
-class DataItem:
+def pack_result(tag: str, times, values) -> bytes:
+    """单个测点的历史数据按列编码：{"tag": ..., "time": int64 列, "value": float64 列}"""
+    return b''.join((b'\x83', _TAG_KEY, pack_str(tag), _TIME_KEY, pack_column(times, 'q'),
+                     _VALUE_KEY, pack_column(values, 'd')))
+
+
+class DataItem(JsonModel):
+    __slots__ = ('value', 'time')
+
     def __init__(self, value: Any = None, time: Optional[datetime] = None):
         self.value = value
         self.time = time
@@ -32,14 +187,22 @@ class DataItem:
         if self.value is not None:
             result["value"] = self.value
         if self.time is not None:
-            result["time"] = self.time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            result["time"] = format_time(self.time)
         return result
 
-    def to_json(self) -> str:
-        return json.dumps(self.to_dict())
+    def _encode(self, ensure_ascii: bool) -> str:
+        if self.value is None:
+            if self.time is None:
+                return '{}'
+            return f'{{"time": "{format_time(self.time)}"}}'
+        if self.time is None:
+            return f'{{"value": {_encode_value(self.value, ensure_ascii)}}}'
+        return f'{{"value": {_encode_value(self.value, ensure_ascii)}, "time": "{format_time(self.time)}"}}'
+
 
+class Result(JsonModel):
+    __slots__ = ('tag', 'values')
 
-class Result:
     def __init__(self, tag: str, values: List[DataItem]):
         self.tag = tag
         self.values = values
@@ -50,19 +213,125 @@ class Result:
             "values": [item.to_dict() for item in self.values]
         }
 
-    def to_json(self) -> str:
-        return json.dumps(self.to_dict())
+    def _encode(self, ensure_ascii: bool) -> str:
+        values = ', '.join([item._encode(ensure_ascii) for item in self.values])
+        return f'{{"tag": {_encode_value(self.tag, ensure_ascii)}, "values": [{values}]}}'
+
+    def iter_json(self, ensure_ascii: bool = True, batch_size: int = 1024) -> Iterator[str]:
+        """分段生成 JSON，每段最多包含 batch_size 个数据点，拼接结果与 to_json 一致"""
+        yield f'{{"tag": {_encode_value(self.tag, ensure_ascii)}, "values": ['
+        values = self.values
+        for i in range(0, len(values), batch_size):
+            encoded = ', '.join([item._encode(ensure_ascii) for item in values[i:i + batch_size]])
+            yield encoded if i == 0 else ', ' + encoded
+        yield ']}'
+
+    def to_msgpack(self) -> bytes:
+        values = self.values
+        return pack_result(self.tag, [epoch_ms(item.time) for item in values], [item.value for item in values])
+
+
+class EncodedResult(JsonModel):
+    """已经编码好的单个测点结果（不转义非 ASCII 字符），来自历史查询的结果缓存
+
+    packed 生成同一查询的 MessagePack 编码（直接按毫秒时间戳列编码），时间不经过文本往返换算。
+    """
+    __slots__ = ('tag', 'text', 'packed')
+
+    def __init__(self, tag: str, text: str, packed: Callable[[], bytes]):
+        self.tag = tag
+        self.text = text
+        self.packed = packed
+
+    def to_dict(self) -> Dict:
+        return json.loads(self.text)
+
+    def _encode(self, ensure_ascii: bool) -> str:
+        if ensure_ascii and not self.text.isascii():
+            return json.dumps(json.loads(self.text), ensure_ascii=True)
+        return self.text
+
+    def iter_json(self, ensure_ascii: bool = True, batch_size: int = 1024) -> Iterator[str]:
+        yield self._encode(ensure_ascii)
+
+    def to_msgpack(self) -> bytes:
+        return self.packed()
+
+
+class PackedResult(JsonModel):
+    """已经按列编码好的单个测点结果（MessagePack），来自历史查询的结果缓存
+
+    encoded 生成同一查询的 JSON 编码（不转义非 ASCII 字符），时间不经过毫秒时间戳往返换算。
+    """
+    __slots__ = ('tag', 'data', 'encoded')
+
+    def __init__(self, tag: str, data: bytes, encoded: Callable[[], str]):
+        self.tag = tag
+        self.data = data
+        self.encoded = encoded
+
+    def to_dict(self) -> Dict:
+        return json.loads(self.encoded())
+
+    def _encode(self, ensure_ascii: bool) -> str:
+        text = self.encoded()
+        if ensure_ascii and not text.isascii():
+            return json.dumps(json.loads(text), ensure_ascii=True)
+        return text
+
+    def iter_json(self, ensure_ascii: bool = True, batch_size: int = 1024) -> Iterator[str]:
+        yield self._encode(ensure_ascii)
+
+    def to_msgpack(self) -> bytes:
+        return self.data
+
+
+class TagError(JsonModel):
+    """单个测点查询失败时的结果，不影响同一请求中的其他测点"""
+    __slots__ = ('tag', 'error')
+
+    def __init__(self, tag: str, error: str):
+        self.tag = tag
+        self.error = error
+
+    def to_dict(self) -> Dict:
+        return {"tag": self.tag, "error": self.error}
+
+    def _encode(self, ensure_ascii: bool) -> str:
+        return (f'{{"tag": {_encode_value(self.tag, ensure_ascii)}, '
+                f'"error": {_encode_value(self.error, ensure_ascii)}}}')
 
+    def iter_json(self, ensure_ascii: bool = True, batch_size: int = 1024) -> Iterator[str]:
+        yield self._encode(ensure_ascii)
 
-class HistoryResponse:
-    def __init__(self, results: List[Result], msg: Optional[str] = None, code: Optional[str] = None):
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+
+class HistoryResponse(JsonModel):
+    """历史查询响应
+
+    results 可以是结果列表，也可以是按输出格式（JSON / MSGPACK）生成结果的函数，输出时以实际格式调用，
+    可以返回生成器，直接生成相应格式的结果。count 为结果个数，results 是生成器时按 MessagePack 输出
+    需要预先知道。
+    """
+    __slots__ = ('results', 'msg', 'code', 'count')
+
+    def __init__(self, results: Union[List[Result], Callable[[str], Iterable[JsonModel]]],
+                 msg: Optional[str] = None, code: Optional[str] = None, count: Optional[int] = None):
         self.results = results
         self.msg = msg
         self.code = code
+        self.count = count
+
+    def _results(self, fmt: str) -> Iterable[JsonModel]:
+        results = self.results
+        return results(fmt) if callable(results) else results
 
     def to_dict(self) -> Dict:
         result = {
-            "results": [item.to_dict() for item in self.results]
+            "results": [item.to_dict() for item in self._results(JSON)]
         }
         if self.msg is not None:
             result["msg"] = self.msg
@@ -70,11 +339,124 @@ class HistoryResponse:
             result["code"] = self.code
         return result
 
-    def to_json(self) -> str:
-        return json.dumps(self.to_dict())
+    def _encode(self, ensure_ascii: bool) -> str:
+        parts = ['{"results": [', ', '.join([item._encode(ensure_ascii) for item in self._results(JSON)]), ']']
+        parts.append(self._encode_tail(ensure_ascii))
+        return ''.join(parts)
+
+    def _encode_tail(self, ensure_ascii: bool) -> str:
+        parts = []
+        if self.msg is not None:
+            parts.append(f', "msg": {_encode_value(self.msg, ensure_ascii)}')
+        if self.code is not None:
+            parts.append(f', "code": {_encode_value(self.code, ensure_ascii)}')
+        parts.append('}')
+        return ''.join(parts)
+
+    def iter_json(self, ensure_ascii: bool = True) -> Iterator[str]:
+        """逐个结果生成 JSON 片段，拼接结果与 to_json 一致
+
+        results 可以是生成器，此时每个标签的数据在输出时才查询，内存占用与结果总量无关。
+        """
+        yield '{"results": ['
+        first = True
+        for result in self._results(JSON):
+            if not first:
+                yield ', '
+            first = False
+            yield from result.iter_json(ensure_ascii)
+        yield ']'
+        yield self._encode_tail(ensure_ascii)
+
+    def iter_ndjson(self, ensure_ascii: bool = True) -> Iterator[str]:
+        """NDJSON 格式：每个结果一行，msg/code 存在时追加为最后一行"""
+        for result in self._results(JSON):
+            yield from result.iter_json(ensure_ascii)
+            yield '\n'
+        if self.msg is not None or self.code is not None:
+            tail = {}
+            if self.msg is not None:
+                tail["msg"] = self.msg
+            if self.code is not None:
+                tail["code"] = self.code
+            yield json.dumps(tail, ensure_ascii=ensure_ascii) + '\n'
+
+    def iter_msgpack(self) -> Iterator[bytes]:
+        """逐个结果生成 MessagePack 片段，拼接结果与 to_msgpack 一致"""
+        results = self._results(MSGPACK)
+        count = self.count
+        if count is None:
+            results = list(results)
+            count = len(results)
+        tail = [(key, value) for key, value in (("msg", self.msg), ("code", self.code)) if value is not None]
+        yield map_header(1 + len(tail)) + pack_str("results") + array_header(count)
+        for result in results:
+            yield result.to_msgpack()
+        for key, value in tail:
+            yield pack_str(key) + packb(value)
+
+    def to_msgpack(self) -> bytes:
+        return b''.join(self.iter_msgpack())
+
+
+class ItemStatus(JsonModel):
+    """批量请求中单个条目的处理结果"""
+    __slots__ = ('tag', 'code', 'msg')
+
+    def __init__(self, tag: Any, code: str, msg: Optional[str] = None):
+        self.tag = tag
+        self.code = code
+        self.msg = msg
+
+    def to_dict(self) -> Dict:
+        result = {"tag": self.tag, "code": self.code}
+        if self.msg is not None:
+            result["msg"] = self.msg
+        return result
+
+    def _encode(self, ensure_ascii: bool) -> str:
+        encoded = (f'{{"tag": {_encode_value(self.tag, ensure_ascii)}, '
+                   f'"code": {_encode_value(self.code, ensure_ascii)}')
+        if self.msg is not None:
+            encoded += f', "msg": {_encode_value(self.msg, ensure_ascii)}'
+        return encoded + '}'
+
+
+class BatchResponse(JsonModel):
+    """批量请求的响应：results 按请求顺序给出每个条目的结果，code 汇总整批状态"""
+    __slots__ = ('results', 'code', 'msg')
+
+    def __init__(self, results: List[JsonModel], code: str, msg: Optional[str] = None):
+        self.results = results
+        self.code = code
+        self.msg = msg
+
+    def to_dict(self) -> Dict:
+        result = {
+            "results": [item.to_dict() for item in self.results],
+            "code": self.code
+        }
+        if self.msg is not None:
+            result["msg"] = self.msg
+        return result
+
+    def _encode(self, ensure_ascii: bool) -> str:
+        results = ', '.join([item._encode(ensure_ascii) for item in self.results])
+        encoded = f'{{"results": [{results}], "code": {_encode_value(self.code, ensure_ascii)}'
+        if self.msg is not None:
+            encoded += f', "msg": {_encode_value(self.msg, ensure_ascii)}'
+        return encoded + '}'
+
+    def to_msgpack(self) -> bytes:
+        result = {"results": self.results, "code": self.code}
+        if self.msg is not None:
+            result["msg"] = self.msg
+        return packb(result)
+
 
+class TagPoint(JsonModel):
+    __slots__ = ('tag', 'name')
 
-class TagPoint:
     def __init__(self, tag: Optional[str] = None, name: Optional[str] = None):
         self.tag = tag
         self.name = name
@@ -87,18 +469,28 @@ class TagPoint:
             result["name"] = self.name
         return result
 
-    def to_json(self) -> str:
-        return json.dumps(self.to_dict())
+    def _encode(self, ensure_ascii: bool) -> str:
+        parts = []
+        if self.tag is not None:
+            parts.append(f'"tag": {_encode_value(self.tag, ensure_ascii)}')
+        if self.name is not None:
+            parts.append(f'"name": {_encode_value(self.name, ensure_ascii)}')
+        return '{' + ', '.join(parts) + '}'
+
 
+class Device(JsonModel):
+    __slots__ = ('parent_tag', 'tag', 'name', 'children', 'is_device', 'has_children')
 
-class Device:
-    def __init__(self, tag: Optional[str] = None, name: Optional[str] = None, 
-                 children: Optional[List['Device']] = None, is_device: bool = False):
+    def __init__(self, tag: Optional[str] = None, name: Optional[str] = None,
+                 children: Optional[List['Device']] = None, is_device: bool = False,
+                 has_children: Optional[bool] = None):
         self.parent_tag = None  # 内部使用，不序列化
         self.tag = tag
         self.name = name
         self.children = children or []
         self.is_device = is_device
+        # 按层级展开时，未展开的节点标记是否还有子节点；为 None 时不输出
+        self.has_children = has_children
 
     def to_dict(self) -> Dict:
         result = {}
@@ -109,7 +501,76 @@ class Device:
         if self.children:
             result["children"] = [child.to_dict() for child in self.children]
         result["isDevice"] = self.is_device
+        if self.has_children is not None:
+            result["hasChildren"] = self.has_children
         return result
 
-    def to_json(self) -> str:
-        return json.dumps(self.to_dict()) 
\ No newline at end of file
+    def _encode(self, ensure_ascii: bool) -> str:
+        parts = []
+        if self.tag is not None:
+            parts.append(f'"tag": {_encode_value(self.tag, ensure_ascii)}')
+        if self.name is not None:
+            parts.append(f'"name": {_encode_value(self.name, ensure_ascii)}')
+        if self.children:
+            children = ', '.join([child._encode(ensure_ascii) for child in self.children])
+            parts.append(f'"children": [{children}]')
+        if self.is_device is True or self.is_device is False:
+            parts.append('"isDevice": true' if self.is_device else '"isDevice": false')
+        else:
+            parts.append(f'"isDevice": {_encode_value(self.is_device, ensure_ascii)}')
+        if self.has_children is not None:
+            parts.append('"hasChildren": true' if self.has_children else '"hasChildren": false')
+        return '{' + ', '.join(parts) + '}'
+
+
+class Page(JsonModel):
+    """分页查询的一页：next_cursor 为下一页的游标，没有下一页时为 None"""
+    __slots__ = ('items', 'next_cursor')
+
+    def __init__(self, items: List[JsonModel], next_cursor: Optional[str] = None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def to_dict(self) -> Dict:
+        return {"items": [item.to_dict() for item in self.items], "nextCursor": self.next_cursor}
+
+    def _encode(self, ensure_ascii: bool) -> str:
+        items = ', '.join([item._encode(ensure_ascii) for item in self.items])
+        return f'{{"items": [{items}], "nextCursor": {_encode_value(self.next_cursor, ensure_ascii)}}}'
+
+
+class CachedJson(JsonModel):
+    """已经编码好的响应（UTF-8，不转义非 ASCII 字符），带有按内容计算的 ETag
+
+    同一份内容多次返回时不再重新编码；压缩结果也按编码方式缓存。
+    """
+    __slots__ = ('body', 'etag', '_compressed', '_packed')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = 'W/"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self._compressed: Dict[Any, bytes] = {}
+        self._packed: Optional[bytes] = None
+
+    def to_dict(self) -> Any:
+        return json.loads(self.body)
+
+    def _encode(self, ensure_ascii: bool) -> str:
+        text = self.body.decode('utf-8')
+        return json.dumps(json.loads(text), ensure_ascii=True) if ensure_ascii else text
+
+    def to_json_bytes(self, ensure_ascii: bool = False) -> bytes:
+        return self._encode(True).encode('utf-8') if ensure_ascii else self.body
+
+    def to_msgpack(self) -> bytes:
+        """MessagePack 编码结果，只编码一次"""
+        if self._packed is None:
+            self._packed = packb(json.loads(self.body))
+        return self._packed
+
+    def compressed(self, key: Any, compress: Callable[[bytes], bytes]) -> bytes:
+        """返回按 key（编码方式与级别）缓存的压缩结果"""
+        body = self._compressed.get(key)
+        if body is None:
+            body = self._compressed[key] = compress(self.body)
+        return body
\ No newline at end of file
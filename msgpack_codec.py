@@ -0,0 +1,279 @@
+"""
+MessagePack 编码
+
+JSON 之外可选的紧凑二进制格式，HTTP 按 Accept / Content-Type 协商，NATS 推送按 TOPV_NATS_PAYLOAD_FORMAT
+配置，NATS 请求-应答按主题后缀 .msgpack 选择。只使用标准库，实现了 MessagePack 规范中除扩展类型外的全部类型。
+
+与 JSON 格式的区别：
+
+- 时间为 Unix 毫秒时间戳（整数），不再是 ISO 8601 字符串
+- 实时数据（ValueItem）按位置编码为数组 [tag, timestamp, value, quality]
+- 历史数据按列编码：{"tag": ..., "time": <bin>, "value": <bin>}，time 为小端 int64 数组，
+  value 为小端 float64 数组，客户端可以直接映射为 BigInt64Array / Float64Array 或 numpy 数组
+- 其他响应与 JSON 的结构相同
+"""
+
+import struct
+import sys
+from array import array
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from compression import parse_weights
+
+CONTENT_TYPE = 'application/msgpack'
+# 请求与 Accept 中可以识别的类型名
+CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+_INT8 = struct.Struct('>Bb')
+_INT16 = struct.Struct('>Bh')
+_INT32 = struct.Struct('>Bi')
+_INT64 = struct.Struct('>Bq')
+_UINT8 = struct.Struct('>BB')
+_UINT16 = struct.Struct('>BH')
+_UINT32 = struct.Struct('>BI')
+_UINT64 = struct.Struct('>BQ')
+_FLOAT64 = struct.Struct('>Bd')
+
+
+def epoch_ms(time: datetime) -> int:
+    """datetime 转换为 Unix 毫秒时间戳（无时区的时间按本地时间，与历史数据的时间戳一致）"""
+    return round(time.timestamp() * 1000)
+
+
+def pack_int(value: int) -> bytes:
+    if 0 <= value < 0x80:
+        return bytes((value,))
+    if -32 <= value < 0:
+        return bytes((value & 0xff,))
+    if value > 0:
+        if value <= 0xff:
+            return _UINT8.pack(0xcc, value)
+        if value <= 0xffff:
+            return _UINT16.pack(0xcd, value)
+        if value <= 0xffffffff:
+            return _UINT32.pack(0xce, value)
+        return _UINT64.pack(0xcf, value)
+    if value >= -0x80:
+        return _INT8.pack(0xd0, value)
+    if value >= -0x8000:
+        return _INT16.pack(0xd1, value)
+    if value >= -0x80000000:
+        return _INT32.pack(0xd2, value)
+    return _INT64.pack(0xd3, value)
+
+
+def pack_float(value: float) -> bytes:
+    return _FLOAT64.pack(0xcb, value)
+
+
+def pack_str(value: str) -> bytes:
+    data = value.encode('utf-8')
+    size = len(data)
+    if size < 32:
+        return bytes((0xa0 | size,)) + data
+    if size <= 0xff:
+        return _UINT8.pack(0xd9, size) + data
+    if size <= 0xffff:
+        return _UINT16.pack(0xda, size) + data
+    return _UINT32.pack(0xdb, size) + data
+
+
+def pack_bin(data: bytes) -> bytes:
+    size = len(data)
+    if size <= 0xff:
+        return _UINT8.pack(0xc4, size) + data
+    if size <= 0xffff:
+        return _UINT16.pack(0xc5, size) + data
+    return _UINT32.pack(0xc6, size) + data
+
+
+def array_header(size: int) -> bytes:
+    if size < 16:
+        return bytes((0x90 | size,))
+    if size <= 0xffff:
+        return _UINT16.pack(0xdc, size)
+    return _UINT32.pack(0xdd, size)
+
+
+def map_header(size: int) -> bytes:
+    if size < 16:
+        return bytes((0x80 | size,))
+    if size <= 0xffff:
+        return _UINT16.pack(0xde, size)
+    return _UINT32.pack(0xdf, size)
+
+
+def pack_column(values: Sequence, typecode: str) -> bytes:
+    """数值列编码为小端定长数组（typecode 为 'q' 或 'd'）的 bin"""
+    column = values if isinstance(values, array) and values.typecode == typecode else array(typecode, values)
+    if sys.byteorder == 'big':
+        column = array(typecode, column)
+        column.byteswap()
+    return pack_bin(column.tobytes())
+
+
+def unpack_column(data: bytes, typecode: str) -> array:
+    """pack_column 的逆操作"""
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def _pack(obj: Any, out: List[bytes]):
+    obj_type = type(obj)
+    if obj_type is str:
+        out.append(pack_str(obj))
+    elif obj_type is float:
+        out.append(_FLOAT64.pack(0xcb, obj))
+    elif obj is None:
+        out.append(b'\xc0')
+    elif obj is True:
+        out.append(b'\xc3')
+    elif obj is False:
+        out.append(b'\xc2')
+    elif isinstance(obj, int):
+        out.append(pack_int(obj))
+    elif isinstance(obj, float):
+        out.append(_FLOAT64.pack(0xcb, obj))
+    elif isinstance(obj, dict):
+        out.append(map_header(len(obj)))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    elif isinstance(obj, (list, tuple)):
+        out.append(array_header(len(obj)))
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        out.append(pack_bin(bytes(obj)))
+    elif isinstance(obj, datetime):
+        out.append(pack_int(epoch_ms(obj)))
+    elif hasattr(obj, 'to_msgpack'):
+        # 模型对象自行编码（见 models.JsonModel.to_msgpack）
+        out.append(obj.to_msgpack())
+    else:
+        raise TypeError(f"Object of type {obj_type.__name__} is not MessagePack serializable")
+
+
+def packb(obj: Any) -> bytes:
+    """编码为 MessagePack；datetime 编码为毫秒时间戳，模型对象按各自的格式编码"""
+    out: List[bytes] = []
+    _pack(obj, out)
+    return b''.join(out)
+
+
+class _Reader:
+    __slots__ = ('data', 'pos')
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def take(self, size: int) -> bytes:
+        end = self.pos + size
+        if end > len(self.data):
+            raise ValueError("Truncated MessagePack data")
+        chunk = self.data[self.pos:end]
+        self.pos = end
+        return chunk
+
+    def unpack(self, fmt: str) -> Any:
+        size = struct.calcsize(fmt)
+        return struct.unpack(fmt, self.take(size))[0]
+
+
+# 定长头部：类型字节 -> (struct 格式, 含义)
+_SIZED = {
+    0xc4: ('>B', 'bin'), 0xc5: ('>H', 'bin'), 0xc6: ('>I', 'bin'),
+    0xd9: ('>B', 'str'), 0xda: ('>H', 'str'), 0xdb: ('>I', 'str'),
+    0xdc: ('>H', 'array'), 0xdd: ('>I', 'array'),
+    0xde: ('>H', 'map'), 0xdf: ('>I', 'map'),
+}
+_SCALARS = {
+    0xca: '>f', 0xcb: '>d',
+    0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+    0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q',
+}
+_EXT = {0xd4: 1, 0xd5: 2, 0xd6: 4, 0xd7: 8, 0xd8: 16, 0xc7: '>B', 0xc8: '>H', 0xc9: '>I'}
+
+
+def _unpack(reader: _Reader) -> Any:
+    code = reader.take(1)[0]
+    if code < 0x80:
+        return code
+    if code >= 0xe0:
+        return code - 0x100
+    if code <= 0x8f:
+        return _unpack_map(reader, code & 0x0f)
+    if code <= 0x9f:
+        return [_unpack(reader) for _ in range(code & 0x0f)]
+    if code <= 0xbf:
+        return reader.take(code & 0x1f).decode('utf-8')
+    if code == 0xc0:
+        return None
+    if code == 0xc2:
+        return False
+    if code == 0xc3:
+        return True
+    if code in _SCALARS:
+        return reader.unpack(_SCALARS[code])
+    if code in _SIZED:
+        fmt, kind = _SIZED[code]
+        size = reader.unpack(fmt)
+        if kind == 'bin':
+            return reader.take(size)
+        if kind == 'str':
+            return reader.take(size).decode('utf-8')
+        if kind == 'array':
+            return [_unpack(reader) for _ in range(size)]
+        return _unpack_map(reader, size)
+    if code in _EXT:
+        # 扩展类型原样返回 (类型, 数据)
+        size = _EXT[code]
+        if isinstance(size, str):
+            size = reader.unpack(size)
+        ext_type = reader.unpack('>b')
+        return ext_type, reader.take(size)
+    raise ValueError(f"Invalid MessagePack type byte: 0x{code:02x}")
+
+
+def _unpack_map(reader: _Reader, size: int) -> dict:
+    result = {}
+    for _ in range(size):
+        key = _unpack(reader)
+        result[key] = _unpack(reader)
+    return result
+
+
+def unpackb(data: bytes) -> Any:
+    """解码一个完整的 MessagePack 对象，数据不完整或有多余字节时抛出 ValueError"""
+    reader = _Reader(bytes(data))
+    try:
+        result = _unpack(reader)
+    except (struct.error, UnicodeDecodeError, TypeError, RecursionError) as e:
+        raise ValueError(f"Invalid MessagePack data: {e}") from e
+    if reader.pos != len(reader.data):
+        raise ValueError("Extra data after MessagePack object")
+    return result
+
+
+def accepts(accept: Optional[str]) -> bool:
+    """Accept 头是否选择 MessagePack：按 q 值比较，明确列出的 MessagePack 类型 q 值大于 0
+    且不低于 application/json 时选择 MessagePack（q=0 表示不接受），其余情况默认为 JSON"""
+    if not accept:
+        return False
+    weights = parse_weights(accept)
+    q = max(weights.get(content_type, 0.0) for content_type in CONTENT_TYPES)
+    return q > 0 and q >= weights.get('application/json', 0.0)
+
+
+def is_content_type(content_type: Optional[str]) -> bool:
+    """Content-Type 头是否为 MessagePack（忽略 charset 等参数）"""
+    return (content_type or '').partition(';')[0].strip().lower() in CONTENT_TYPES
+
+
+def columns(result: dict) -> Tuple[array, array]:
+    """从解码后的历史结果中取出 (时间列, 数值列)"""
+    return unpack_column(result["time"], 'q'), unpack_column(result["value"], 'd')
\ No newline at end of file
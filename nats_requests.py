@@ -0,0 +1,226 @@
+"""
+NATS 请求-应答接口
+
+已经连接 NATS 的客户端无需再走 HTTP：向 <前缀>.<操作> 发送请求即可调用查询接口，
+请求体与 HTTP 接口的 JSON 请求体相同，应答内容与 HTTP 响应体相同，处理函数同为 api_handler。
+
+    nats req topv.adaptor.req.find_last '{"projectID": "p1", "tag": "group1.dev1.a"}'
+
+操作：find_last、query_history、query_points、query_devices。多个适配器实例订阅同一个队列组，
+每个请求只由其中一个实例处理。
+
+主题加后缀 .msgpack（<前缀>.<操作>.msgpack）时请求体和应答都使用 MessagePack（见 msgpack_codec），
+时间为毫秒时间戳，历史数据按列编码。
+
+应答超过 chunk_size 时分块发送到同一个应答主题：每块带 TopV-Chunk 头（从 0 开始的序号），
+最后一块另带 TopV-Chunk-Last: 1，按序拼接各块的内容即为完整应答。不超过时只发送一条普通应答，
+可以直接用 nc.request 接收。
+"""
+
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, Iterator, List, Optional
+from models import HistoryResponse
+from api_handler import find_last, query_history, query_points, query_devices
+from routes import encode_json
+from msgpack_codec import packb, unpackb
+from metrics import Counter, Histogram
+import config
+
+logger = logging.getLogger(__name__)
+
+# 操作名 -> 处理函数
+OPERATIONS = {
+    'find_last': find_last,
+    'query_history': query_history,
+    'query_points': query_points,
+    'query_devices': query_devices,
+}
+
+# 主题后缀：请求体和应答使用 MessagePack
+MSGPACK_SUFFIX = 'msgpack'
+
+CHUNK_HEADER = 'TopV-Chunk'
+LAST_CHUNK_HEADER = 'TopV-Chunk-Last'
+
+REQUESTS = Counter('nats_requests_total', 'NATS request-reply calls by operation and status.',
+                   ('operation', 'status'))
+REQUEST_DURATION = Histogram('nats_request_duration_seconds',
+                             'Time from receiving a NATS request to publishing the last reply chunk.',
+                             ('operation',))
+
+
+def split_chunks(parts: Iterable[bytes], chunk_size: int) -> Iterator[bytes]:
+    """将片段合并为不超过 chunk_size 字节的块，超长的片段按字节切开"""
+    buffer = []
+    size = 0
+    empty = True
+    for part in parts:
+        if size + len(part) > chunk_size and buffer:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+            empty = False
+        while len(part) > chunk_size:
+            yield part[:chunk_size]
+            part = part[chunk_size:]
+            empty = False
+        if part:
+            buffer.append(part)
+            size += len(part)
+    if buffer or empty:
+        yield b''.join(buffer)
+
+
+def encode_reply(data: Any, chunk_size: int, binary: bool = False) -> List[bytes]:
+    """编码处理函数的返回值，历史查询结果逐个测点编码，不先拼出完整的 JSON；binary 为 True 时编码为 MessagePack"""
+    if isinstance(data, HistoryResponse):
+        parts = data.iter_msgpack() if binary else (part.encode('utf-8') for part in data.iter_json(False))
+    else:
+        parts = (packb(data) if binary else encode_json(data),)
+    return list(split_chunks(parts, chunk_size))
+
+
+def handle_request(operation: str, payload: bytes, chunk_size: int, binary: bool = False) -> List[bytes]:
+    """处理一个请求，返回应答块；与 HTTP 接口相同的错误以 {"error": ...} 应答
+
+    binary 为 True 时（主题带 .msgpack 后缀）请求体和应答都使用 MessagePack。
+    """
+    encode = packb if binary else encode_json
+    handler = OPERATIONS.get(operation)
+    if handler is None:
+        return [encode({"error": "Not found"})]
+    if binary:
+        try:
+            request_data = unpackb(payload) if payload else {}
+        except ValueError:
+            return [encode({"error": "Invalid MessagePack"})]
+    try:
+        if not binary:
+            request_data = json.loads(payload.decode('utf-8')) if payload else {}
+        return encode_reply(handler(request_data), chunk_size, binary)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return [encode({"error": "Invalid JSON"})]
+    except Exception as e:
+        logger.error(f"Error handling NATS request {operation}: {e}")
+        return [encode({"error": "Internal server error"})]
+
+
+class NatsRequestService:
+    """在已有的 NATS 连接上订阅请求主题，处理函数在线程池中执行，不阻塞推送循环"""
+
+    def __init__(self, nc, prefix: str = config.NATS_REQUEST_PREFIX, queue: str = config.NATS_REQUEST_QUEUE,
+                 workers: int = config.NATS_REQUEST_WORKERS, chunk_size: int = config.NATS_REPLY_CHUNK_SIZE):
+        self.nc = nc
+        self.prefix = prefix
+        self.queue = queue
+        self.workers = max(workers, 1)
+        # 分块大小不能超过服务器允许的最大消息长度，留出消息头的余量
+        max_payload = getattr(nc, 'max_payload', 0) or chunk_size
+        self.chunk_size = max(min(chunk_size, max_payload - 1024), 1024)
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.subscription = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    async def start(self):
+        """订阅 <前缀>.>（<前缀>.<操作> 与 <前缀>.<操作>.msgpack）"""
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='nats-request')
+        # 正在处理的请求数达到上限时回调等待，后续请求留在订阅的待处理队列中
+        self._slots = asyncio.Semaphore(self.workers * 2)
+        self.subscription = await self.nc.subscribe(f"{self.prefix}.>", queue=self.queue, cb=self._on_request)
+        logger.info(f"Serving NATS requests on {self.prefix}.> (queue {self.queue})")
+
+    async def rebind(self, nc):
+        """连接被替换（旧连接关闭后重新建立）时在新连接上重新订阅，用作 NatsPushService 的 connect_callbacks
+
+        旧连接关闭后其上的订阅随之失效，不需要取消。
+        """
+        if nc is self.nc or self.executor is None:
+            return
+        self.nc = nc
+        self.subscription = None
+        self.subscription = await nc.subscribe(f"{self.prefix}.>", queue=self.queue, cb=self._on_request)
+        logger.info(f"Re-subscribed NATS requests on {self.prefix}.> after reconnecting")
+
+    async def close(self):
+        """取消订阅，等待正在处理的请求完成"""
+        if self.subscription is not None:
+            try:
+                await self.subscription.unsubscribe()
+            except Exception as e:
+                logger.warning(f"Error unsubscribing NATS requests: {e}")
+            self.subscription = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    async def _on_request(self, msg):
+        if not msg.reply:
+            return
+        await self._slots.acquire()
+        task = asyncio.create_task(self._respond(msg))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def _respond(self, msg):
+        started = time.perf_counter()
+        operation, _, suffix = msg.subject[len(self.prefix) + 1:].partition('.')
+        if suffix not in ('', MSGPACK_SUFFIX):
+            operation = ''
+        label = operation if operation in OPERATIONS else 'other'
+        status = 'ok'
+        try:
+            loop = asyncio.get_running_loop()
+            chunks = await loop.run_in_executor(self.executor, handle_request, operation, msg.data,
+                                                self.chunk_size, suffix == MSGPACK_SUFFIX)
+            await self.reply(msg.reply, chunks)
+        except Exception as e:
+            status = 'error'
+            logger.error(f"Error replying to NATS request {operation}: {e}")
+        REQUESTS.labels(label, status).inc()
+        REQUEST_DURATION.labels(label).observe(time.perf_counter() - started)
+
+    async def reply(self, subject: str, chunks: List[bytes]):
+        """发送应答，只有一块时发送普通应答"""
+        if len(chunks) == 1:
+            await self.nc.publish(subject, chunks[0])
+            return
+        last = len(chunks) - 1
+        for index, chunk in enumerate(chunks):
+            headers = {CHUNK_HEADER: str(index)}
+            if index == last:
+                headers[LAST_CHUNK_HEADER] = '1'
+            await self.nc.publish(subject, chunk, headers=headers)
+
+
+async def request(nc, operation: str, data: Any, prefix: str = config.NATS_REQUEST_PREFIX,
+                  timeout: float = 5.0, binary: bool = False) -> Any:
+    """客户端示例：发送请求并拼接分块应答，返回解码后的 JSON；binary 为 True 时使用 MessagePack"""
+    inbox = nc.new_inbox()
+    subscription = await nc.subscribe(inbox)
+    try:
+        if binary:
+            await nc.publish(f"{prefix}.{operation}.{MSGPACK_SUFFIX}", packb(data), reply=inbox)
+        else:
+            await nc.publish(f"{prefix}.{operation}", json.dumps(data).encode('utf-8'), reply=inbox)
+        chunks = []
+        while True:
+            msg = await subscription.next_msg(timeout=timeout)
+            chunks.append(msg.data)
+            headers = msg.headers or {}
+            if CHUNK_HEADER not in headers or LAST_CHUNK_HEADER in headers:
+                break
+    finally:
+        await subscription.unsubscribe()
+    body = b''.join(chunks)
+    return unpackb(body) if binary else json.loads(body.decode('utf-8'))
\ No newline at end of file
@@ -2,42 +2,288 @@ import asyncio
 import json
 import random
 import logging
+import time
 from datetime import datetime
-from typing import Optional
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import nats
 from nats.aio.client import Client as NATS
-from models import ValueItem
+from models import ValueItem, ValueItemEncoder, ValueItemPacker, JSON, MSGPACK
+from msgpack_codec import array_header
+from realtime_store import LatestValueStore, latest_values
+from history_store import HistoryStore, history_store
+from metrics import Counter, Gauge
+from catalog import ScheduleGroup, TagCatalog, load_catalog
+from scheduler import TickScheduler
+from deadband import DeadbandFilter
+from replay_buffer import ReplayBuffer
+import config
 
 logger = logging.getLogger(__name__)
 
+# 发布模式：tag 每个测点一条消息；device 每个设备一条消息；tick 每轮一条消息
+PUBLISH_MODES = ("tag", "device", "tick")
+# 消息格式：json；msgpack 为紧凑的二进制格式（见 msgpack_codec）
+PAYLOAD_FORMATS = (JSON, MSGPACK)
+
+PUBLISHED = Counter('nats_published_messages_total', 'Messages published to NATS.')
+PUBLISHED_BYTES = Counter('nats_published_bytes_total', 'Payload bytes published to NATS.')
+PUBLISH_ERRORS = Counter('nats_publish_errors_total', 'Failed NATS publish or flush calls.')
+SUPPRESSED = Counter('nats_suppressed_values_total', 'Tag values not published because they stayed within the deadband.')
+CONNECTED = Gauge('nats_connected', 'Whether the push service is currently connected to NATS.')
+BUFFERED = Gauge('nats_buffer_values', 'Values held in the replay buffer while NATS is unavailable.')
+BUFFER_DROPPED = Counter('nats_buffer_dropped_total', 'Values dropped because the replay buffer was full.')
+REPLAYED = Counter('nats_replayed_values_total', 'Buffered values published after reconnecting.')
+
+
+def _join_json(payloads: List[bytes]) -> bytes:
+    return b"[" + b", ".join(payloads) + b"]"
+
+
+def _join_msgpack(payloads: List[bytes]) -> bytes:
+    return array_header(len(payloads)) + b"".join(payloads)
+
 
 class NatsPushService:
-    def __init__(self, nats_url: str = "nats://127.0.0.1:4222"):
+    def __init__(self, nats_url: str = "nats://127.0.0.1:4222", store: LatestValueStore = latest_values,
+                 history: HistoryStore = history_store, subject_prefix: str = config.NATS_SUBJECT_PREFIX,
+                 publish_mode: str = config.NATS_PUBLISH_MODE,
+                 flush_timeout: float = config.NATS_FLUSH_TIMEOUT,
+                 catalog: Optional[TagCatalog] = None, shard: int = 0, shards: int = 1,
+                 report_by_exception: bool = config.NATS_REPORT_BY_EXCEPTION,
+                 buffer_size: int = config.NATS_BUFFER_SIZE, buffer_policy: str = config.NATS_BUFFER_POLICY,
+                 replay_batch_size: int = config.NATS_REPLAY_BATCH_SIZE,
+                 payload_format: str = config.NATS_PAYLOAD_FORMAT):
+        if publish_mode not in PUBLISH_MODES:
+            raise ValueError(f"Invalid publish mode: {publish_mode}")
+        if payload_format not in PAYLOAD_FORMATS:
+            raise ValueError(f"Invalid payload format: {payload_format}")
         self.nats_url = nats_url
+        self.store = store
+        self.history = history
+        self.subject_prefix = subject_prefix
+        self.publish_mode = publish_mode
+        self.flush_timeout = flush_timeout
+        # 只发布本分片负责的测点
+        self.shard = shard
+        self.shards = shards
+        self.catalog = (catalog if catalog is not None else load_catalog()).shard(shard, shards)
+        self.report_by_exception = report_by_exception
+        self.payload_format = payload_format
+        self.encoder = ValueItemEncoder()
+        self.packer = ValueItemPacker()
+        self._subjects: Dict[str, str] = {}
+        # 断线期间的数据暂存在重放缓冲区，重新连上后按原顺序分批发布
+        self.buffer = ReplayBuffer(buffer_size, buffer_policy)
+        self.replay_batch_size = max(replay_batch_size, 1)
         self.nc: Optional[NATS] = None
+        # 建立新连接后依次调用（例如请求-应答服务在新连接上重新订阅）；客户端自动重连时连接不变，不调用
+        self.connect_callbacks: List[Callable[[NATS], Awaitable[None]]] = []
         self.random = random.Random()
         self.push_task: Optional[asyncio.Task] = None
+        self.replay_task: Optional[asyncio.Task] = None
+        self.reconnect_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._drop_logged = False
+
+    @property
+    def connected(self) -> bool:
+        return self.nc is not None and self.nc.is_connected
 
     async def connect(self):
-        """连接到 NATS 服务器"""
+        """连接到 NATS 服务器，失败时立即抛出异常（重试见 connect_with_retry）
+
+        连接建立后由客户端负责断线重连（不限次数），断线期间的数据进入重放缓冲区。
+        """
         try:
-            self.nc = await nats.connect(self.nats_url)
+            # 首次连接只让客户端内部重试一次，失败时抛出异常，由调用方按退避间隔重试；
+            # 连上之后再改为不限次数的自动重连
+            nc = await nats.connect(self.nats_url, allow_reconnect=False, max_reconnect_attempts=1,
+                                    reconnect_time_wait=config.NATS_RECONNECT_WAIT,
+                                    error_cb=self._on_error, disconnected_cb=self._on_disconnected,
+                                    reconnected_cb=self._on_reconnected, closed_cb=self._on_closed)
+            nc.options["allow_reconnect"] = True
+            nc.options["max_reconnect_attempts"] = -1
+            self.nc = nc
+            CONNECTED.set(1)
             logger.info("Connected to NATS server")
+            self._start_replay()
         except Exception as e:
             logger.error(f"Failed to connect to NATS: {e}")
             raise
+        for callback in self.connect_callbacks:
+            try:
+                await callback(nc)
+            except Exception as e:
+                logger.error(f"Error in NATS connect callback: {e}")
 
+    async def connect_with_retry(self):
+        """连接 NATS，失败时按指数退避（带随机抖动）重试，直到连接成功或任务被取消"""
+        wait = config.NATS_RECONNECT_WAIT
+        while True:
+            try:
+                await self.connect()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                delay = wait * self.random.uniform(0.5, 1.0)
+                logger.info(f"Retrying NATS connection in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                wait = min(wait * 2, config.NATS_RECONNECT_MAX_WAIT)
 
+    async def _on_error(self, e: Exception):
+        logger.warning(f"NATS error: {e}")
+
+    async def _on_disconnected(self):
+        CONNECTED.set(0)
+        if not self._closing:
+            logger.warning("Disconnected from NATS, buffering values until reconnected")
+
+    async def _on_reconnected(self):
+        CONNECTED.set(1)
+        logger.info("Reconnected to NATS server")
+        self._start_replay()
+
+    async def _on_closed(self):
+        CONNECTED.set(0)
+        if self._closing:
+            return
+        # 连接被关闭（例如认证失败）后不会再自动重连，重新建立连接
+        logger.warning("NATS connection closed unexpectedly, reconnecting")
+        if self.reconnect_task is None or self.reconnect_task.done():
+            self.reconnect_task = asyncio.create_task(self.connect_with_retry())
 
     async def push_realtime_value(self, item: ValueItem):
-        """推送实时数据到 NATS"""
-        if self.nc:
-            try:
-                payload = item.to_json().encode('utf-8')
-                subject = f"rtdb.iotopo.{item.tag}"
-                await self.nc.publish(subject, payload)
-            except Exception as e:
-                logger.error(f"Error publishing to NATS: {e}")
+        """推送实时数据到 NATS，未连接时进入重放缓冲区"""
+        if not self.connected or len(self.buffer):
+            self._buffer([item])
+            self._start_replay()
+            return
+        try:
+            payload = item.to_msgpack() if self.payload_format == MSGPACK else item.to_json().encode('utf-8')
+            subject = f"{self.subject_prefix}.{item.tag}"
+            await self.nc.publish(subject, payload)
+            PUBLISHED.inc()
+            PUBLISHED_BYTES.inc(len(payload))
+        except Exception as e:
+            PUBLISH_ERRORS.inc()
+            logger.error(f"Error publishing to NATS: {e}")
+            self._buffer([item])
+
+    def encode_batch(self, items: List[ValueItem]) -> List[Tuple[str, bytes]]:
+        """将一轮数据按发布模式一次性编码为 (subject, payload) 列表
+
+        内容与 ValueItem.to_json（msgpack 格式时为 to_msgpack）完全一致；标签的主题和编码前缀在首次出现后缓存，
+        同一时间戳只格式化一次（见 models.ValueItemEncoder、ValueItemPacker）。
+        device / tick 模式的消息为这些测点值组成的数组。
+        """
+        prefix = self.subject_prefix
+        if self.payload_format == MSGPACK:
+            encoded = self.packer.encode(items)
+            join = _join_msgpack
+        else:
+            encoded = [text.encode('utf-8') for text in self.encoder.encode(items)]
+            join = _join_json
+
+        if self.publish_mode == "tag":
+            subjects = self._subjects
+            messages = []
+            for item, payload in zip(items, encoded):
+                subject = subjects.get(item.tag)
+                if subject is None:
+                    subject = subjects[item.tag] = f"{prefix}.{item.tag}"
+                messages.append((subject, payload))
+            return messages
+
+        if self.publish_mode == "tick":
+            return [(f"{prefix}.tick", join(encoded))]
+
+        # device 模式：测点按所属设备（去掉最后一段的标签）分组
+        groups: Dict[str, List[bytes]] = {}
+        for item, payload in zip(items, encoded):
+            device = item.tag.rpartition('.')[0] or item.tag
+            groups.setdefault(device, []).append(payload)
+        return [(f"{prefix}.device.{device}", join(payloads)) for device, payloads in groups.items()]
+
+    async def push_batch(self, items: List[ValueItem]):
+        """批量推送一轮实时数据，全部写入发送缓冲区后只 flush 一次
+
+        未连接、或缓冲区中还有待重放的数据时追加到缓冲区，保证订阅方按时间顺序收到数据；
+        发布失败的整批数据也放入缓冲区，重放时可能重复发送其中已经发出的部分。
+        """
+        if not items:
+            return
+        if not self.connected or len(self.buffer):
+            self._buffer(items)
+            self._start_replay()
+            return
+        if not await self._publish(items):
+            self._buffer(items)
+
+    async def _publish(self, items: List[ValueItem]) -> bool:
+        """编码并发布一批数据，成功返回 True"""
+        messages = self.encode_batch(items)
+        publish = self.nc.publish
+        try:
+            # publish 只写入客户端缓冲区，不等待网络往返
+            for subject, payload in messages:
+                await publish(subject, payload)
+            await self.nc.flush(timeout=self.flush_timeout)
+        except Exception as e:
+            PUBLISH_ERRORS.inc()
+            logger.error(f"Error publishing batch to NATS: {e}")
+            return False
+        PUBLISHED.inc(len(messages))
+        PUBLISHED_BYTES.inc(sum([len(payload) for _, payload in messages]))
+        return True
+
+    def _buffer(self, items: List[ValueItem]):
+        dropped = self.buffer.extend(items)
+        BUFFERED.set(len(self.buffer))
+        if dropped:
+            BUFFER_DROPPED.inc(dropped)
+            if not self._drop_logged:
+                # 每次断线只告警一次，丢弃总数见 nats_buffer_dropped_total
+                self._drop_logged = True
+                logger.warning(f"NATS replay buffer full ({self.buffer.capacity} values, "
+                               f"policy {self.buffer.policy}), dropping values")
+
+    def _start_replay(self):
+        if len(self.buffer) and self.connected and (self.replay_task is None or self.replay_task.done()):
+            self.replay_task = asyncio.create_task(self._replay())
+
+    async def _replay(self):
+        """按原顺序分批发布缓冲区中的数据；期间新产生的数据继续追加到缓冲区末尾"""
+        logger.info(f"Replaying {len(self.buffer)} buffered values")
+        replayed = 0
+        while len(self.buffer) and self.connected:
+            batch = self.buffer.take(self.replay_batch_size)
+            if not await self._publish(batch):
+                # 放回缓冲区，下一轮推送时再次重放
+                dropped = self.buffer.restore(batch)
+                BUFFER_DROPPED.inc(dropped)
+                break
+            replayed += len(batch)
+            REPLAYED.inc(len(batch))
+            BUFFERED.set(len(self.buffer))
+        BUFFERED.set(len(self.buffer))
+        if not len(self.buffer):
+            self._drop_logged = False
+            logger.info(f"Replayed {replayed} buffered values")
+
+    async def publish_tick(self, items: List[ValueItem], changes: Optional[DeadbandFilter] = None):
+        """处理一轮数据：先更新最新值表和历史数据，供 find_last / query_history 查询，再推送
+
+        给出 changes 时只推送其中选出的测点（按变化发布），最新值表和历史数据仍记录全部测点。
+        """
+        self.store.update_many(items)
+        self.history.append_many(items)
+        if changes is not None:
+            selected = changes.select(items, time.monotonic())
+            SUPPRESSED.inc(len(items) - len(selected))
+            items = selected
+        await self.push_batch(items)
 
     async def start_realtime_push(self):
         """开始实时数据推送"""
@@ -58,30 +304,47 @@ class NatsPushService:
             logger.info("Stopped realtime data push")
 
     async def _push_loop(self):
-        """推送循环"""
-        while True:
-            try:
-                now = datetime.now()
-                for i in range(3):
-                    for j in range(10):
-                        # 生成1-100之间的随机数
-                        value = self.random.uniform(1, 100)
-                        tag = f"group{i+1}.dev{j+1}.a"
-                        
-                        item = ValueItem(tag, now, value, 1)
-                        await self.push_realtime_value(item)
-                
-                # 每秒推送一次
-                await asyncio.sleep(1)
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"Error in push loop: {e}")
-                await asyncio.sleep(1)
+        """推送循环：测点目录中的每个调度组一个任务，各自按截止时间对齐的周期发布"""
+        groups = [group for group in self.catalog.groups if group.tags]
+        logger.info(f"Pushing {len(self.catalog)} tags in {len(groups)} schedule groups "
+                    f"(shard {self.shard + 1}/{self.shards})")
+        tasks = [asyncio.create_task(TickScheduler(group.name, group.period,
+                                                   partial(self._tick, group, self._filter(group))).run())
+                 for group in groups]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _filter(self, group: ScheduleGroup) -> Optional[DeadbandFilter]:
+        """调度组的按变化发布过滤器，关闭按变化发布时返回 None"""
+        if not self.report_by_exception:
+            return None
+        return DeadbandFilter(group.tags, group.options)
+
+    async def _tick(self, group: ScheduleGroup, changes: Optional[DeadbandFilter], tick: int):
+        """生成并发布一个调度组的一轮数据"""
+        now = datetime.now()
+        # 生成1-100之间的随机数
+        uniform = self.random.uniform
+        items = [ValueItem(tag, now, uniform(1, 100), 1) for tag in group.tags]
+        await self.publish_tick(items, changes)
 
     async def close(self):
         """关闭 NATS 连接"""
+        self._closing = True
         await self.stop_realtime_push()
+        for task in (self.replay_task, self.reconnect_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if len(self.buffer):
+            logger.warning(f"Discarding {len(self.buffer)} buffered values that were never published")
         if self.nc:
             await self.nc.close()
             logger.info("NATS connection closed") 
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+多项目
+
+一个适配器可以同时服务多个项目，请求中的 projectID 决定访问哪个项目的数据：每个项目有独立的
+测点目录、最新值表、历史数据、历史查询结果缓存、设备树和写值流水线，NATS 推送使用各自的主题前缀。
+一个项目的测点再多、历史查询再重，也不会增加其他项目的查询开销或挤掉它们的缓存。
+
+项目在 TOPV_PROJECTS_FILE 指定的 JSON 文件中配置：
+
+    {
+      "default": "plant1",
+      "projects": [
+        {"id": "plant1", "catalog": "plant1-tags.json", "subjectPrefix": "rtdb.plant1"},
+        {"id": "plant2", "catalog": "plant2-tags.json", "historyRetention": 600, "historyCacheSize": 8388608}
+      ]
+    }
+
+- catalog：测点目录文件（格式见 catalog.py），省略时项目没有预定义的测点
+- subjectPrefix：实时数据主题前缀，省略时为 <TOPV_NATS_SUBJECT_PREFIX>.<id>
+- 资源上限 historyRetention、historyCacheSize、writeQueueSize、bufferSize、sharedValuesCapacity
+  分别对应 TOPV_HISTORY_RETENTION、TOPV_HISTORY_CACHE_SIZE、TOPV_WRITE_QUEUE_SIZE、TOPV_NATS_BUFFER_SIZE、
+  TOPV_SHARED_VALUES_CAPACITY，省略时使用全局配置
+
+请求不带 projectID 时使用 default 指定的项目，未指定 default 或 projectID 不存在时返回错误。
+配置了 TOPV_HISTORY_DATA_DIR 时，各项目的段文件在其下以项目 ID 命名的子目录中。
+
+未配置项目文件时只有一个默认项目，使用全局的存储和配置，任何 projectID 都路由到它，与单项目部署的行为一致。
+"""
+
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional
+from catalog import TagCatalog, load_catalog
+from realtime_store import create_latest_values, latest_values
+from history_store import HistoryStore, history_store
+from segment_store import SegmentStore
+from history_cache import HistoryCache, history_cache
+from device_tree import DeviceTree, device_tree
+from write_pipeline import LatestValueSink, WritePipeline, write_pipeline
+import config
+
+DEFAULT_PROJECT = "default"
+
+
+class Project:
+    """一个项目的全部数据和资源上限"""
+
+    def __init__(self, project_id: str, catalog_file: Optional[str], subject_prefix: str,
+                 latest_values, history: HistoryStore, history_cache: HistoryCache,
+                 device_tree: DeviceTree, write_pipeline: WritePipeline,
+                 buffer_size: int = config.NATS_BUFFER_SIZE):
+        self.id = project_id
+        # None 表示按全局配置加载，空字符串表示没有预定义的测点
+        self.catalog_file = catalog_file
+        self.subject_prefix = subject_prefix
+        self.latest_values = latest_values
+        self.history = history
+        self.history_cache = history_cache
+        self.device_tree = device_tree
+        self.write_pipeline = write_pipeline
+        self.buffer_size = buffer_size
+
+    def __repr__(self) -> str:
+        return f"Project({self.id!r}, subject_prefix={self.subject_prefix!r})"
+
+    @classmethod
+    def from_dict(cls, entry: Dict[str, Any]) -> 'Project':
+        """按项目文件中的一项创建独立的存储"""
+        project_id = entry.get("id")
+        if not isinstance(project_id, str) or not project_id:
+            raise ValueError(f"Invalid project id: {project_id}")
+        catalog_file = entry.get("catalog") or ""
+        segments = None
+        if config.HISTORY_DATA_DIR:
+            segments = SegmentStore(os.path.join(config.HISTORY_DATA_DIR, project_id),
+                                    config.HISTORY_SEGMENT_WINDOW, config.HISTORY_FLUSH_INTERVAL,
+                                    config.HISTORY_MAX_OPEN_FILES)
+        store = create_latest_values(int(entry.get("sharedValuesCapacity", config.SHARED_VALUES_CAPACITY)))
+        return cls(
+            project_id,
+            catalog_file,
+            entry.get("subjectPrefix") or f"{config.NATS_SUBJECT_PREFIX}.{project_id}",
+            store,
+            HistoryStore(int(entry.get("historyRetention", config.HISTORY_RETENTION)), segments),
+            HistoryCache(int(entry.get("historyCacheSize", config.HISTORY_CACHE_SIZE))),
+            DeviceTree(path=catalog_file) if catalog_file else DeviceTree(catalog=TagCatalog([])),
+            WritePipeline(LatestValueSink(store), int(entry.get("writeQueueSize", config.WRITE_QUEUE_SIZE)),
+                          config.WRITE_FLUSH_INTERVAL, config.WRITE_BATCH_SIZE),
+            int(entry.get("bufferSize", config.NATS_BUFFER_SIZE)),
+        )
+
+    def load_catalog(self) -> TagCatalog:
+        """推送循环使用的测点目录"""
+        if self.catalog_file == "":
+            return TagCatalog([])
+        return load_catalog(self.catalog_file)
+
+    def close(self):
+        """下发尚未处理的写值请求，写出尚未落盘的历史数据"""
+        self.write_pipeline.close(timeout=5.0)
+        self.history.close()
+
+
+class ProjectRegistry:
+    """projectID -> 项目
+
+    strict 为 False 时（未配置项目文件）任何 projectID 都路由到默认项目。
+    """
+
+    def __init__(self, projects: List[Project], default: Optional[str] = None, strict: bool = True):
+        self._projects: Dict[str, Project] = {}
+        for project in projects:
+            if project.id in self._projects:
+                raise ValueError(f"Duplicate project id: {project.id}")
+            self._projects[project.id] = project
+        if default is not None and default not in self._projects:
+            raise ValueError(f"Unknown default project: {default}")
+        self.default = self._projects[default] if default is not None else None
+        self.strict = strict
+
+    def __len__(self) -> int:
+        return len(self._projects)
+
+    def __iter__(self) -> Iterator[Project]:
+        return iter(list(self._projects.values()))
+
+    def get(self, project_id: Any) -> Project:
+        """按 projectID 查找项目，找不到时抛出 ValueError"""
+        if project_id is None or project_id == "":
+            if self.default is None:
+                raise ValueError("Missing projectID")
+            return self.default
+        project = self._projects.get(project_id) if isinstance(project_id, str) else None
+        if project is None:
+            if self.strict or self.default is None:
+                raise ValueError(f"Unknown project: {project_id}")
+            return self.default
+        return project
+
+
+def default_project() -> Project:
+    """使用全局存储和配置的单个项目；多进程模式下最新值表换成共享内存表"""
+    store, pipeline = latest_values, write_pipeline
+    if config.HTTP_PROCESSES > 1:
+        store = create_latest_values()
+        pipeline = WritePipeline(LatestValueSink(store), config.WRITE_QUEUE_SIZE,
+                                 config.WRITE_FLUSH_INTERVAL, config.WRITE_BATCH_SIZE)
+    return Project(DEFAULT_PROJECT, None, config.NATS_SUBJECT_PREFIX, store, history_store,
+                   history_cache, device_tree, pipeline)
+
+
+def load_projects(path: Optional[str] = None) -> ProjectRegistry:
+    """按配置加载项目：配置了项目文件时从文件加载，否则只有默认项目"""
+    path = path if path is not None else config.PROJECTS_FILE
+    if not path:
+        return ProjectRegistry([default_project()], DEFAULT_PROJECT, strict=False)
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    projects = [Project.from_dict(entry) for entry in data.get("projects", [])]
+    if not projects:
+        raise ValueError(f"No projects configured in {path}")
+    return ProjectRegistry(projects, data.get("default"))
+
+
+# 进程内共享的项目表；多进程模式下各项目的共享内存最新值表在 fork 之前随之创建
+projects = load_projects()
\ No newline at end of file
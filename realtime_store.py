@@ -0,0 +1,95 @@
+"""
+实时数据存储
+
+保存每个测点的最新值，由 NATS 推送循环写入，find_last 读取。
+按标签查询为一次字典查找；同时维护前缀索引（每个上级标签 -> 其下全部测点），
+按设备查询的开销只与返回的测点数相关，而与测点总数无关。
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+from models import ValueItem
+import config
+
+
+def parent_tags(tag: str) -> List[str]:
+    """返回标签的全部上级标签，例如 group1.dev1.a -> [group1, group1.dev1]"""
+    parts = tag.split('.')
+    return ['.'.join(parts[:i]) for i in range(1, len(parts))]
+
+
+class LatestValueStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, ValueItem] = {}
+        # 上级标签 -> 下属测点（dict 保持插入顺序，用作有序集合）
+        self._children: Dict[str, Dict[str, None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _index(self, tag: str):
+        """为新测点建立前缀索引，调用方需持有锁"""
+        for prefix in parent_tags(tag):
+            self._children.setdefault(prefix, {})[tag] = None
+
+    def update(self, item: ValueItem):
+        """写入单个测点的最新值"""
+        with self._lock:
+            if item.tag not in self._values:
+                self._index(item.tag)
+            self._values[item.tag] = item
+
+    def update_many(self, items: Iterable[ValueItem]) -> List[str]:
+        """批量写入最新值，整批只加一次锁；返回未能写入的标签（内存表总能写入，为空）"""
+        with self._lock:
+            values = self._values
+            for item in items:
+                if item.tag not in values:
+                    self._index(item.tag)
+                values[item.tag] = item
+        return []
+
+    def check(self, tag: str, value: Any) -> Optional[str]:
+        """检查值能否写入，能写入时返回 None，否则返回原因（内存表总能写入）"""
+        return None
+
+    def get(self, tag: str) -> Optional[ValueItem]:
+        """查询单个测点的最新值，不存在时返回 None"""
+        return self._values.get(tag)
+
+    def get_device(self, device_tag: str) -> List[ValueItem]:
+        """查询设备标签下全部测点的最新值"""
+        with self._lock:
+            values = self._values
+            return [values[tag] for tag in self._children.get(device_tag, ())]
+
+    def remove(self, tag: str):
+        """删除测点及其前缀索引"""
+        with self._lock:
+            if self._values.pop(tag, None) is None:
+                return
+            for prefix in parent_tags(tag):
+                children = self._children.get(prefix)
+                if children is not None:
+                    children.pop(tag, None)
+                    if not children:
+                        del self._children[prefix]
+
+    def clear(self):
+        """清空全部数据"""
+        with self._lock:
+            self._values.clear()
+            self._children.clear()
+
+
+def create_latest_values(capacity: int = config.SHARED_VALUES_CAPACITY):
+    """多进程模式下最新值表放在共享内存中（最多 capacity 个测点），由主进程在 fork 之前创建"""
+    if config.HTTP_PROCESSES > 1:
+        from shared_values import SharedLatestValueStore
+        return SharedLatestValueStore(capacity)
+    return LatestValueStore()
+
+
+# 进程内共享的最新值表；多进程模式下的共享内存表由 projects 按项目创建，不在导入时创建
+latest_values = LatestValueStore()
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+断线重放缓冲区
+
+与 NATS 断开期间要发布的数据暂存在内存中，重新连上后按原顺序分批重放。
+缓冲区按测点值个数限定容量，满了以后按策略丢弃：
+
+- drop_oldest：丢弃最早的数据，保留最近的一段（默认）
+- drop_newest：不再接收新数据，保留断线开始后的一段
+- latest：每个测点只保留最新值，容量为测点个数，超出时丢弃最早更新的测点
+"""
+
+from collections import OrderedDict, deque
+from typing import Iterable, List
+from models import ValueItem
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+KEEP_LATEST = "latest"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, KEEP_LATEST)
+
+
+class ReplayBuffer:
+    """有界缓冲区，只在事件循环中使用，不加锁"""
+
+    def __init__(self, capacity: int, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Invalid buffer policy: {policy}")
+        self.capacity = max(capacity, 0)
+        self.policy = policy
+        self.dropped = 0
+        if policy == KEEP_LATEST:
+            self._latest: 'OrderedDict[str, ValueItem]' = OrderedDict()
+        else:
+            self._queue: deque = deque()
+
+    def __len__(self) -> int:
+        return len(self._latest) if self.policy == KEEP_LATEST else len(self._queue)
+
+    def extend(self, items: Iterable[ValueItem]) -> int:
+        """追加数据，返回因容量不足丢弃的个数"""
+        before = self.dropped
+        if self.policy == KEEP_LATEST:
+            latest = self._latest
+            for item in items:
+                if item.tag in latest:
+                    # 原位置更新，已经在缓冲区中的测点不会因为更新而排到后面
+                    latest[item.tag] = item
+                    continue
+                if len(latest) >= self.capacity:
+                    if not self.capacity:
+                        self.dropped += 1
+                        continue
+                    latest.popitem(last=False)
+                    self.dropped += 1
+                latest[item.tag] = item
+        elif self.policy == DROP_NEWEST:
+            queue = self._queue
+            for item in items:
+                if len(queue) >= self.capacity:
+                    self.dropped += 1
+                else:
+                    queue.append(item)
+        else:
+            queue = self._queue
+            queue.extend(items)
+            overflow = len(queue) - self.capacity
+            if overflow > 0:
+                for _ in range(overflow):
+                    queue.popleft()
+                self.dropped += overflow
+        return self.dropped - before
+
+    def take(self, count: int) -> List[ValueItem]:
+        """从头部取出最多 count 个数据"""
+        if self.policy == KEEP_LATEST:
+            latest = self._latest
+            return [latest.popitem(last=False)[1] for _ in range(min(count, len(latest)))]
+        queue = self._queue
+        return [queue.popleft() for _ in range(min(count, len(queue)))]
+
+    def restore(self, items: List[ValueItem]) -> int:
+        """重放失败时把取出的数据放回头部，返回因容量不足丢弃的个数"""
+        before = self.dropped
+        if self.policy == KEEP_LATEST:
+            latest = self._latest
+            for item in reversed(items):
+                # 断线期间又有了更新的值时保留更新的值
+                if item.tag not in latest:
+                    latest[item.tag] = item
+                    latest.move_to_end(item.tag, last=False)
+            while len(latest) > self.capacity:
+                latest.popitem(last=False)
+                self.dropped += 1
+        else:
+            queue = self._queue
+            queue.extendleft(reversed(items))
+            overflow = len(queue) - self.capacity
+            # 与追加时的策略一致：drop_oldest 丢头部，drop_newest 丢尾部
+            drop = queue.popleft if self.policy == DROP_OLDEST else queue.pop
+            for _ in range(max(overflow, 0)):
+                drop()
+            self.dropped += max(overflow, 0)
+        return self.dropped - before
\ No newline at end of file
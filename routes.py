@@ -0,0 +1,333 @@
+"""
+HTTP 路由分发
+
+同步 (http.server) 与异步 (asyncio) 两种服务模式共用这里的路由表和响应编码，
+保证两种模式下接口行为完全一致。
+"""
+
+import json
+import logging
+import math
+import time
+from typing import Any, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+from urllib.parse import parse_qs
+from models import CachedJson, HistoryResponse, JsonModel, dumps
+from msgpack_codec import (CONTENT_TYPE as MSGPACK_CONTENT_TYPE, accepts as accepts_msgpack,
+                           is_content_type as is_msgpack, packb, unpackb)
+from compression import choose_encoding, compress, compress_chunks
+from api_handler import find_last, set_value, query_history, query_points, query_devices
+from write_pipeline import WRITE_BUSY
+from admission import Overloaded
+from access_log import log_access
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, SIZE_BUCKETS, Counter, Gauge, Histogram
+import config
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "topv-adaptor-python"
+
+JSON_CONTENT_TYPE = 'application/json'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# 路由表：路径 -> 处理函数
+GET_ROUTES = {
+    '/api/find_last': find_last,
+    '/api/query_points': query_points,
+    '/api/query_devices': query_devices,
+}
+
+POST_ROUTES = {
+    '/api/set_value': set_value,
+    '/api/query_history': query_history,
+}
+
+# 指标中的 route 标签只取已知路径，避免任意路径导致标签数量无限增长
+KNOWN_PATHS = frozenset(GET_ROUTES) | frozenset(POST_ROUTES) | {'/health', '/metrics'}
+KNOWN_METHODS = frozenset(('GET', 'POST', 'OPTIONS'))
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests by route, method and status.',
+                   ('route', 'method', 'status'))
+REQUEST_DURATION = Histogram('http_request_duration_seconds',
+                             'Time from dispatch to the last response byte being produced.', ('route',))
+RESPONSE_BYTES = Histogram('http_response_bytes', 'Response body size in bytes (after compression).',
+                           ('route',), buckets=SIZE_BUCKETS)
+IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests currently being handled, including open streams.')
+
+CORS_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type, If-None-Match'),
+    ('Access-Control-Expose-Headers', 'ETag'),
+)
+
+
+class Response:
+    """HTTP 响应
+
+    body 为完整响应体；chunks 不为 None 时表示流式响应，按顺序输出各个片段。
+    body 来自缓存的编码结果时 cached 指向它，压缩结果可以复用。
+    """
+    __slots__ = ('status', 'content_type', 'body', 'chunks', 'headers', 'cached')
+
+    def __init__(self, status: int = 200, body: Optional[bytes] = None,
+                 content_type: str = JSON_CONTENT_TYPE, chunks: Optional[Iterator[bytes]] = None,
+                 headers: Optional[List[Tuple[str, str]]] = None, cached: Optional[CachedJson] = None):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.chunks = chunks
+        self.headers = headers or []
+        self.cached = cached
+
+    @property
+    def streaming(self) -> bool:
+        return self.chunks is not None
+
+    def close(self):
+        """释放未输出完的流式响应（例如客户端已断开）"""
+        if self.chunks is not None and hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+
+def encode_json(data: Any) -> bytes:
+    """将响应数据编码为 UTF-8 JSON，模型对象直接编码，不经过中间字典"""
+    if isinstance(data, JsonModel):
+        return data.to_json_bytes()
+    return dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def json_response(data: Any, status: int = 200) -> Response:
+    return Response(status, encode_json(data))
+
+
+def data_response(data: Any, status: int = 200, binary: bool = False) -> Response:
+    """按协商的格式编码响应：binary 为 True 时为 MessagePack，否则为 JSON"""
+    if binary:
+        return Response(status, packb(data), content_type=MSGPACK_CONTENT_TYPE)
+    return json_response(data, status)
+
+
+def iter_chunks(parts: Iterable[Union[str, bytes]], chunk_size: int) -> Iterator[bytes]:
+    """将字符串（按 UTF-8 编码）或字节片段合并为约 chunk_size 字节的块输出，第一个片段立即输出"""
+    buffer = []
+    size = 0
+    first = True
+    for part in parts:
+        data = part.encode('utf-8') if isinstance(part, str) else part
+        if first:
+            first = False
+            yield data
+            continue
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _wants_stream(headers: Mapping[str, str], query: str) -> Tuple[bool, bool]:
+    """判断是否使用流式响应，返回 (是否流式, 是否 NDJSON)"""
+    accept = (headers.get('accept') or '').lower()
+    if NDJSON_CONTENT_TYPE in accept:
+        return True, True
+    params = parse_qs(query)
+    if 'stream' in params:
+        return params['stream'][-1].lower() in ('1', 'true', 'yes'), False
+    return config.HTTP_STREAM_HISTORY, False
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _encode_response(data: Any, headers: Mapping[str, str], query: str, binary: bool = False) -> Response:
+    """编码处理函数的返回值，历史查询结果按请求选择流式输出；binary 为 True 时编码为 MessagePack"""
+    if isinstance(data, CachedJson):
+        # 缓存的编码结果带 ETag，客户端已有相同内容时返回 304；两种格式的 ETag 不同
+        etag = data.etag[:-1] + '-msgpack"' if binary else data.etag
+        if etag_matches(headers.get('if-none-match'), etag):
+            return Response(304, headers=[('ETag', etag)])
+        if binary:
+            return Response(200, data.to_msgpack(), content_type=MSGPACK_CONTENT_TYPE, headers=[('ETag', etag)])
+        return Response(200, data.body, headers=[('ETag', etag)], cached=data)
+    if isinstance(data, HistoryResponse):
+        stream, ndjson = _wants_stream(headers, query)
+        if binary:
+            if stream or ndjson:
+                return Response(200, content_type=MSGPACK_CONTENT_TYPE,
+                                chunks=iter_chunks(data.iter_msgpack(), config.HTTP_STREAM_CHUNK_SIZE))
+            return Response(200, data.to_msgpack(), content_type=MSGPACK_CONTENT_TYPE)
+        if ndjson:
+            return Response(200, content_type=NDJSON_CONTENT_TYPE,
+                            chunks=iter_chunks(data.iter_ndjson(False), config.HTTP_STREAM_CHUNK_SIZE))
+        if stream:
+            return Response(200, chunks=iter_chunks(data.iter_json(False), config.HTTP_STREAM_CHUNK_SIZE))
+    if isinstance(data, dict) and data.get("code") == WRITE_BUSY:
+        # 写值流水线已满：明确告知客户端稍后重试，而不是让请求排队超时
+        response = data_response(data, 503, binary)
+        response.headers.append(('Retry-After', '1'))
+        return response
+    return data_response(data, 200, binary)
+
+
+def negotiate_compression(response: Response, headers: Mapping[str, str]) -> Response:
+    """按 Accept-Encoding 压缩响应；完整响应体小于阈值时保持原样"""
+    if not config.HTTP_COMPRESSION:
+        return response
+    if response.body is None and response.chunks is None:
+        return response
+    if response.chunks is None and len(response.body) < config.HTTP_COMPRESSION_MIN_SIZE:
+        return response
+
+    response.headers.append(('Vary', 'Accept-Encoding'))
+    encoding = choose_encoding(headers.get('accept-encoding'))
+    if encoding is None:
+        return response
+
+    level = config.HTTP_COMPRESSION_LEVEL
+    if response.chunks is not None:
+        response.chunks = compress_chunks(response.chunks, encoding, level)
+    elif response.cached is not None:
+        response.body = response.cached.compressed((encoding, level),
+                                                    lambda body: compress(body, encoding, level))
+    else:
+        response.body = compress(response.body, encoding, level)
+    response.headers.append(('Content-Encoding', encoding))
+    return response
+
+
+def _observe(route: str, method: str, status: int, started: float, size: int, client: str, path: str):
+    """记录请求指标并写访问记录（访问记录中为实际路径）"""
+    log_access(client, method, path, status, started, size)
+    REQUESTS.labels(route, method, str(status)).inc()
+    REQUEST_DURATION.labels(route).observe(time.perf_counter() - started)
+    RESPONSE_BYTES.labels(route).observe(size)
+    IN_FLIGHT.dec()
+
+
+class _ObservedStream:
+    """包装流式响应，输出完毕或被关闭（包括尚未开始输出就被关闭）时记录一次耗时和字节数"""
+
+    def __init__(self, chunks: Iterator[bytes], route: str, method: str, status: int, started: float,
+                 client: str, path: str):
+        self.chunks = chunks
+        self.labels = (route, method, status, started, client, path)
+        self.size = 0
+        self.done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        try:
+            chunk = next(self.chunks)
+        except BaseException:
+            self.close()
+            raise
+        self.size += len(chunk)
+        return chunk
+
+    def close(self):
+        if self.done:
+            return
+        self.done = True
+        try:
+            if hasattr(self.chunks, 'close'):
+                self.chunks.close()
+        finally:
+            route, method, status, started, client, path = self.labels
+            _observe(route, method, status, started, self.size, client, path)
+
+
+def overloaded_response(method: str, path: str, error: Overloaded, client: str = '-') -> Response:
+    """准入控制拒绝的请求（429 / 503，带 Retry-After），同样计入请求指标"""
+    route = path if path in KNOWN_PATHS else 'other'
+    method = method if method in KNOWN_METHODS else 'other'
+    IN_FLIGHT.inc()
+    response = json_response({"error": error.message}, error.status)
+    response.headers.append(('Retry-After', str(max(math.ceil(error.retry_after), 1))))
+    _observe(route, method, response.status, time.perf_counter(), len(response.body), client, path)
+    return response
+
+
+def dispatch(method: str, path: str, body: Optional[bytes],
+             headers: Optional[Mapping[str, str]] = None, query: str = '', client: str = '-') -> Response:
+    """根据请求方法和路径调用对应的处理函数并编码响应，同时记录请求指标和访问记录
+
+    headers 需支持按小写名称查询，client 为访问记录中的客户端地址；OPTIONS 请求的响应没有响应体。
+    """
+    route = path if path in KNOWN_PATHS else 'other'
+    method = method if method in KNOWN_METHODS else 'other'
+    started = time.perf_counter()
+    IN_FLIGHT.inc()
+    try:
+        response = _dispatch(method, path, body, headers if headers is not None else {}, query)
+    except BaseException:
+        _observe(route, method, 500, started, 0, client, path)
+        raise
+    if response.chunks is not None:
+        response.chunks = _ObservedStream(response.chunks, route, method, response.status, started, client, path)
+    else:
+        _observe(route, method, response.status, started, len(response.body or b''), client, path)
+    return response
+
+
+def _dispatch(method: str, path: str, body: Optional[bytes],
+              headers: Mapping[str, str], query: str) -> Response:
+    # Accept 中指定 MessagePack 时 API 响应（包括错误）按 MessagePack 编码，默认为 JSON
+    binary = accepts_msgpack(headers.get('accept'))
+    try:
+        if method == 'OPTIONS':
+            return Response(200)
+
+        if method == 'GET' and path == '/health':
+            return json_response({"status": "healthy", "service": SERVICE_NAME})
+
+        if method == 'GET' and path == '/metrics':
+            return Response(200, REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+        if method == 'GET':
+            routes = GET_ROUTES
+        elif method == 'POST':
+            routes = POST_ROUTES
+        else:
+            return json_response({"error": "Unsupported method"}, 501)
+
+        # GET 请求也可能包含 body；Content-Type 为 MessagePack 时按 MessagePack 解码
+        if is_msgpack(headers.get('content-type')):
+            try:
+                request_data = unpackb(body) if body else {}
+            except ValueError:
+                return data_response({"error": "Invalid MessagePack"}, 400, binary)
+        else:
+            request_data = json.loads(body.decode('utf-8')) if body else {}
+
+        handler = routes.get(path)
+        if handler is None:
+            return data_response({"error": "Not found"}, 404, binary)
+
+        response = _encode_response(handler(request_data), headers, query, binary)
+        # 同一地址按 Accept 返回不同格式，缓存需区分
+        response.headers.append(('Vary', 'Accept'))
+        return negotiate_compression(response, headers)
+
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return data_response({"error": "Invalid JSON"}, 400, binary)
+    except Exception as e:
+        logger.error(f"Error handling {method} request: {e}")
+        return data_response({"error": "Internal server error"}, 500, binary)
\ No newline at end of file
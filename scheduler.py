@@ -0,0 +1,80 @@
+"""
+周期调度
+
+按绝对截止时间对齐的周期任务：第 k 轮的计划时间为 起始时间 + k × 周期，
+每轮结束后睡眠到下一个计划时间，任务本身的耗时不会累积成漂移。
+一轮执行超过周期时立即开始下一轮；落后超过一个周期时，中间已经完全错过的
+计划时间直接跳过并计入 missed，而不是连续补跑造成积压。
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Optional
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+TICK_DURATION = Histogram('nats_tick_duration_seconds', 'Time spent producing and publishing one push tick.',
+                          ('group',))
+TICK_LAG = Gauge('nats_tick_lag_seconds', 'How late the last push tick started relative to its deadline.',
+                 ('group',))
+MISSED_TICKS = Counter('nats_missed_ticks_total', 'Push ticks skipped because the previous tick overran.',
+                       ('group',))
+
+# 错过计划时间的告警最小间隔（秒）
+_WARN_INTERVAL = 60.0
+
+
+class TickScheduler:
+    def __init__(self, name: str, period: float, callback: Callable[[int], Awaitable[None]],
+                 clock: Callable[[], float] = time.monotonic):
+        if period <= 0:
+            raise ValueError(f"Invalid period: {period}")
+        self.name = name
+        self.period = period
+        self.callback = callback
+        self.clock = clock
+        self.ticks = 0
+        self.missed = 0
+        self._duration = TICK_DURATION.labels(name)
+        self._lag = TICK_LAG.labels(name)
+        self._missed = MISSED_TICKS.labels(name)
+        self._last_warning: Optional[float] = None
+
+    async def run(self, start: Optional[float] = None):
+        """持续运行，直到任务被取消；callback 的参数为轮次序号"""
+        deadline = self.clock() if start is None else start
+        while True:
+            now = self.clock()
+            if now < deadline:
+                await asyncio.sleep(deadline - now)
+                now = self.clock()
+            self._lag.set(max(now - deadline, 0.0))
+
+            try:
+                await self.callback(self.ticks)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in {self.name} tick: {e}")
+            self.ticks += 1
+
+            finished = self.clock()
+            self._duration.observe(finished - now)
+            deadline += self.period
+            if finished > deadline:
+                # 超时：从最近一个已到的计划时间继续，更早的轮次只计数不补跑
+                skipped = math.floor((finished - deadline) / self.period)
+                if skipped:
+                    deadline += skipped * self.period
+                    self._skip(skipped, finished)
+
+    def _skip(self, skipped: int, now: float):
+        self.missed += skipped
+        self._missed.inc(skipped)
+        if self._last_warning is None or now - self._last_warning >= _WARN_INTERVAL:
+            self._last_warning = now
+            logger.warning(f"{self.name} tick overran its {self.period}s period, "
+                           f"{self.missed} ticks missed so far")
\ No newline at end of file
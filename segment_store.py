@@ -0,0 +1,407 @@
+"""
+历史数据持久化存储
+
+每个测点一个目录，按时间窗口（默认 1 小时）切分为只追加的段文件：
+
+    <数据目录>/<标签>/<窗口起始毫秒>.seg
+
+段文件由 32 字节文件头和定长记录（int64 毫秒时间戳 + float64 数值，小端）组成。
+记录按时间有序，文件名给出窗口起始时间，段内用二分查找定位，读取时通过 mmap 直接访问，
+重启后无需回放即可查询。写入先在内存中按测点缓冲，按间隔顺序追加到文件末尾；
+打开数据目录时截断各测点最后一个段中未写完整的尾部记录（异常退出时留下），之后的读写都从完整的记录开始。
+
+每个测点有一把锁，缓冲区的追加和写出在锁内进行，推送线程的 append 与主线程的 flush/close 不会丢失或重复记录。
+当前窗口的段文件写出后保持打开，切换窗口或一个刷新间隔内没有新数据时关闭；保持打开的文件数达到
+max_open_files 后，其余测点每次写出时打开、写完即关闭。
+
+SegmentWriter 在专用线程中执行上述文件操作：推送循环只把记录放进待写列表，不在事件循环上做阻塞的文件 I/O。
+"""
+
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TVSG'
+VERSION = 1
+HEADER = struct.Struct('<4sHHq')
+HEADER_SIZE = 32
+RECORD = struct.Struct('<qd')
+RECORD_SIZE = RECORD.size
+SEGMENT_SUFFIX = '.seg'
+
+_TIMESTAMP = struct.Struct('<q')
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def tag_dirname(tag: str) -> str:
+    """标签转换为目录名，转义路径分隔符和开头的点"""
+    name = quote(tag, safe='')
+    if name.startswith('.'):
+        name = '%2E' + name[1:]
+    return name
+
+
+def _encode_header(window_start: int) -> bytes:
+    return HEADER.pack(MAGIC, VERSION, RECORD_SIZE, window_start).ljust(HEADER_SIZE, b'\0')
+
+
+def _decode_columns(raw: bytes) -> Tuple[array, array]:
+    """将交错存储的记录拆分为时间戳列和数值列"""
+    times = array('q')
+    times.frombytes(raw)
+    values = array('d')
+    values.frombytes(raw)
+    if _BIG_ENDIAN:
+        times.byteswap()
+        values.byteswap()
+    return times[0::2], values[1::2]
+
+
+class _MappedSegment:
+    """只读映射的段文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mm: Optional[mmap.mmap] = None
+        self.count = 0
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= HEADER_SIZE:
+                return
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:4] != MAGIC:
+            logger.warning(f"Ignoring segment with bad header: {path}")
+            self.close()
+            return
+        # 尾部不完整的记录（写入中或异常退出）不计入
+        self.count = (size - HEADER_SIZE) // RECORD_SIZE
+
+    def time_at(self, index: int) -> int:
+        return _TIMESTAMP.unpack_from(self.mm, HEADER_SIZE + index * RECORD_SIZE)[0]
+
+    def bisect(self, ts: int, right: bool) -> int:
+        """left 返回第一个 >= ts 的下标，right 返回第一个 > ts 的下标"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = self.time_at(mid)
+            if t < ts or (right and t == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def read(self, lo: int, hi: int) -> Tuple[array, array]:
+        return _decode_columns(self.mm[HEADER_SIZE + lo * RECORD_SIZE:HEADER_SIZE + hi * RECORD_SIZE])
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+
+class SegmentRange:
+    """一次查询涉及的段及各段内的记录区间，按时间升序排列
+
+    逻辑下标 [0, count) 连续编号全部命中的记录，read 只复制请求的部分。
+    """
+
+    def __init__(self, parts: List[Tuple[_MappedSegment, int, int]]):
+        self.parts = parts
+        self.count = sum(hi - lo for _, lo, hi in parts)
+
+    def read(self, lo: int, hi: int) -> Tuple[array, array]:
+        times = array('q')
+        values = array('d')
+        base = 0
+        for segment, seg_lo, seg_hi in self.parts:
+            n = seg_hi - seg_lo
+            a = max(lo - base, 0)
+            b = min(hi - base, n)
+            if a < b:
+                part_times, part_values = segment.read(seg_lo + a, seg_lo + b)
+                times.extend(part_times)
+                values.extend(part_values)
+            base += n
+            if base >= hi:
+                break
+        return times, values
+
+    def close(self):
+        for segment, _, _ in self.parts:
+            segment.close()
+        self.parts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _recover_tail(path: str) -> Optional[int]:
+    """截断段文件不完整的文件头或尾部记录，返回最后一条记录的时间戳（没有记录时为 None）"""
+    size = os.path.getsize(path)
+    if size < HEADER_SIZE:
+        if size:
+            logger.warning(f"Truncating incomplete header in {path}")
+            os.truncate(path, 0)
+        return None
+    tail = (size - HEADER_SIZE) % RECORD_SIZE
+    if tail:
+        logger.warning(f"Truncating {tail} bytes of incomplete record in {path}")
+        os.truncate(path, size - tail)
+    if size - tail == HEADER_SIZE:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(size - tail - RECORD_SIZE)
+        return RECORD.unpack(f.read(RECORD_SIZE))[0]
+
+
+class _TagWriter:
+    """单个测点的追加写入状态，lock 保护缓冲区、窗口和文件描述符"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.window: Optional[int] = None
+        self.buffer = bytearray()
+        self.last_ts: Optional[int] = None
+        self.lock = threading.Lock()
+        # 当前窗口段文件的描述符
+        self.fd: Optional[int] = None
+
+
+class SegmentStore:
+    def __init__(self, base_dir: str, window_ms: int = 3600 * 1000, flush_interval: float = 1.0,
+                 max_open_files: int = 1024):
+        self.base_dir = base_dir
+        self.window_ms = window_ms
+        self.flush_interval = flush_interval
+        self.max_open_files = max(max_open_files, 1)
+        self._lock = threading.Lock()
+        self._writers: Dict[str, _TagWriter] = {}
+        # 保持打开的段文件数
+        self._files_lock = threading.Lock()
+        self._open_files = 0
+        self._last_flush = time.monotonic()
+        os.makedirs(base_dir, exist_ok=True)
+        self.recover()
+
+    def recover(self):
+        """截断各测点最后一个段中不完整的尾部记录，创建时调用（多进程模式下在 fork 之前）"""
+        with os.scandir(self.base_dir) as entries:
+            directories = [entry.path for entry in entries if entry.is_dir()]
+        for directory in directories:
+            windows = self._list_windows(directory)
+            if windows:
+                try:
+                    _recover_tail(self._segment_path(directory, windows[-1]))
+                except OSError as e:
+                    logger.error(f"Error recovering segments in {directory}: {e}")
+
+    def _tag_dir(self, tag: str) -> str:
+        return os.path.join(self.base_dir, tag_dirname(tag))
+
+    def _segment_path(self, directory: str, window: int) -> str:
+        return os.path.join(directory, f"{window}{SEGMENT_SUFFIX}")
+
+    def _list_windows(self, directory: str) -> List[int]:
+        """列出测点目录下全部段的窗口起始时间，升序"""
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        windows = []
+        for name in names:
+            if name.endswith(SEGMENT_SUFFIX):
+                try:
+                    windows.append(int(name[:-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        windows.sort()
+        return windows
+
+    def _open_writer(self, tag: str) -> _TagWriter:
+        """打开测点的写入状态，读取最后一个段的最后时间戳"""
+        writer = _TagWriter(self._tag_dir(tag))
+        os.makedirs(writer.directory, exist_ok=True)
+        windows = self._list_windows(writer.directory)
+        if windows:
+            writer.last_ts = _recover_tail(self._segment_path(writer.directory, windows[-1]))
+        return writer
+
+    def append(self, tag: str, ts: int, value: float) -> bool:
+        """缓冲一条记录，时间早于该测点最后一条记录时丢弃并返回 False"""
+        writer = self._writers.get(tag)
+        if writer is None:
+            with self._lock:
+                writer = self._writers.get(tag)
+                if writer is None:
+                    writer = self._open_writer(tag)
+                    self._writers[tag] = writer
+        with writer.lock:
+            if writer.last_ts is not None and ts < writer.last_ts:
+                return False
+
+            window = ts - ts % self.window_ms
+            if writer.window != window:
+                # 进入新的时间窗口，先把上一个窗口的数据写出并关闭其文件
+                self._write(writer)
+                self._close_file(writer)
+                writer.window = window
+            writer.buffer += RECORD.pack(ts, value)
+            writer.last_ts = ts
+        return True
+
+    def _write(self, writer: _TagWriter):
+        """把测点缓冲的记录顺序追加到当前窗口的段文件，调用方需持有 writer.lock"""
+        if not writer.buffer:
+            return
+        fd = writer.fd if writer.fd is not None else self._open_segment(writer)
+        try:
+            os.write(fd, writer.buffer)
+        finally:
+            if fd != writer.fd:
+                os.close(fd)
+        writer.buffer.clear()
+
+    def _open_segment(self, writer: _TagWriter) -> int:
+        """打开当前窗口的段文件，新文件先写文件头；未达到 max_open_files 时保持打开（记入 writer.fd），
+        否则由调用方写完即关闭。调用方需持有 writer.lock"""
+        path = self._segment_path(writer.directory, writer.window)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            if os.fstat(fd).st_size == 0:
+                os.write(fd, _encode_header(writer.window))
+        except OSError:
+            os.close(fd)
+            raise
+        with self._files_lock:
+            if self._open_files < self.max_open_files:
+                self._open_files += 1
+                writer.fd = fd
+        return fd
+
+    def _close_file(self, writer: _TagWriter):
+        """关闭测点保持打开的段文件，调用方需持有 writer.lock"""
+        if writer.fd is None:
+            return
+        fd, writer.fd = writer.fd, None
+        with self._files_lock:
+            self._open_files -= 1
+        os.close(fd)
+
+    def flush(self, force: bool = False):
+        """写出全部缓冲数据；未到刷新间隔且未指定 force 时不做任何事"""
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        for writer in list(self._writers.values()):
+            with writer.lock:
+                try:
+                    if writer.buffer:
+                        self._write(writer)
+                    else:
+                        # 一个刷新间隔内没有新数据的测点关闭文件，把名额留给活跃的测点
+                        self._close_file(writer)
+                except OSError as e:
+                    logger.error(f"Error writing segment in {writer.directory}: {e}")
+
+    def close(self):
+        """写出全部缓冲数据并关闭段文件；之后仍可继续写入，文件按需重新打开"""
+        self.flush(force=True)
+        for writer in list(self._writers.values()):
+            with writer.lock:
+                try:
+                    self._close_file(writer)
+                except OSError as e:
+                    logger.error(f"Error closing segment in {writer.directory}: {e}")
+
+    def open_range(self, tag: str, start_ms: Optional[int], end_ms: Optional[int]) -> SegmentRange:
+        """映射时间范围 [start_ms, end_ms] 涉及的段，调用方用完后需关闭"""
+        directory = self._tag_dir(tag)
+        parts = []
+        for window in self._list_windows(directory):
+            if end_ms is not None and window > end_ms:
+                break
+            if start_ms is not None and window + self.window_ms <= start_ms:
+                continue
+            try:
+                segment = _MappedSegment(self._segment_path(directory, window))
+            except OSError:
+                continue
+            if segment.count == 0:
+                segment.close()
+                continue
+            lo = 0 if start_ms is None else segment.bisect(start_ms, False)
+            hi = segment.count if end_ms is None else segment.bisect(end_ms, True)
+            if lo < hi:
+                parts.append((segment, lo, hi))
+            else:
+                segment.close()
+        return SegmentRange(parts)
+
+
+class SegmentWriter:
+    """段文件的后台写入线程
+
+    submit 只把记录追加到待写列表，写入线程每个刷新间隔取走全部记录，按提交顺序追加到段文件并写出。
+    线程在第一次 submit 时启动（多进程模式下在 fork 之后）；close 在调用线程中写完剩余记录并关闭段文件。
+    """
+
+    def __init__(self, segments: SegmentStore):
+        self.segments = segments
+        self._lock = threading.Lock()
+        # 同一时间只有一个线程在写，保证同一测点的记录按提交顺序写入
+        self._drain_lock = threading.Lock()
+        self._pending: List[Tuple[str, int, float]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, records: List[Tuple[str, int, float]]):
+        """提交一批 (标签, 毫秒时间戳, 数值) 记录"""
+        if not records:
+            return
+        with self._lock:
+            self._pending.extend(records)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="segment-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.segments.flush_interval)
+            self.drain()
+
+    def drain(self):
+        """把待写列表中的记录写入段文件"""
+        with self._drain_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+            append = self.segments.append
+            failed = 0
+            for tag, ts, value in records:
+                try:
+                    append(tag, ts, value)
+                except OSError as e:
+                    if not failed:
+                        logger.error(f"Error writing segment for {tag}: {e}")
+                    failed += 1
+            if failed > 1:
+                logger.error(f"{failed} records not written to segments")
+            self.segments.flush(force=True)
+
+    def close(self):
+        """写出全部待写记录并关闭段文件；之后仍可继续提交"""
+        self.drain()
+        with self._drain_lock:
+            self.segments.close()
\ No newline at end of file
@@ -0,0 +1,300 @@
+"""
+共享内存最新值表
+
+多进程模式下，最新值表放在一块共享内存中，由主进程在 fork 工作进程之前创建，
+各进程直接读写同一块内存，find_last 不需要任何进程间通信。
+
+内存布局：64 字节文件头，随后是 capacity 个标签名槽（每个 128 字节）和 capacity 个值记录（每个 64 字节）。
+标签目录只追加：新测点在写锁内分配下一个槽位，先写标签名再递增文件头中的计数；
+各进程按计数增量读取新标签，在本地维护 标签 -> 槽位 映射和设备前缀索引。
+
+值记录使用 seqlock：写入方先把序号加一（奇数表示正在写），写完字段后再加一；
+读取方读到偶数序号且前后序号一致才接受，否则重读，读取不加锁。
+写入方之间（推送进程、各工作进程的写值流水线）用一把跨进程锁串行化。
+"""
+
+import json
+import logging
+import multiprocessing
+import struct
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from metrics import Counter
+from models import ValueItem
+from realtime_store import parent_tags
+
+logger = logging.getLogger(__name__)
+
+REJECTED = Counter('shared_values_rejected_total',
+                   'Values not written to the shared value table: too_long (text over TEXT_SIZE bytes) '
+                   'or full (no slot for the tag).', ('reason',))
+
+MAGIC = b'TVLV'
+VERSION = 1
+HEADER = struct.Struct('<4sIQQ')
+HEADER_SIZE = 64
+_COUNT_OFFSET = 16
+_COUNT = struct.Struct('<Q')
+
+NAME_SIZE = 128
+TEXT_SIZE = 32
+# 序号、时间戳（微秒）、值类型、文本长度、质量码、数值、文本
+RECORD = struct.Struct(f'<QqBBxxid{TEXT_SIZE}s')
+RECORD_SIZE = 64
+_FIELDS = struct.Struct(f'<qBBxxid{TEXT_SIZE}s')
+_SEQ = struct.Struct('<Q')
+
+# 值类型
+KIND_EMPTY = 0
+KIND_FLOAT = 1
+KIND_INT = 2
+KIND_BOOL = 3
+KIND_NULL = 4
+KIND_STR = 5
+KIND_JSON = 6
+
+_MAX_EXACT_INT = 2 ** 53
+
+# 读取时遇到正在写入的记录最多重试的次数，之后让出 CPU 再试
+_SPIN = 100
+
+
+def _encode_value(value: Any) -> Tuple[int, float, bytes]:
+    """值编码为 (类型, 数值, 文本)；文本超过 TEXT_SIZE 字节时抛出 ValueError"""
+    value_type = type(value)
+    if value_type is float:
+        return KIND_FLOAT, value, b''
+    if value_type is bool:
+        return KIND_BOOL, 1.0 if value else 0.0, b''
+    if value_type is int and -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT:
+        return KIND_INT, float(value), b''
+    if value is None:
+        return KIND_NULL, 0.0, b''
+    if value_type is str:
+        kind, text = KIND_STR, value.encode('utf-8')
+    else:
+        kind, text = KIND_JSON, json.dumps(value, ensure_ascii=False).encode('utf-8')
+    if len(text) > TEXT_SIZE:
+        raise ValueError(f"Value too long for shared table ({len(text)} > {TEXT_SIZE} bytes)")
+    return kind, 0.0, text
+
+
+def _decode_value(kind: int, number: float, text: bytes) -> Any:
+    if kind == KIND_FLOAT:
+        return number
+    if kind == KIND_INT:
+        return int(number)
+    if kind == KIND_BOOL:
+        return number != 0.0
+    if kind == KIND_STR:
+        return text.decode('utf-8')
+    if kind == KIND_JSON:
+        return json.loads(text.decode('utf-8'))
+    return None
+
+
+def _to_micros(timestamp: datetime) -> int:
+    """datetime 转换为微秒时间戳，整数秒与微秒分开换算，不丢失精度"""
+    return int(timestamp.replace(microsecond=0).timestamp()) * 1_000_000 + timestamp.microsecond
+
+
+@lru_cache(maxsize=1024)
+def _from_micros(micros: int) -> datetime:
+    """微秒时间戳转换为本地时间；同一轮推送的测点时间相同，只换算一次"""
+    seconds, micro = divmod(micros, 1_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=micro)
+
+
+class SharedLatestValueStore:
+    """与 LatestValueStore 接口一致的共享内存实现，需在 fork 之前创建"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        size = HEADER_SIZE + capacity * (NAME_SIZE + RECORD_SIZE)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.buf = self.shm.buf
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, capacity, 0)
+        self._names_offset = HEADER_SIZE
+        self._records_offset = HEADER_SIZE + capacity * NAME_SIZE
+        self._write_lock = multiprocessing.Lock()
+        # 本进程已同步的标签目录
+        self._sync_lock = threading.Lock()
+        self._slots: Dict[str, int] = {}
+        self._children: Dict[str, Dict[str, None]] = {}
+        self._full_logged = False
+        self._too_long_logged = False
+        # 最近一次换算的 (datetime, 微秒)，作为整体替换，多线程下不会错配
+        self._last_time: Tuple[Optional[datetime], int] = (None, 0)
+
+    def __len__(self) -> int:
+        """已分配槽位的测点数"""
+        return _COUNT.unpack_from(self.buf, _COUNT_OFFSET)[0]
+
+    # ------------------------------------------------------------ 标签目录
+
+    def _sync(self):
+        """读取其他进程新分配的标签"""
+        if _COUNT.unpack_from(self.buf, _COUNT_OFFSET)[0] == len(self._slots):
+            return
+        with self._sync_lock:
+            count = _COUNT.unpack_from(self.buf, _COUNT_OFFSET)[0]
+            for slot in range(len(self._slots), count):
+                offset = self._names_offset + slot * NAME_SIZE
+                length = self.buf[offset]
+                tag = bytes(self.buf[offset + 1:offset + 1 + length]).decode('utf-8')
+                for prefix in parent_tags(tag):
+                    self._children.setdefault(prefix, {})[tag] = None
+                self._slots[tag] = slot
+
+    def _allocate(self, tag: str) -> Optional[int]:
+        """为新测点分配槽位，调用方需持有写锁；表满时返回 None"""
+        self._sync()
+        slot = self._slots.get(tag)
+        if slot is not None:
+            return slot
+        slot = len(self._slots)
+        name = tag.encode('utf-8')
+        if slot >= self.capacity or len(name) >= NAME_SIZE:
+            if not self._full_logged:
+                self._full_logged = True
+                logger.warning(f"Shared value table cannot hold {tag!r} "
+                               f"(capacity {self.capacity}, max tag length {NAME_SIZE - 1} bytes)")
+            return None
+        offset = self._names_offset + slot * NAME_SIZE
+        self.buf[offset] = len(name)
+        self.buf[offset + 1:offset + 1 + len(name)] = name
+        # 标签名写完后再发布计数，读取方看到计数时标签名一定完整
+        _COUNT.pack_into(self.buf, _COUNT_OFFSET, slot + 1)
+        self._sync()
+        return slot
+
+    # ------------------------------------------------------------ 读写
+
+    def _write(self, slot: int, micros: int, kind: int, number: float, text: bytes, quality: int):
+        offset = self._records_offset + slot * RECORD_SIZE
+        seq = _SEQ.unpack_from(self.buf, offset)[0]
+        _SEQ.pack_into(self.buf, offset, seq + 1)
+        _FIELDS.pack_into(self.buf, offset + 8, micros, kind, len(text), quality, number, text)
+        _SEQ.pack_into(self.buf, offset, seq + 2)
+
+    def _read(self, slot: int, tag: str) -> Optional[ValueItem]:
+        offset = self._records_offset + slot * RECORD_SIZE
+        buf = self.buf
+        attempts = 0
+        while True:
+            seq, micros, kind, length, quality, number, text = RECORD.unpack_from(buf, offset)
+            if not seq & 1 and _SEQ.unpack_from(buf, offset)[0] == seq:
+                break
+            attempts += 1
+            if attempts >= _SPIN:
+                attempts = 0
+                time.sleep(0)
+        if kind == KIND_EMPTY:
+            return None
+        return ValueItem(tag, _from_micros(micros), _decode_value(kind, number, text[:length]), quality)
+
+    def _micros(self, timestamp: datetime) -> int:
+        # 同一批数据的时间戳通常是同一个对象，只换算一次
+        last, micros = self._last_time
+        if timestamp is not last:
+            micros = _to_micros(timestamp)
+            self._last_time = (timestamp, micros)
+        return micros
+
+    def update(self, item: ValueItem):
+        """写入单个测点的最新值"""
+        self.update_many((item,))
+
+    def check(self, tag: str, value: Any) -> Optional[str]:
+        """检查值能否写入共享表，能写入时返回 None，否则返回原因（写值请求据此提前报错）"""
+        try:
+            _encode_value(value)
+        except ValueError as e:
+            return str(e)
+        self._sync()
+        if tag in self._slots:
+            return None
+        if len(tag.encode('utf-8')) >= NAME_SIZE:
+            return f"Tag too long for shared table (max {NAME_SIZE - 1} bytes)"
+        if len(self) >= self.capacity:
+            return f"Shared value table is full (capacity {self.capacity})"
+        return None
+
+    def update_many(self, items: Iterable[ValueItem]) -> List[str]:
+        """批量写入最新值，整批只加一次跨进程锁，返回未能写入的标签
+
+        先在锁外编码整批数据。无法放入共享表的值（文本过长、表满）只跳过该测点，保留其原有的值，
+        计入 shared_values_rejected_total，不影响同一批的其他测点。
+        """
+        encoded = []
+        rejected = []
+        for item in items:
+            try:
+                value = _encode_value(item.value)
+            except ValueError as e:
+                REJECTED.labels('too_long').inc()
+                rejected.append(item.tag)
+                if not self._too_long_logged:
+                    self._too_long_logged = True
+                    logger.warning(f"Skipping {item.tag!r} in shared value table: {e}")
+                continue
+            encoded.append((item.tag, self._micros(item.timestamp), value, item.quality))
+        slots = self._slots
+        with self._write_lock:
+            for tag, micros, (kind, number, text), quality in encoded:
+                slot = slots.get(tag)
+                if slot is None:
+                    slot = self._allocate(tag)
+                    if slot is None:
+                        REJECTED.labels('full').inc()
+                        rejected.append(tag)
+                        continue
+                self._write(slot, micros, kind, number, text, quality)
+        return rejected
+
+    def get(self, tag: str) -> Optional[ValueItem]:
+        """查询单个测点的最新值，不存在时返回 None"""
+        slot = self._slots.get(tag)
+        if slot is None:
+            self._sync()
+            slot = self._slots.get(tag)
+            if slot is None:
+                return None
+        return self._read(slot, tag)
+
+    def get_device(self, device_tag: str) -> List[ValueItem]:
+        """查询设备标签下全部测点的最新值"""
+        self._sync()
+        slots = self._slots
+        items = []
+        for tag in list(self._children.get(device_tag, ())):
+            item = self._read(slots[tag], tag)
+            if item is not None:
+                items.append(item)
+        return items
+
+    def remove(self, tag: str):
+        """清除测点的值；标签目录只追加，槽位保留"""
+        with self._write_lock:
+            self._sync()
+            slot = self._slots.get(tag)
+            if slot is not None:
+                self._write(slot, 0, KIND_EMPTY, 0.0, b'', 0)
+
+    def clear(self):
+        """清除全部测点的值"""
+        with self._write_lock:
+            self._sync()
+            for slot in self._slots.values():
+                self._write(slot, 0, KIND_EMPTY, 0.0, b'', 0)
+
+    def close(self, unlink: bool = False):
+        """释放映射；创建者退出时传入 unlink=True 删除共享内存"""
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
\ No newline at end of file
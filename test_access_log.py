@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+访问日志测试脚本
+"""
+
+import io
+import json
+import logging
+import queue
+import access_log
+from access_log import DROPPED, JsonFormatter, RateLimitFilter, _LazyQueueHandler, log_access
+from routes import dispatch
+import config
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _record(msg, *args, level=logging.INFO, lineno=1, created=100.0):
+    record = logging.LogRecord('api_handler', level, 'api_handler.py', lineno, msg, args, None)
+    record.created = created
+    return record
+
+
+def test_queue_handler():
+    """测试放入队列时不格式化，队列满时丢弃并计数"""
+    print("=== Testing queue handler ===")
+    handler = _LazyQueueHandler(queue.Queue(1))
+    record = _record("tags: %s", "a.b")
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    assert queued is record and queued.msg == "tags: %s" and queued.args == ("a.b",)
+    assert queued.getMessage() == "tags: a.b"
+
+    dropped = DROPPED.labels('queue_full')
+    before = dropped.value
+    handler.handle(_record("first"))
+    handler.handle(_record("second"))
+    assert dropped.value == before + 1
+    print(f"dropped {dropped.value - before} record(s) on a full queue")
+    print()
+
+
+def test_rate_limit_filter():
+    """测试按调用位置每秒限速，WARNING 不受限制"""
+    print("=== Testing rate limit filter ===")
+    limiter = RateLimitFilter(rate=2)
+    results = [limiter.filter(_record("x", lineno=10)) for _ in range(4)]
+    assert results == [True, True, False, False]
+    # 其他调用位置、下一秒、WARNING 都不受影响
+    assert limiter.filter(_record("x", lineno=11))
+    assert limiter.filter(_record("x", lineno=10, created=101.0))
+    assert limiter.filter(_record("x", level=logging.WARNING, lineno=10, created=101.0))
+    assert all(RateLimitFilter(rate=0).filter(_record("x")) for _ in range(10))
+    print(results)
+    print()
+
+
+def test_access_record():
+    """测试访问记录的字段、JSON 输出和抽样"""
+    print("=== Testing access record ===")
+    capture = _Capture()
+    logger = access_log.access_logger
+    logger.addHandler(capture)
+    level, disabled, sample = logger.level, logger.disabled, config.LOG_ACCESS_SAMPLE
+    logger.setLevel(logging.INFO)
+    logger.disabled = False
+    try:
+        response = dispatch('GET', '/api/find_last', b'', {}, 'tag=missing', client='10.0.0.1')
+        assert response.status == 200
+        record = capture.records[-1]
+        assert (record.client, record.method, record.route, record.status) == \
+            ('10.0.0.1', 'GET', '/api/find_last', 200)
+        assert record.duration_ms >= 0 and record.bytes > 0
+        line = json.loads(JsonFormatter().format(record))
+        print(line)
+        assert line["logger"] == "access" and line["route"] == "/api/find_last" and line["bytes"] == record.bytes
+
+        # 抽样只丢弃成功的请求，4xx 总是记录
+        config.LOG_ACCESS_SAMPLE = 0.0
+        count = len(capture.records)
+        log_access('10.0.0.1', 'GET', '/api/find_last', 200, 0.0, 10)
+        assert len(capture.records) == count
+        log_access('10.0.0.1', 'GET', '/missing', 404, 0.0, 10)
+        assert capture.records[-1].status == 404
+    finally:
+        logger.removeHandler(capture)
+        logger.setLevel(level)
+        logger.disabled = disabled
+        config.LOG_ACCESS_SAMPLE = sample
+    print()
+
+
+def test_setup_logging():
+    """测试后台线程写出，重复配置不重复输出"""
+    print("=== Testing setup logging ===")
+    stream = io.StringIO()
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    try:
+        access_log.setup_logging(background=True, stream=stream)
+        access_log.setup_logging(background=True, stream=stream)
+        logging.getLogger('test_access_log').info("hello %s", "world")
+        access_log.stop_logging()
+        print(stream.getvalue().strip())
+        assert stream.getvalue().count("hello world") == 1
+    finally:
+        access_log.stop_logging()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_queue_handler()
+    test_rate_limit_filter()
+    test_access_record()
+    test_setup_logging()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
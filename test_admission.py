@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+准入控制测试脚本
+"""
+
+import asyncio
+import json
+import threading
+import time
+from admission import HISTORY, REALTIME, Overloaded, RateLimiter, RouteClass, create_route_classes
+import api_handler
+from async_server import AsyncHTTPServer
+from test_async_server import _read_chunked, _request
+
+
+def test_rate_limiter():
+    """测试按客户端的令牌桶限速"""
+    print("=== Testing rate limiter ===")
+    limiter = RateLimiter(rate=2, burst=3)
+    for _ in range(3):
+        limiter.check("10.0.0.1", REALTIME, now=100.0)
+    try:
+        limiter.check("10.0.0.1", REALTIME, now=100.0)
+        assert False, "expected Overloaded"
+    except Overloaded as e:
+        print(f"{e.status} {e.message}, retry after {e.retry_after:.2f}s")
+        assert e.status == 429 and abs(e.retry_after - 0.5) < 1e-9
+    # 其他客户端不受影响，半秒后补充一个令牌
+    limiter.check("10.0.0.2", REALTIME, now=100.0)
+    limiter.check("10.0.0.1", REALTIME, now=100.5)
+    # rate 为 0 时不限速
+    unlimited = RateLimiter(rate=0)
+    for _ in range(100):
+        unlimited.check("10.0.0.1", REALTIME)
+    print()
+
+
+def test_route_class():
+    """测试排队上限和最长排队时间"""
+    print("=== Testing route class ===")
+    route_class = RouteClass(HISTORY, workers=1, queue_size=1, max_wait=0.05)
+    release = threading.Event()
+    try:
+        running = route_class.submit(release.wait)
+        time.sleep(0.01)
+        # 唯一的线程被占用，第二个请求排队，第三个请求因排队已满被拒绝
+        queued = route_class.submit(lambda: "done")
+        try:
+            route_class.submit(lambda: "rejected")
+            assert False, "expected Overloaded"
+        except Overloaded as e:
+            assert e.status == 503
+        time.sleep(0.1)
+        release.set()
+        assert running.result(1) is True
+        # 排队超过 max_wait 的请求不再执行
+        try:
+            queued.result(1)
+            assert False, "expected Overloaded"
+        except Overloaded as e:
+            print(f"shed after deadline: {e.status} {e.message}")
+        assert route_class.submit(lambda: "ok").result(1) == "ok"
+
+        # hold 期间占用一个名额：第一个请求排队，第二个被拒绝
+        with route_class.hold():
+            assert route_class.running == 1
+            blocked = route_class.submit(lambda: "after hold")
+            try:
+                route_class.submit(lambda: "rejected")
+                assert False, "expected Overloaded"
+            except Overloaded:
+                pass
+        assert blocked.result(1) == "after hold"
+    finally:
+        route_class.shutdown()
+    print()
+
+
+async def _run_server():
+    route_classes = create_route_classes()
+    route_classes[HISTORY] = RouteClass(HISTORY, workers=1, queue_size=0, max_wait=1.0)
+    server = AsyncHTTPServer('127.0.0.1', 0, max_workers=2, route_classes=route_classes,
+                             rate_limiter=RateLimiter(rate=1, burst=2))
+    await server.start()
+    port = server.server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for expected in (200, 200, 429):
+            status, headers, data = await _request(reader, writer, 'GET', '/api/find_last', {"tag": "missing"})
+            print(f"find_last: {status} {headers.get('retry-after')} {data}")
+            assert status == expected
+        assert headers['retry-after'] == '1'
+        # 不受准入控制的路径不限速
+        status, _, _ = await _request(reader, writer, 'GET', '/health')
+        assert status == 200
+
+        # history 类别不允许排队：线程被占用时新的请求直接返回 503
+        server.rate_limiter = RateLimiter(rate=0)
+        release = threading.Event()
+        route_classes[HISTORY].submit(release.wait)
+        await asyncio.sleep(0.01)
+        other = await asyncio.open_connection('127.0.0.1', port)
+        status, headers, data = await _request(*other, 'POST', '/api/query_history', {"tag": ["a"]})
+        release.set()
+        print(f"query_history: {status} {headers.get('retry-after')} {data}")
+        assert status == 503 and headers['retry-after'] == '1'
+        await asyncio.sleep(0.05)
+        writer.close()
+        other[1].close()
+
+        # 流式响应输出期间一直占用 history 的名额
+        original = api_handler._cached_tag_history
+        release = threading.Event()
+
+        def slow(project, tag, *args):
+            if tag == "slow":
+                release.wait(1)
+            return original(project, tag, *args)
+
+        api_handler._cached_tag_history = slow
+        try:
+            stream = await asyncio.open_connection('127.0.0.1', port)
+            payload = b'{"tag": ["fast", "slow"]}'
+            stream[1].write(b"POST /api/query_history?stream=1 HTTP/1.1\r\nHost: localhost\r\n"
+                            b"Content-Length: %d\r\n\r\n%s" % (len(payload), payload))
+            await stream[0].readuntil(b'\r\n\r\n')
+            running = route_classes[HISTORY].running
+            other = await asyncio.open_connection('127.0.0.1', port)
+            status, _, _ = await _request(*other, 'POST', '/api/query_history', {"tag": ["a"]})
+            release.set()
+            body = json.loads(await _read_chunked(stream[0]))
+        finally:
+            release.set()
+            api_handler._cached_tag_history = original
+        print(f"while streaming: running {running}, new request {status}")
+        assert running == 1 and status == 503
+        assert [r["tag"] for r in body["results"]] == ["fast", "slow"]
+        await asyncio.sleep(0.05)
+        assert route_classes[HISTORY].running == 0
+        stream[1].close()
+        other[1].close()
+    finally:
+        await server.close()
+
+
+def test_server():
+    """测试异步服务返回 429 / 503"""
+    print("=== Testing server ===")
+    asyncio.run(_run_server())
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_rate_limiter()
+    test_route_class()
+    test_server()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
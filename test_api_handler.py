@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+API 处理器测试脚本
+"""
+
+import json
+from datetime import datetime
+from models import ValueItem, dumps
+from realtime_store import latest_values
+from api_handler import find_last, set_value
+
+
+def setup_values():
+    latest_values.clear()
+    now = datetime.now()
+    latest_values.update_many([
+        ValueItem("group1.dev1.a", now, 1.0),
+        ValueItem("group1.dev1.b", now, 2.0),
+        ValueItem("group2.dev1.a", now, 3.0),
+    ])
+
+
+def test_find_last_batch():
+    """测试批量查询实时数据"""
+    print("=== Testing find_last batch ===")
+    setup_values()
+
+    # 单个测点的请求格式保持不变
+    assert find_last({"tag": "group1.dev1.a"}).value == 1.0
+    assert "error" in find_last({"tag": "missing"})
+
+    response = json.loads(dumps(find_last({"tags": ["group1.dev1.a", "missing", "group2.dev1.a"]})))
+    print(f"Batch: {response}")
+    assert response["code"] == "partial_failure"
+    assert [item["tag"] for item in response["results"]] == ["group1.dev1.a", "missing", "group2.dev1.a"]
+    assert response["results"][0]["value"] == 1.0
+    assert response["results"][1]["code"] == "not_found"
+
+    response = json.loads(dumps(find_last({"tags": ["group1.dev1", "group2.dev1"], "device": True})))
+    assert response["code"] == "success"
+    assert len(response["results"]) == 3
+
+    assert find_last({"tags": ["missing"]}).code == "failure"
+    assert "error" in find_last({"tags": "group1.dev1.a"})
+    latest_values.clear()
+    print()
+
+
+def test_set_value_batch():
+    """测试批量设置值"""
+    print("=== Testing set_value batch ===")
+    assert set_value({"tag": "group1.dev1.a", "value": 1})["code"] == "success"
+
+    response = json.loads(dumps(set_value({"writes": [
+        {"tag": "group1.dev1.a", "value": 1, "time": 1640995200000},
+        {"value": 2},
+        {"tag": "group1.dev1.b", "value": "3"},
+    ]})))
+    print(f"Batch: {response}")
+    assert response["code"] == "partial_failure"
+    assert [item["code"] for item in response["results"]] == ["success", "invalid", "success"]
+    assert response["results"][1]["msg"] == "Missing tag"
+    assert "error" in set_value({"writes": {}})
+    assert "error" in set_value({"value": 1})
+    print()
+
+
+def test_set_value_ack():
+    """测试等待写入完成后再响应"""
+    print("=== Testing set_value ack ===")
+    latest_values.clear()
+    response = set_value({"tag": "group1.dev1.c", "value": 7, "ack": True})
+    print(f"Ack: {response}")
+    assert response["code"] == "success"
+    assert find_last({"tag": "group1.dev1.c"}).value == 7
+    latest_values.clear()
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_find_last_batch()
+    test_set_value_batch()
+    test_set_value_ack()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
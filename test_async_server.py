@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+异步 HTTP 服务测试脚本
+"""
+
+import asyncio
+import json
+from async_server import AsyncHTTPServer
+from history_store import history_store
+
+
+async def _request(reader, writer, method, path, body=None, headers=""):
+    """在已有连接上发送一个请求并读取完整响应"""
+    payload = json.dumps(body).encode('utf-8') if body is not None else b''
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n{headers}"
+                  f"Content-Length: {len(payload)}\r\n\r\n").encode('latin-1') + payload)
+    await writer.drain()
+
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+    lines = head.split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    response_headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+    if response_headers.get('transfer-encoding') == 'chunked':
+        data = await _read_chunked(reader)
+    else:
+        data = await reader.readexactly(int(response_headers.get('content-length', 0)))
+    return status, response_headers, data
+
+
+async def _read_chunked(reader):
+    """读取分块编码的响应体"""
+    chunks = []
+    while True:
+        size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+        if size == 0:
+            await reader.readuntil(b'\r\n')
+            return b''.join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+
+
+async def _run_keep_alive():
+    server = AsyncHTTPServer('127.0.0.1', 0, max_workers=4)
+    await server.start()
+    port = server.server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        status, headers, data = await _request(reader, writer, 'GET', '/health')
+        print(f"/health: {status} {headers.get('connection')} {data}")
+        assert status == 200
+        assert headers['connection'] == 'keep-alive'
+        assert json.loads(data)["status"] == "healthy"
+
+        # 同一连接上的第二个请求
+        status, headers, data = await _request(reader, writer, 'POST', '/api/query_history',
+                                               {"projectID": "test", "tag": []})
+        print(f"/api/query_history: {status} {data}")
+        assert status == 200
+
+        status, headers, data = await _request(reader, writer, 'GET', '/api/unknown')
+        print(f"/api/unknown: {status} {data}")
+        assert status == 404
+
+        status, headers, data = await _request(reader, writer, 'GET', '/health',
+                                               headers="Connection: close\r\n")
+        assert headers['connection'] == 'close'
+        assert await reader.read() == b''
+        writer.close()
+    finally:
+        await server.close()
+
+
+async def _run_streaming():
+    for i in range(5000):
+        history_store.append("stream.dev1.a", 1640995200000 + i * 1000, float(i))
+        history_store.append("stream.dev1.b", 1640995200000 + i * 1000, float(-i))
+    query = {"projectID": "test", "tag": ["stream.dev1.a", "stream.dev1.b"]}
+
+    server = AsyncHTTPServer('127.0.0.1', 0, max_workers=4)
+    await server.start()
+    port = server.server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        status, headers, buffered = await _request(reader, writer, 'POST', '/api/query_history', query)
+        assert status == 200 and 'content-length' in headers
+
+        status, headers, streamed = await _request(reader, writer, 'POST', '/api/query_history?stream=1', query)
+        print(f"stream: {status} {headers.get('transfer-encoding')} {len(streamed)} bytes")
+        assert headers['transfer-encoding'] == 'chunked'
+        assert streamed == buffered
+
+        status, headers, lines = await _request(reader, writer, 'POST', '/api/query_history', query,
+                                                headers="Accept: application/x-ndjson\r\n")
+        assert headers['content-type'] == 'application/x-ndjson'
+        results = [json.loads(line) for line in lines.decode('utf-8').splitlines()]
+        assert results == json.loads(buffered)["results"]
+        writer.close()
+    finally:
+        await server.close()
+
+
+def test_streaming():
+    """测试历史查询的分块流式响应与 NDJSON 响应"""
+    print("=== Testing streaming ===")
+    asyncio.run(_run_streaming())
+    print()
+
+
+def test_keep_alive():
+    """测试同一连接上处理多个请求"""
+    print("=== Testing keep-alive ===")
+    asyncio.run(_run_keep_alive())
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_keep_alive()
+    test_streaming()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
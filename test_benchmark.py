@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+基准测试脚本自检（小规模运行，只检查结果结构）
+"""
+
+from benchmark import percentile, make_items, bench_serialization, bench_push_loop
+
+
+def test_helpers():
+    """测试分位数和模拟数据"""
+    print("=== Testing helpers ===")
+    assert percentile([], 0.5) == 0.0
+    assert percentile([1, 2, 3, 4], 0.5) == 3
+    assert percentile([1, 2, 3, 4], 0.99) == 4
+    items = make_items(25)
+    assert len({item.tag for item in items}) == 25
+    assert items[0].tag == "group1.dev1.p0"
+    print()
+
+
+def test_small_run():
+    """测试小规模的序列化和推送基准"""
+    print("=== Testing small run ===")
+    serialization = bench_serialization(100)
+    assert {row["model"] for row in serialization} >= {"ValueItem", "Result[1000]"}
+
+    push = bench_push_loop([30, 200], ticks=2, publish_mode="tag")
+    print(f"Push loop: {push}")
+    assert [row["tags"] for row in push] == [30, 200]
+    assert push[1]["messages"] == 400
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_helpers()
+    test_small_run()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
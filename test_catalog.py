@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+测点目录测试脚本
+"""
+
+from catalog import TagCatalog, point_name, shard_of
+
+
+def test_generate():
+    """测试按规模生成目录，默认与原来的 3 × 10 个测点一致"""
+    print("=== Testing generate ===")
+    catalog = TagCatalog.generate(3, 10, 1, 1.0)
+    tags = catalog.tags()
+    print(f"Tags: {len(tags)}, first: {tags[:3]}")
+    assert len(catalog) == 30
+    assert tags[0] == "group1.dev1.a" and tags[-1] == "group3.dev10.a"
+    assert point_name(1) == "b" and point_name(30) == "p30"
+    print()
+
+
+def test_from_dict():
+    """测试从 JSON 结构加载，按周期归并调度组"""
+    print("=== Testing from_dict ===")
+    catalog = TagCatalog.from_dict({"groups": [
+        {"name": "fast", "period": 0.5, "tags": ["a.x", "a.y"]},
+        {"name": "default", "tags": ["b.x", {"tag": "b.y", "period": 0.5}, {"tag": "b.z", "period": 60}]},
+    ]}, default_period=1.0)
+    print(f"Groups: {catalog.groups}")
+    periods = {group.period: group.tags for group in catalog.groups}
+    assert periods == {0.5: ["a.x", "a.y", "b.y"], 1.0: ["b.x"], 60.0: ["b.z"]}
+    print()
+
+
+def test_options():
+    """测试发布参数：测点上的设置覆盖组上的设置，分片后仍可查到"""
+    print("=== Testing options ===")
+    catalog = TagCatalog.from_dict({"groups": [
+        {"name": "env", "deadband": 0.5, "maxSilence": 300,
+         "tags": ["env.temp", {"tag": "env.hum", "deadbandPercent": 1, "maxSilence": 60}]},
+        {"name": "motor", "tags": ["motor.speed"]},
+    ]}, default_period=1.0)
+    options = catalog.groups[0].options
+    print(f"Options: {options}")
+    assert options["env.temp"] == {"deadband": 0.5, "maxSilence": 300.0}
+    assert options["env.hum"] == {"deadband": 0.5, "deadbandPercent": 1.0, "maxSilence": 60.0}
+    assert "motor.speed" not in options
+    assert catalog.shard(1, 2).groups[0].options is options
+    print()
+
+
+def test_shard():
+    """测试按设备分片：分片互不重叠且覆盖全部测点，同一设备的测点在同一分片"""
+    print("=== Testing shard ===")
+    catalog = TagCatalog.generate(2, 50, 4, 1.0)
+    shards = [catalog.shard(i, 3).tags() for i in range(3)]
+    print(f"Shard sizes: {[len(tags) for tags in shards]}")
+    assert sorted(tag for tags in shards for tag in tags) == sorted(catalog.tags())
+    for tags in shards:
+        for tag in tags:
+            assert shard_of(tag, 3) == shard_of(tag.rpartition('.')[0] + ".a", 3)
+    assert catalog.shard(0, 1) is catalog
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_generate()
+    test_from_dict()
+    test_options()
+    test_shard()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
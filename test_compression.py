@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+响应压缩测试脚本
+"""
+
+import gzip
+import zlib
+from compression import choose_encoding, compress, compress_chunks
+from routes import Response, negotiate_compression
+
+
+def test_choose_encoding():
+    """测试 Accept-Encoding 协商"""
+    print("=== Testing choose_encoding ===")
+    for header in ("gzip, deflate, br", "deflate", "gzip;q=0.5, deflate", "gzip;q=0", "*", "br", None):
+        print(f"{header!r} -> {choose_encoding(header)}")
+    assert choose_encoding("gzip, deflate, br") == "gzip"
+    assert choose_encoding("gzip;q=0.5, deflate") == "deflate"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding("br") is None
+    assert choose_encoding(None) is None
+    print()
+
+
+def test_compress():
+    """测试完整响应体与流式响应的压缩结果可以还原"""
+    print("=== Testing compress ===")
+    data = b'{"tag": "group1.dev1.a", "time": "2022-01-01T00:00:00.000000Z"}' * 1000
+    compressed = compress(data, "gzip")
+    print(f"gzip: {len(data)} -> {len(compressed)} bytes")
+    assert gzip.decompress(compressed) == data
+    assert zlib.decompress(compress(data, "deflate")) == data
+
+    chunks = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+    streamed = b''.join(compress_chunks(iter(chunks), "gzip"))
+    assert gzip.decompress(streamed) == data
+    print()
+
+
+def test_negotiate_compression():
+    """测试响应压缩阈值"""
+    print("=== Testing negotiate_compression ===")
+    small = negotiate_compression(Response(200, b'{}'), {"accept-encoding": "gzip"})
+    assert small.body == b'{}' and not small.headers
+
+    body = b'{"results": []}' * 200
+    large = negotiate_compression(Response(200, body), {"accept-encoding": "gzip"})
+    print(f"headers: {large.headers}")
+    assert ('Content-Encoding', 'gzip') in large.headers
+    assert gzip.decompress(large.body) == body
+
+    plain = negotiate_compression(Response(200, body), {})
+    assert plain.body == body and ('Vary', 'Accept-Encoding') in plain.headers
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_choose_encoding()
+    test_compress()
+    test_negotiate_compression()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+按变化发布测试脚本
+"""
+
+from datetime import datetime
+import deadband
+from deadband import DeadbandFilter
+from models import ValueItem
+
+TAGS = ["dev1.a", "dev1.b", "dev1.c", "dev1.d"]
+OPTIONS = {"dev1.b": {"deadbandPercent": 10}, "dev1.c": {"maxSilence": 5}}
+
+
+def _items(values, qualities=(1, 1, 1, 1)):
+    now = datetime.now()
+    return [ValueItem(tag, now, value, quality) for tag, value, quality in zip(TAGS, values, qualities)]
+
+
+def _tags(items):
+    return [item.tag for item in items]
+
+
+def _check_filter():
+    changes = DeadbandFilter(TAGS, OPTIONS, deadband=0.5, percent=0, max_silence=0)
+    # 第一轮全部发布
+    assert _tags(changes.select(_items([1.0, 100.0, 1.0, 1.0]), 0)) == TAGS
+    # 绝对死区 0.5；dev1.b 为 10% 死区（上次发布值 100 的 10%）
+    assert _tags(changes.select(_items([1.4, 109.0, 1.0, 1.6]), 1)) == ["dev1.d"]
+    # 与上次发布的值比较，小的变化累积超过死区后发布
+    assert _tags(changes.select(_items([1.6, 111.0, 1.0, 1.6]), 2)) == ["dev1.a", "dev1.b"]
+    # 质量码变化总是发布
+    assert _tags(changes.select(_items([1.6, 111.0, 1.0, 1.6], (1, 1, 1, 0)), 3)) == ["dev1.d"]
+    # dev1.c 最长静默 5 秒，其他测点不发心跳
+    assert _tags(changes.select(_items([1.6, 111.0, 1.0, 1.6], (1, 1, 1, 0)), 5)) == ["dev1.c"]
+    # 非数值数据按是否相等判断
+    assert _tags(changes.select(_items(["on", 111.0, 1.0, None], (1, 1, 1, 0)), 6)) == ["dev1.a", "dev1.d"]
+    assert _tags(changes.select(_items(["on", 111.0, 1.0, None], (1, 1, 1, 0)), 7)) == []
+    assert _tags(changes.select(_items([2.0, 111.0, 1.0, None], (1, 1, 1, 0)), 8)) == ["dev1.a"]
+    assert _tags(changes.select(_items([2.0, 111.0, 1.0, float("nan")], (1, 1, 1, 0)), 9)) == ["dev1.d"]
+    assert _tags(changes.select(_items([2.0, 111.0, 1.0, float("nan")], (1, 1, 1, 0)), 10)) == ["dev1.c"]
+    # 非整数质量码按是否相等判断，恢复为整数后照常比较
+    assert _tags(changes.select(_items([2.0, 111.0, 1.0, float("nan")], ("good", 1, 1.5, 0)), 11)) == \
+        ["dev1.a", "dev1.c"]
+    assert _tags(changes.select(_items([2.0, 111.0, 1.0, float("nan")], ("good", 1, 1.5, 0)), 12)) == []
+    assert _tags(changes.select(_items([2.0, 111.0, 1.0, float("nan")], (1, 1, 1.5, None)), 13)) == \
+        ["dev1.a", "dev1.d"]
+    assert _tags(changes.select(_items([2.0, 111.0, 1.0, float("nan")], (1, 1, 1, 0)), 14)) == ["dev1.c", "dev1.d"]
+    assert _tags(changes.select(_items([2.0, 111.0, 1.0, float("nan")], (1, 1, 1, 0)), 14)) == []
+
+
+def test_deadband_filter():
+    """测试死区、质量码变化和心跳，NumPy 与纯 Python 实现结果一致"""
+    print("=== Testing deadband filter ===")
+    _check_filter()
+    np = deadband.np
+    deadband.np = None
+    try:
+        _check_filter()
+    finally:
+        deadband.np = np
+    print()
+
+
+def test_all_static():
+    """测试值不变时只在心跳时重新发布"""
+    print("=== Testing static values ===")
+    tags = [f"dev{i}.a" for i in range(1000)]
+    changes = DeadbandFilter(tags, max_silence=60)
+    now = datetime.now()
+    items = [ValueItem(tag, now, float(i), 1) for i, tag in enumerate(tags)]
+    published = [len(changes.select(items, second)) for second in range(0, 121)]
+    print(f"Published per tick: first={published[0]}, total={sum(published)}")
+    assert published[0] == 1000 and published[60] == 1000 and published[120] == 1000
+    assert sum(published) == 3000
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_deadband_filter()
+    test_all_static()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+设备树测试脚本
+"""
+
+import json
+import os
+import tempfile
+import time
+from catalog import TagCatalog
+from device_tree import DeviceTree, TreeSnapshot, device_tree
+from routes import dispatch
+
+TAGS = ["site.line1.motor1.speed", "site.line1.motor1.current", "site.line1.motor2.speed",
+        "site.line2.pump1.flow", "site.env"]
+
+
+def _decode(cached):
+    return json.loads(cached.body)
+
+
+def test_tree():
+    """测试由测点目录生成设备树，以及按层级展开"""
+    print("=== Testing tree ===")
+    snapshot = TreeSnapshot(TAGS)
+    tree = _decode(snapshot.devices(None, None, None, None))
+    print(json.dumps(tree))
+    assert [node["tag"] for node in tree] == ["site"]
+    # site 直接挂有测点 env，同时也有下级节点
+    assert tree[0]["isDevice"] is True
+    line1 = tree[0]["children"][0]
+    assert [child["name"] for child in line1["children"]] == ["motor1", "motor2"]
+    assert line1["isDevice"] is False and line1["children"][0]["isDevice"] is True
+
+    shallow = _decode(snapshot.devices("site", 1, None, None))
+    assert shallow == [{"tag": "site.line1", "name": "line1", "isDevice": False, "hasChildren": True},
+                       {"tag": "site.line2", "name": "line2", "isDevice": False, "hasChildren": True}]
+    two = _decode(snapshot.devices(None, 2, None, None))
+    assert "children" not in two[0]["children"][0] and two[0]["children"][0]["hasChildren"] is True
+
+    points = _decode(snapshot.point_list("site.line1.motor1", None, None))
+    assert points == [{"tag": "site.line1.motor1.speed", "name": "speed"},
+                      {"tag": "site.line1.motor1.current", "name": "current"}]
+    assert _decode(snapshot.point_list("no.such.device", None, None)) == []
+    print()
+
+
+def test_pagination():
+    """测试按游标分页，逐页取完与一次取全部结果一致"""
+    print("=== Testing pagination ===")
+    snapshot = TreeSnapshot([f"plant.dev{i}.a" for i in range(25)])
+    collected, cursor, pages = [], None, 0
+    while True:
+        page = _decode(snapshot.devices("plant", 1, cursor, 10))
+        collected.extend(node["tag"] for node in page["items"])
+        cursor = page["nextCursor"]
+        pages += 1
+        if cursor is None:
+            break
+    print(f"Pages: {pages}, devices: {len(collected)}")
+    assert pages == 3
+    assert collected == [f"plant.dev{i}" for i in range(25)]
+    # 相同参数返回同一个缓存对象
+    assert snapshot.devices("plant", 1, None, 10) is snapshot.devices("plant", 1, None, 10)
+    try:
+        snapshot.devices("plant", 1, "plant.missing", 10)
+        assert False, "invalid cursor accepted"
+    except ValueError:
+        pass
+    print()
+
+
+def test_etag():
+    """测试 ETag 和 If-None-Match"""
+    print("=== Testing ETag ===")
+    device_tree.set_catalog(TagCatalog.generate(2, 3, 2, 1.0))
+    body = json.dumps({"projectID": "p1"}).encode()
+    response = dispatch("GET", "/api/query_devices", body, {})
+    etag = dict(response.headers)["ETag"]
+    print(f"Status: {response.status}, ETag: {etag}")
+    assert response.status == 200 and len(json.loads(response.body)) == 2
+
+    response = dispatch("GET", "/api/query_devices", body, {"if-none-match": etag})
+    assert response.status == 304 and not response.body
+    response = dispatch("GET", "/api/query_devices", body, {"if-none-match": '"other"'})
+    assert response.status == 200
+
+    # 目录变化后内容和 ETag 都变化
+    device_tree.set_catalog(TagCatalog.generate(3, 3, 2, 1.0))
+    response = dispatch("GET", "/api/query_devices", body, {"if-none-match": etag})
+    assert response.status == 200 and len(json.loads(response.body)) == 3
+
+    response = dispatch("GET", "/api/query_points", json.dumps({"projectID": "p1", "parentTag": "group1.dev1",
+                                                                "limit": 1}).encode(), {})
+    assert json.loads(response.body) == {"items": [{"tag": "group1.dev1.a", "name": "a"}],
+                                         "nextCursor": "group1.dev1.a"}
+    response = dispatch("GET", "/api/query_devices", json.dumps({"projectID": "p1", "depth": 0}).encode(), {})
+    assert "error" in json.loads(response.body)[0]
+    device_tree.set_catalog(None)
+    print()
+
+
+def test_reload():
+    """测试目录文件变化后重建快照"""
+    print("=== Testing reload ===")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"groups": [{"tags": ["a.dev1.x"]}]}, f)
+        tree = DeviceTree(path=path, reload_interval=0)
+        first = tree.snapshot()
+        assert tree.snapshot() is first
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"groups": [{"tags": ["a.dev1.x", "b.dev1.x"]}]}, f)
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000_000))
+        second = tree.snapshot()
+        print(f"Roots: {[node.tag for node in second.roots]}")
+        assert second is not first and len(second.roots) == 2
+
+        # 文件内容不合法时继续使用旧快照
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{")
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 2_000_000_000))
+        assert tree.snapshot() is second
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_tree()
+    test_pagination()
+    test_etag()
+    test_reload()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+降采样测试脚本
+"""
+
+import downsample
+from downsample import downsample as run_downsample, parse_interval
+
+
+def test_parse_interval():
+    """测试 interval 参数解析"""
+    print("=== Testing parse_interval ===")
+    for value in ("500ms", "10s", "5m", "1h", "1d", 1000, "1000", None, 0):
+        print(f"{value!r} -> {parse_interval(value)}")
+    assert parse_interval("10s") == 10000
+    assert parse_interval("5m") == 300000
+    assert parse_interval(1000) == 1000
+    assert parse_interval(None) is None
+    print()
+
+
+def _check_buckets(buckets):
+    assert buckets['time'] == [0, 10000, 20000]
+    assert buckets['count'] == [10, 10, 5]
+    assert buckets['first'] == [0.0, 10.0, 20.0]
+    assert buckets['last'] == [9.0, 19.0, 24.0]
+    assert buckets['min'] == [0.0, 10.0, 20.0]
+    assert buckets['max'] == [9.0, 19.0, 24.0]
+    assert buckets['avg'] == [4.5, 14.5, 22.0]
+
+
+def test_downsample():
+    """测试分桶聚合，NumPy 与纯 Python 实现结果一致"""
+    print("=== Testing downsample ===")
+    times = [i * 1000 for i in range(25)]
+    values = [float(i) for i in range(25)]
+
+    buckets = run_downsample(times, values, 10000)
+    print(f"Buckets: {buckets}")
+    _check_buckets(buckets)
+    _check_buckets(downsample._downsample_python(times, values, 10000, 0))
+
+    assert run_downsample([], [], 10000)['time'] == []
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_parse_interval()
+    test_downsample()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
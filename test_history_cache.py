@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+历史查询结果缓存测试脚本
+"""
+
+import json
+import threading
+import time
+from history_cache import HistoryCache, history_cache
+from history_store import history_store
+from api_handler import query_history
+
+
+def _query(request):
+    return json.loads(query_history(request).to_json())
+
+
+def test_closed_and_open_windows():
+    """测试已封闭的窗口不失效，延伸到当前的窗口在写入新数据后失效"""
+    print("=== Testing invalidation ===")
+    history_cache.clear()
+    tag = "cache.test.a"
+    base = int(time.time() * 1000) - 10_000
+    for i in range(5):
+        history_store.append(tag, base + i * 1000, float(i))
+
+    closed = {"tag": [tag], "start": base, "end": base + 2000}
+    open_ended = {"tag": [tag], "start": base}
+    assert len(_query(closed)["results"][0]["values"]) == 3
+    assert len(_query(open_ended)["results"][0]["values"]) == 5
+
+    history_store.append(tag, base + 5000, 5.0)
+    # 新数据落在封闭窗口之后，封闭窗口仍命中缓存；未给出 end 的窗口重新计算
+    assert len(_query(closed)["results"][0]["values"]) == 3
+    assert len(_query(open_ended)["results"][0]["values"]) == 6
+
+    # 时间写法不同的同一查询共用一个条目
+    before = len(history_cache)
+    iso = {"tag": [tag], "start": str(base), "end": str(base + 2000), "offset": 0}
+    assert _query(iso) == _query(closed)
+    assert len(history_cache) == before
+    print(f"{len(history_cache)} entries, {history_cache.bytes} bytes")
+    print()
+
+
+def test_coalescing():
+    """测试同一键的并发查询只计算一次"""
+    print("=== Testing coalescing ===")
+    cache = HistoryCache(max_bytes=1024 * 1024)
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return '{"tag": "a", "values": []}'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(("a",), 0, None, compute)))
+               for _ in range(10)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"{len(results)} results, {len(calls)} computation(s)")
+    assert len(calls) == 1 and len(set(results)) == 1 and len(results) == 10
+
+    # 计算失败时等待者收到同一异常，之后的查询重新计算
+    def fail():
+        raise ValueError("boom")
+    try:
+        cache.get(("b",), 0, None, fail)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    assert cache.get(("b",), 0, None, lambda: "ok") == "ok"
+    print()
+
+
+def test_memory_cap():
+    """测试按内存上限淘汰最久未用的条目"""
+    print("=== Testing memory cap ===")
+    cache = HistoryCache(max_bytes=4096)
+    text = "x" * 1000
+    for i in range(10):
+        cache.get(i, 0, None, lambda: text)
+    print(f"{len(cache)} entries, {cache.bytes} bytes")
+    # 按编码后的实际字节数计算
+    assert cache.bytes == 4000 and len(cache) == 4
+    assert cache.get(9, 0, None, lambda: "recomputed") == text
+    assert cache.get(0, 0, None, lambda: "recomputed") == "recomputed"
+    # 超过上限的单个结果不缓存
+    cache.get("big", 0, None, lambda: "y" * 10000)
+    assert "big" not in cache._entries
+
+    # 非 ASCII 文本按 UTF-8 字节数，MessagePack 按 bytes 长度
+    cache = HistoryCache(max_bytes=4096)
+    cache.get("utf8", 0, None, lambda: "测" * 100)
+    cache.get("packed", 0, None, lambda: b"\x00" * 100)
+    assert cache.bytes == 400
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_closed_and_open_windows()
+    test_coalescing()
+    test_memory_cap()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
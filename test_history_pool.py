@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+多测点历史查询并行执行测试脚本
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from models import ValueItem
+import api_handler
+from history_pool import CANCELLED, HistoryPool
+from msgpack_codec import CONTENT_TYPE, unpackb
+from projects import projects
+from routes import dispatch
+
+
+def test_order_and_parallelism():
+    """测试结果按输入顺序输出，在途数量不超过上限"""
+    print("=== Testing order and parallelism ===")
+    pool = HistoryPool(workers=4, parallelism=3)
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def work(i):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        # 越靠前的测点越慢，验证输出顺序不取决于完成顺序
+        time.sleep(0.05 - i * 0.002)
+        with lock:
+            state["running"] -= 1
+        return i * 10
+
+    try:
+        started = time.perf_counter()
+        results = list(pool.map(work, range(12)))
+        elapsed = time.perf_counter() - started
+        print(f"12 tags in {elapsed * 1000:.0f} ms, peak {state['peak']} in flight")
+        assert results == [i * 10 for i in range(12)]
+        assert state["peak"] <= 3
+        # 逐个执行约需 12 * 39 ms
+        assert elapsed < 0.3
+
+        # 线程数不大于 1 时逐个执行
+        assert list(HistoryPool(workers=1).map(lambda i: i + 1, [1, 2])) == [2, 3]
+    finally:
+        pool.shutdown()
+    print()
+
+
+def test_error():
+    """测试单个测点出错时异常传给调用方"""
+    print("=== Testing error ===")
+    pool = HistoryPool(workers=2)
+
+    def work(i):
+        if i == 1:
+            raise ValueError("bad tag")
+        return i
+
+    try:
+        results = pool.map(work, range(4))
+        assert next(results) == 0
+        try:
+            next(results)
+            assert False, "expected ValueError"
+        except ValueError as e:
+            print(e)
+    finally:
+        pool.shutdown()
+    print()
+
+
+def test_cancel():
+    """测试关闭结果生成器时取消尚未开始的查询"""
+    print("=== Testing cancel ===")
+    pool = HistoryPool(workers=2, parallelism=4)
+    release = threading.Event()
+    calls = []
+
+    def work(i):
+        calls.append(i)
+        if i > 0:
+            release.wait(1)
+        return i
+
+    cancelled = CANCELLED.labels()
+    before = cancelled.value
+    try:
+        results = pool.map(work, range(10))
+        # 取第一个结果时已提交 4 个查询：两个线程被 1、2 占用，3 还在排队
+        assert next(results) == 0
+        results.close()
+        release.set()
+        time.sleep(0.05)
+        print(f"started {sorted(calls)}, cancelled {cancelled.value - before}")
+        assert 3 not in calls and max(calls) <= 2
+        assert cancelled.value - before >= 1
+    finally:
+        release.set()
+        pool.shutdown()
+    print()
+
+
+def test_query_history():
+    """测试并行查询的 query_history 与逐个查询结果一致"""
+    print("=== Testing query_history ===")
+    project = projects.get(None)
+    now = datetime.now()
+    tags = [f"pool.dev{i}.value" for i in range(20)]
+    items = [ValueItem(tag, now - timedelta(seconds=s), float(i * 100 + s))
+             for i, tag in enumerate(tags) for s in range(5)]
+    project.history.append_many(items)
+    request = {"tag": tags, "order": "desc"}
+
+    original = api_handler.history_pool
+    try:
+        api_handler.history_pool = HistoryPool(workers=1)
+        expected = api_handler.query_history(request).to_json()
+        project.history_cache.clear()
+        api_handler.history_pool = HistoryPool(workers=4, parallelism=4)
+        actual = api_handler.query_history(request).to_json()
+        api_handler.history_pool.shutdown()
+    finally:
+        api_handler.history_pool = original
+    assert actual == expected
+    results = json.loads(actual)["results"]
+    assert [r["tag"] for r in results] == tags
+    print(f"{len(results)} tags, first: {results[0]['values'][0]}")
+    print()
+
+
+def test_query_history_errors():
+    """测试非法标签在返回前报错，单个标签查询出错时只影响该标签的结果"""
+    print("=== Testing query_history errors ===")
+    body = json.dumps({"tag": [{"x": 1}, "a.b"]}).encode()
+    response = dispatch("POST", "/api/query_history", body, {})
+    print(response.status, response.body)
+    assert response.status == 200 and "error" in json.loads(response.body)
+    response = dispatch("POST", "/api/query_history", body, {}, "stream=1")
+    assert response.status == 200 and "error" in json.loads(response.body)
+
+    original = api_handler._cached_tag_history
+
+    def flaky(project, tag, *args):
+        if tag == "pool.bad.value":
+            raise RuntimeError("storage unavailable")
+        return original(project, tag, *args)
+
+    tags = ["pool.dev0.value", "pool.bad.value", "pool.dev1.value"]
+    api_handler._cached_tag_history = flaky
+    try:
+        body = json.dumps({"tag": tags}).encode()
+        streamed = dispatch("POST", "/api/query_history", body, {}, "stream=1")
+        results = json.loads(''.join(chunk if isinstance(chunk, str) else chunk.decode() for chunk in streamed.chunks))
+        packed = dispatch("POST", "/api/query_history", body, {"accept": CONTENT_TYPE})
+    finally:
+        api_handler._cached_tag_history = original
+    print(results["results"][1])
+    assert [r["tag"] for r in results["results"]] == tags
+    assert results["results"][1] == {"tag": "pool.bad.value", "error": "storage unavailable"}
+    assert "values" in results["results"][0] and "values" in results["results"][2]
+    assert unpackb(packed.body)["results"][1] == {"tag": "pool.bad.value", "error": "storage unavailable"}
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_order_and_parallelism()
+    test_error()
+    test_cancel()
+    test_query_history()
+    test_query_history_errors()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
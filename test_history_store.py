@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+历史数据存储测试脚本
+"""
+
+import os
+import time
+from datetime import datetime
+from history_store import HistoryStore, TagHistory, from_epoch_ms, to_epoch_ms, window
+from models import format_time
+
+
+def test_to_epoch_ms():
+    """测试时间参数转换"""
+    print("=== Testing to_epoch_ms ===")
+    print(f"2022-01-01T00:00:00Z -> {to_epoch_ms('2022-01-01T00:00:00Z')}")
+    assert to_epoch_ms("2022-01-01T00:00:00+00:00") == 1640995200000
+    assert to_epoch_ms("2022-01-01T00:00:00Z") == int(datetime(2022, 1, 1).timestamp() * 1000)
+    assert to_epoch_ms(1640995200000) == 1640995200000
+    assert to_epoch_ms("1640995200000") == 1640995200000
+    assert to_epoch_ms(None) is None
+    print()
+
+
+def test_window():
+    """测试 offset/limit/order 换算"""
+    print("=== Testing window ===")
+    assert window(0, 10, 2, 3) == (2, 5)
+    assert window(0, 10, 2, 3, True) == (5, 8)
+    assert window(0, 10, 20, 3) == (10, 10)
+    assert window(0, 10, 0, None, True) == (0, 10)
+    print()
+
+
+def test_ring_buffer():
+    """测试环形缓冲区回绕后的范围查询"""
+    print("=== Testing TagHistory ===")
+    series = TagHistory(5)
+    for ts in range(1, 9):
+        series.append(ts * 1000, float(ts))
+    # 只保留最近 5 个点：4..8
+    times, values = series.query(None, None)
+    print(f"All: {list(times)} {list(values)}")
+    assert list(values) == [4.0, 5.0, 6.0, 7.0, 8.0]
+
+    times, values = series.query(5000, 7000)
+    assert list(values) == [5.0, 6.0, 7.0]
+
+    times, values = series.query(None, None, offset=1, limit=2, descending=True)
+    print(f"Desc offset=1 limit=2: {list(values)}")
+    assert list(values) == [7.0, 6.0]
+
+    # 早于最后一个点的数据被丢弃
+    assert not series.append(1000, 1.0)
+    print()
+
+
+def test_history_store():
+    """测试按标签写入和查询"""
+    print("=== Testing HistoryStore ===")
+    store = HistoryStore(100)
+    now = datetime(2022, 1, 1, 8, 0, 0)
+    store.append("group1.dev1.a", to_epoch_ms(now), 12.3)
+    assert not store.append("group1.dev1.a", to_epoch_ms(now), "not a number")
+
+    times, values = store.query("group1.dev1.a", None, None)
+    print(f"group1.dev1.a: {list(times)} {list(values)}")
+    assert list(values) == [12.3]
+    assert len(store.query("missing", None, None)[0]) == 0
+    print()
+
+
+def test_local_time_round_trip():
+    """测试非 UTC 时区下响应中的时间可以直接作为查询条件"""
+    print("=== Testing local time round trip ===")
+    original = os.environ.get("TZ")
+    os.environ["TZ"] = "Asia/Shanghai"
+    time.tzset()
+    try:
+        ms = to_epoch_ms(datetime(2024, 1, 1, 8, 0))
+        text = format_time(from_epoch_ms(ms))
+        print(f"{ms} -> {text}")
+        assert text == "2024-01-01T08:00:00.000000Z"
+        assert to_epoch_ms(text) == ms
+        assert to_epoch_ms("2024-01-01T00:00:00+00:00") == ms
+
+        store = HistoryStore(10)
+        store.append("group1.dev1.a", ms, 1.0)
+        times, values = store.query("group1.dev1.a", to_epoch_ms(text), to_epoch_ms(text))
+        assert list(values) == [1.0]
+    finally:
+        if original is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = original
+        time.tzset()
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_to_epoch_ms()
+    test_window()
+    test_ring_buffer()
+    test_history_store()
+    test_local_time_round_trip()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+运行指标测试脚本
+"""
+
+from metrics import Counter, Gauge, Histogram, Registry, REGISTRY
+from routes import dispatch
+
+
+def test_metric_types():
+    """测试计数器、仪表和直方图的文本输出"""
+    print("=== Testing metric types ===")
+    registry = Registry()
+    requests = Counter('requests_total', 'Requests.', ('route',), registry=registry)
+    in_flight = Gauge('in_flight', 'In flight.', registry=registry)
+    latency = Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0), registry=registry)
+
+    requests.labels('/a').inc()
+    requests.labels('/a').inc(2)
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    text = registry.render().decode('utf-8')
+    print(text)
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/a"} 3' in text
+    assert 'in_flight 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+    print()
+
+
+def test_metrics_endpoint():
+    """测试 /metrics 接口和请求指标"""
+    print("=== Testing /metrics ===")
+    in_flight = REGISTRY.get('http_requests_in_flight')._default
+    before = in_flight.value
+    dispatch('GET', '/health', None)
+    dispatch('GET', '/no/such/path', None)
+    response = dispatch('GET', '/metrics', None)
+    text = response.body.decode('utf-8')
+    assert response.status == 200
+    assert response.content_type.startswith('text/plain')
+    assert 'http_requests_total{route="/health",method="GET",status="200"}' in text
+    assert 'http_requests_total{route="other",method="GET",status="404"}' in text
+    assert in_flight.value == before
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_metric_types()
+    test_metrics_endpoint()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
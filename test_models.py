@@ -8,13 +8,18 @@ from models import ValueItem, DataItem, Result, HistoryResponse, TagPoint, Devic
 import json
 
 
+def fields(obj):
+    """模型使用 __slots__，没有 __dict__，按槽位列出属性"""
+    return {name: getattr(obj, name) for name in obj.__slots__}
+
+
 def test_value_item():
     """测试 ValueItem 模型"""
     print("=== Testing ValueItem ===")
     now = datetime.now()
     item = ValueItem("test.tag", now, 123.45, 1)
     
-    print(f"Original: {item.__dict__}")
+    print(f"Original: {fields(item)}")
     print(f"To dict: {item.to_dict()}")
     print(f"To JSON: {item.to_json()}")
     print()
@@ -26,7 +31,7 @@ def test_data_item():
     now = datetime.now()
     item = DataItem(123.45, now)
     
-    print(f"Original: {item.__dict__}")
+    print(f"Original: {fields(item)}")
     print(f"To dict: {item.to_dict()}")
     print(f"To JSON: {item.to_json()}")
     print()
@@ -39,7 +44,7 @@ def test_result():
     data_items = [DataItem(123.45, now), DataItem(67.89, now)]
     result = Result("test.tag", data_items)
     
-    print(f"Original: {result.__dict__}")
+    print(f"Original: {fields(result)}")
     print(f"To dict: {result.to_dict()}")
     print(f"To JSON: {result.to_json()}")
     print()
@@ -53,7 +58,7 @@ def test_history_response():
     result = Result("test.tag", data_items)
     response = HistoryResponse([result], "Success", "200")
     
-    print(f"Original: {response.__dict__}")
+    print(f"Original: {fields(response)}")
     print(f"To dict: {response.to_dict()}")
     print(f"To JSON: {response.to_json()}")
     print()
@@ -64,7 +69,7 @@ def test_tag_point():
     print("=== Testing TagPoint ===")
     point = TagPoint("test.tag", "Test Point")
     
-    print(f"Original: {point.__dict__}")
+    print(f"Original: {fields(point)}")
     print(f"To dict: {point.to_dict()}")
     print(f"To JSON: {point.to_json()}")
     print()
@@ -79,7 +84,7 @@ def test_device():
     ]
     device = Device("group1", "Group 1", children, False)
     
-    print(f"Original: {device.__dict__}")
+    print(f"Original: {fields(device)}")
     print(f"To dict: {device.to_dict()}")
     print(f"To JSON: {device.to_json()}")
     print()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+MessagePack 编码测试脚本
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+from models import (DataItem, EncodedResult, HistoryResponse, PackedResult, Result, ValueItem, ValueItemPacker,
+                    pack_result)
+from msgpack_codec import CONTENT_TYPE, accepts, columns, epoch_ms, packb, unpackb
+from history_store import history_store
+from realtime_store import latest_values
+from nats_service import NatsPushService
+from nats_requests import NatsRequestService, request
+from routes import dispatch
+from test_nats_requests import FakeBroker
+
+
+def test_codec():
+    """测试各类型的编解码和边界长度"""
+    print("=== Testing codec ===")
+    values = [0, 127, 128, 255, 256, 65535, 65536, 2 ** 32, 2 ** 64 - 1, -1, -32, -33, -128, -129,
+              -2 ** 15 - 1, -2 ** 31 - 1, -2 ** 63, 1.5, -0.0, float('inf'), None, True, False,
+              "", "a" * 31, "b" * 32, "c" * 256, "d" * 70000, "测点", b"\x00\x01", b"x" * 300,
+              [], list(range(20)), {"k": {"nested": [1, "2", None]}}, {str(i): i for i in range(20)}]
+    for value in values:
+        assert unpackb(packb(value)) == value, value
+    # 与其他 MessagePack 实现的输出逐字节一致
+    assert packb({"a": 1}) == b'\x81\xa1a\x01'
+    assert packb([1.5, -1, 300]) == b'\x93\xcb\x3f\xf8\x00\x00\x00\x00\x00\x00\xff\xcd\x01\x2c'
+    assert packb(datetime.fromtimestamp(1.5)) == packb(1500)
+
+    for data in (b'\x92\x01', b'\x01\x02', b'\xc1', b'\xa5abc'):
+        try:
+            unpackb(data)
+            assert False, f"expected ValueError for {data!r}"
+        except ValueError as e:
+            print(e)
+    print()
+
+
+def test_models():
+    """测试模型的 MessagePack 编码"""
+    print("=== Testing models ===")
+    now = datetime.now().replace(microsecond=123000)
+    item = ValueItem("group1.dev1.a", now, 12.345678901234, 1)
+    assert unpackb(item.to_msgpack()) == ["group1.dev1.a", epoch_ms(now), 12.345678901234, 1]
+    items = [item, ValueItem("group1.dev1.b", now, "on", 0), ValueItem("group1.dev1.a", now, 7, 1)]
+    assert ValueItemPacker().encode(items) == [i.to_msgpack() for i in items]
+
+    times = [epoch_ms(now) + i * 1000 for i in range(5)]
+    values = [i * 1.5 for i in range(5)]
+    result = Result("t", [DataItem(v, datetime.fromtimestamp(ts / 1000)) for ts, v in zip(times, values)])
+    packed = pack_result("t", times, values)
+    assert result.to_msgpack() == packed
+    encoded = result._encode(False)
+    assert EncodedResult("t", encoded, lambda: packed).to_msgpack() == packed
+    assert PackedResult("t", packed, lambda: encoded).to_dict() == result.to_dict()
+    assert PackedResult("t", packed, lambda: encoded).to_json() == result.to_json()
+    decoded = unpackb(packed)
+    assert decoded["tag"] == "t" and list(columns(decoded)[0]) == times and list(columns(decoded)[1]) == values
+
+    response = HistoryResponse([result], msg="ok")
+    assert unpackb(response.to_msgpack())["msg"] == "ok"
+    assert b''.join(HistoryResponse(iter([result]), count=1).iter_msgpack()) == \
+        HistoryResponse([result]).to_msgpack()
+
+    # 体积：实时数据与历史数据
+    json_size = len(item.to_json())
+    msgpack_size = len(item.to_msgpack())
+    print(f"realtime sample: json {json_size} B, msgpack {msgpack_size} B")
+    assert msgpack_size * 2.5 < json_size
+    points = [DataItem(20 + i * 0.01, now + timedelta(seconds=i)) for i in range(3600)]
+    history = Result("group1.dev1.a", points)
+    json_size = len(history.to_json())
+    msgpack_size = len(history.to_msgpack())
+    print(f"3600 history points: json {json_size} B, msgpack {msgpack_size} B ({json_size / msgpack_size:.1f}x)")
+    assert msgpack_size * 3 < json_size
+    print()
+
+
+def test_http():
+    """测试 HTTP 按 Accept / Content-Type 协商 MessagePack"""
+    print("=== Testing HTTP ===")
+    base = 1_700_100_000_000
+    for i in range(100):
+        history_store.append("mp.dev1.a", base + i * 1000, float(i))
+    latest_values.update(ValueItem("mp.dev1.a", datetime.now(), 99.0, 1))
+
+    request_body = packb({"tag": ["mp.dev1.a", "mp.dev1.missing"], "order": "desc"})
+    headers = {"accept": CONTENT_TYPE, "content-type": CONTENT_TYPE}
+    response = dispatch("POST", "/api/query_history", request_body, headers)
+    assert response.status == 200 and response.content_type == CONTENT_TYPE
+    assert ('Vary', 'Accept') in response.headers
+    data = unpackb(response.body)
+    times, values = columns(data["results"][0])
+    print(f"query_history: {len(response.body)} B, first {times[0]} {values[0]}")
+    assert list(values) == [float(i) for i in range(99, -1, -1)] and times[0] == base + 99000
+    assert len(columns(data["results"][1])[0]) == 0
+
+    # 流式响应的内容与普通响应一致
+    stream = dispatch("POST", "/api/query_history", request_body, headers, "stream=1")
+    assert b''.join(stream.chunks) == response.body
+
+    # JSON 请求仍返回 JSON，内容一致
+    plain = dispatch("POST", "/api/query_history", json.dumps({"tag": ["mp.dev1.a"], "order": "desc"}).encode(), {})
+    assert plain.content_type == 'application/json'
+    assert [v["value"] for v in json.loads(plain.body)["results"][0]["values"]] == list(values)
+
+    last = unpackb(dispatch("GET", "/api/find_last", packb({"tag": "mp.dev1.a"}), headers).body)
+    assert last[0] == "mp.dev1.a" and last[2] == 99.0
+
+    # Accept 按 q 值协商，q=0 表示不接受
+    assert accepts("application/msgpack") and accepts("application/json;q=0.5, application/x-msgpack")
+    assert not accepts("application/msgpack;q=0") and not accepts("application/msgpack;q=0.5, application/json")
+    assert not accepts("*/*") and not accepts(None)
+    refused = dispatch("GET", "/api/find_last", json.dumps({"tag": "mp.dev1.a"}).encode(),
+                       {"accept": "application/msgpack;q=0"})
+    assert refused.content_type == 'application/json'
+
+    error = dispatch("POST", "/api/query_history", b'\xc1', headers)
+    assert error.status == 400 and unpackb(error.body) == {"error": "Invalid MessagePack"}
+
+    # 缓存的设备树按格式区分 ETag
+    body = packb({"projectID": "test"})
+    devices = dispatch("GET", "/api/query_devices", body, headers)
+    etag = dict(devices.headers)['ETag']
+    assert etag.endswith('-msgpack"') and isinstance(unpackb(devices.body), list)
+    assert dispatch("GET", "/api/query_devices", body, {**headers, "if-none-match": etag}).status == 304
+    body = json.dumps({"projectID": "test"}).encode()
+    assert dispatch("GET", "/api/query_devices", body, {"if-none-match": etag}).status == 200
+    print()
+
+
+def test_nats():
+    """测试 NATS 推送和请求-应答的 MessagePack 格式"""
+    print("=== Testing NATS ===")
+    now = datetime.now()
+    items = [ValueItem("group1.dev1.a", now, 1.5, 1), ValueItem("group1.dev2.a", now, 2.5, 1)]
+    messages = NatsPushService(publish_mode="tag", payload_format="msgpack").encode_batch(items)
+    assert [payload for _, payload in messages] == [item.to_msgpack() for item in items]
+    messages = NatsPushService(publish_mode="device", payload_format="msgpack").encode_batch(items)
+    assert unpackb(messages[1][1]) == [unpackb(items[1].to_msgpack())]
+    messages = NatsPushService(publish_mode="tick", payload_format="msgpack").encode_batch(items)
+    assert unpackb(messages[0][1]) == [unpackb(item.to_msgpack()) for item in items]
+    try:
+        NatsPushService(payload_format="xml")
+        assert False, "expected ValueError"
+    except ValueError as e:
+        print(e)
+
+    for i in range(100):
+        history_store.append("mp.dev2.a", 1_700_200_000_000 + i * 1000, float(i))
+
+    async def run():
+        broker = FakeBroker()
+        service = NatsRequestService(broker, prefix="mp.req", queue="adaptors")
+        await service.start()
+        try:
+            history = await request(broker, "query_history", {"tag": ["mp.dev2.a"]}, prefix="mp.req", binary=True)
+            unknown = await request(broker, "no_such_op", {}, prefix="mp.req", binary=True)
+            plain = await request(broker, "query_history", {"tag": ["mp.dev2.a"]}, prefix="mp.req")
+            return history, unknown, plain
+        finally:
+            await service.close()
+
+    history, unknown, plain = asyncio.run(run())
+    times, values = columns(history["results"][0])
+    print(f"NATS query_history: {len(values)} points")
+    assert list(values) == [v["value"] for v in plain["results"][0]["values"]]
+    assert unknown == {"error": "Not found"}
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_codec()
+    test_models()
+    test_http()
+    test_nats()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -4,6 +4,7 @@ NATS 连接测试脚本
 """
 
 import asyncio
+import json
 import logging
 from nats_service import NatsPushService
 from models import ValueItem
@@ -40,8 +41,32 @@ async def test_nats_connection():
         logger.info("Make sure NATS server is running on nats://127.0.0.1:4222")
 
 
+def test_encode_batch():
+    """测试批量编码，tag 模式的消息内容与单条推送一致"""
+    now = datetime.now()
+    items = [
+        ValueItem("group1.dev1.a", now, 1.5, 1),
+        ValueItem("group1.dev1.b", now, 2.5, 1),
+        ValueItem("group1.dev2.a", now, 3.5, 0),
+    ]
+
+    messages = NatsPushService(publish_mode="tag").encode_batch(items)
+    logger.info(f"tag mode: {messages}")
+    assert [subject for subject, _ in messages] == [f"rtdb.iotopo.{item.tag}" for item in items]
+    assert [payload for _, payload in messages] == [item.to_json().encode('utf-8') for item in items]
+
+    messages = NatsPushService(publish_mode="device").encode_batch(items)
+    logger.info(f"device mode: {messages}")
+    assert [subject for subject, _ in messages] == ["rtdb.iotopo.device.group1.dev1", "rtdb.iotopo.device.group1.dev2"]
+
+    messages = NatsPushService(publish_mode="tick").encode_batch(items)
+    assert len(messages) == 1
+    assert json.loads(messages[0][1]) == [item.to_dict() for item in items]
+
+
 async def main():
     """主函数"""
+    test_encode_batch()
     await test_nats_connection()
 
 
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+NATS 请求-应答接口测试脚本
+"""
+
+import asyncio
+import itertools
+from datetime import datetime
+from models import ValueItem
+from realtime_store import latest_values
+from history_store import history_store
+from catalog import TagCatalog
+import nats_service
+from nats_service import NatsPushService
+from nats_requests import NatsRequestService, request, split_chunks
+
+
+class FakeMsg:
+    def __init__(self, subject, data, reply, headers):
+        self.subject = subject
+        self.data = data
+        self.reply = reply
+        self.headers = headers
+
+
+class FakeSubscription:
+    def __init__(self, broker, subject, queue, cb):
+        self.broker = broker
+        self.subject = subject
+        self.queue = queue
+        self.cb = cb
+        self.messages = asyncio.Queue()
+
+    def matches(self, subject):
+        if self.subject.endswith('.>'):
+            return subject.startswith(self.subject[:-1]) and len(subject) > len(self.subject) - 1
+        if self.subject.endswith('.*'):
+            prefix = self.subject[:-1]
+            return subject.startswith(prefix) and '.' not in subject[len(prefix):]
+        return subject == self.subject
+
+    async def next_msg(self, timeout):
+        return await asyncio.wait_for(self.messages.get(), timeout)
+
+    async def unsubscribe(self):
+        self.broker.subscriptions.remove(self)
+
+
+class FakeBroker:
+    """进程内模拟 NATS 的发布订阅和队列组：同一队列组的订阅轮流接收消息"""
+
+    def __init__(self, max_payload=1024 * 1024):
+        self.max_payload = max_payload
+        self.subscriptions = []
+        self.inboxes = itertools.count()
+        self.rotation = itertools.count()
+        self.delivered = {}
+        self.chunks = 0
+
+    def new_inbox(self):
+        return f"_INBOX.{next(self.inboxes)}"
+
+    async def subscribe(self, subject, queue='', cb=None):
+        subscription = FakeSubscription(self, subject, queue, cb)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    async def publish(self, subject, payload=b'', reply='', headers=None):
+        assert len(payload) <= self.max_payload
+        if headers:
+            self.chunks += 1
+        msg = FakeMsg(subject, payload, reply, headers)
+        matched = [s for s in self.subscriptions if s.matches(subject)]
+        queued = [s for s in matched if s.queue]
+        targets = [s for s in matched if not s.queue]
+        if queued:
+            targets.append(queued[next(self.rotation) % len(queued)])
+        for subscription in targets:
+            self.delivered[id(subscription)] = self.delivered.get(id(subscription), 0) + 1
+            if subscription.cb is not None:
+                asyncio.create_task(subscription.cb(msg))
+            else:
+                subscription.messages.put_nowait(msg)
+
+
+def test_split_chunks():
+    """测试分块：合并小片段，切开超长片段，拼接后内容不变"""
+    print("=== Testing split_chunks ===")
+    parts = [b'ab', b'cd', b'efghijklmn', b'o']
+    chunks = list(split_chunks(parts, 4))
+    print(f"Chunks: {chunks}")
+    assert b''.join(chunks) == b''.join(parts)
+    assert all(len(chunk) <= 4 for chunk in chunks)
+    assert list(split_chunks([], 4)) == [b'']
+    print()
+
+
+def test_request_reply():
+    """测试请求-应答：与 HTTP 接口相同的处理函数，大应答分块发送，队列组内分担请求"""
+    print("=== Testing request reply ===")
+    latest_values.update(ValueItem("nreq.dev1.a", datetime.now(), 12.5, 1))
+    for i in range(3000):
+        history_store.append("nreq.dev1.a", 1_700_000_000_000 + i * 1000, float(i))
+
+    async def run():
+        broker = FakeBroker(max_payload=16 * 1024)
+        services = [NatsRequestService(broker, prefix="test.req", queue="adaptors", workers=2)
+                    for _ in range(2)]
+        for service in services:
+            await service.start()
+        try:
+            last = await request(broker, "find_last", {"projectID": "p1", "tag": "nreq.dev1.a"}, prefix="test.req")
+            missing = await request(broker, "find_last", {"projectID": "p1"}, prefix="test.req")
+            history = await request(broker, "query_history", {"projectID": "p1", "tag": ["nreq.dev1.a"]},
+                                    prefix="test.req")
+            unknown = await request(broker, "no_such_op", {}, prefix="test.req")
+            delivered = [broker.delivered.get(id(s.subscription), 0) for s in services]
+            return last, missing, history, unknown, delivered, broker.chunks
+        finally:
+            for service in services:
+                await service.close()
+
+    last, missing, history, unknown, delivered, chunks = asyncio.run(run())
+    print(f"find_last: {last}, delivered per instance: {delivered}, history chunks: {chunks}")
+    assert last["value"] == 12.5
+    assert "error" in missing
+    assert unknown == {"error": "Not found"}
+    assert len(history["results"][0]["values"]) == 3000
+    assert history["results"][0]["values"][-1]["value"] == 2999.0
+    assert chunks > 1
+    assert delivered == [2, 2]
+    print()
+
+
+def test_rebind_on_new_connection():
+    """测试推送服务重新建立连接后，请求-应答服务在新连接上重新订阅"""
+    print("=== Testing rebind on new connection ===")
+    latest_values.update(ValueItem("nreq.dev2.a", datetime.now(), 7.5, 1))
+
+    async def run():
+        old, new = FakeBroker(), FakeBroker()
+        new.options = {}
+        new.is_connected = True
+        service = NatsRequestService(old, prefix="test.rebind")
+        await service.start()
+        push = NatsPushService(catalog=TagCatalog([]))
+        push.connect_callbacks.append(service.rebind)
+
+        async def connect(url, **kwargs):
+            return new
+
+        original = nats_service.nats.connect
+        nats_service.nats.connect = connect
+        try:
+            await push.connect()
+        finally:
+            nats_service.nats.connect = original
+        try:
+            reply = await request(new, "find_last", {"tag": "nreq.dev2.a"}, prefix="test.rebind")
+            return reply, service.nc is new, len(new.subscriptions)
+        finally:
+            await service.close()
+
+    reply, rebound, subscriptions = asyncio.run(run())
+    print(f"find_last on new connection: {reply}")
+    assert rebound and subscriptions == 1
+    assert reply["value"] == 7.5
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_split_chunks()
+    test_request_reply()
+    test_rebind_on_new_connection()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
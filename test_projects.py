@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+多项目测试脚本
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime
+from models import ValueItem
+import api_handler
+import config
+from projects import DEFAULT_PROJECT, ProjectRegistry, default_project, load_projects, projects
+from write_pipeline import wait_all, WRITE_SUCCESS
+
+
+def _load(directory):
+    catalog = os.path.join(directory, "plant1-tags.json")
+    with open(catalog, "w", encoding="utf-8") as f:
+        json.dump({"groups": [{"name": "fast", "period": 1, "tags": ["line1.motor1.speed"]}]}, f)
+    path = os.path.join(directory, "projects.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"default": "plant1", "projects": [
+            {"id": "plant1", "catalog": catalog, "subjectPrefix": "rtdb.plant1"},
+            {"id": "plant2", "historyRetention": 10, "historyCacheSize": 1024},
+        ]}, f)
+    return load_projects(path)
+
+
+def test_registry():
+    """测试项目文件的加载和 projectID 路由"""
+    print("=== Testing registry ===")
+    with tempfile.TemporaryDirectory() as directory:
+        registry = _load(directory)
+        plant1 = registry.get("plant1")
+        plant2 = registry.get("plant2")
+        print(list(registry))
+        assert plant1.subject_prefix == "rtdb.plant1"
+        assert plant2.subject_prefix == f"{config.NATS_SUBJECT_PREFIX}.plant2"
+        assert plant2.history.capacity == 10 and plant2.history_cache.max_bytes == 1024
+        assert plant1.load_catalog().tags() == ["line1.motor1.speed"]
+        assert len(plant2.load_catalog()) == 0
+        # 不带 projectID 时使用 default，未知项目报错
+        assert registry.get(None) is plant1
+        for project_id in ("missing", 1):
+            try:
+                registry.get(project_id)
+                assert False, "expected ValueError"
+            except ValueError as e:
+                print(e)
+
+    # 未配置项目文件时任何 projectID 都路由到默认项目
+    assert projects.get("anything").id == DEFAULT_PROJECT
+    assert projects.get(None) is projects.get("test")
+    try:
+        ProjectRegistry([], "nope")
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    print()
+
+
+def test_isolation():
+    """测试各项目的最新值、历史数据和设备树互不可见"""
+    print("=== Testing isolation ===")
+    with tempfile.TemporaryDirectory() as directory:
+        registry = _load(directory)
+        original = api_handler.projects
+        api_handler.projects = registry
+        try:
+            now = datetime.now()
+            for project_id, value in (("plant1", 1.0), ("plant2", 2.0)):
+                project = registry.get(project_id)
+                items = [ValueItem("line1.motor1.speed", now, value)]
+                project.latest_values.update_many(items)
+                project.history.append_many(items)
+
+            assert api_handler.find_last({"projectID": "plant1", "tag": "line1.motor1.speed"}).value == 1.0
+            assert api_handler.find_last({"projectID": "plant2", "tag": "line1.motor1.speed"}).value == 2.0
+            assert "error" in api_handler.find_last({"projectID": "plant3", "tag": "line1.motor1.speed"})
+
+            for project_id, value in (("plant1", 1.0), ("plant2", 2.0)):
+                response = json.loads(api_handler.query_history(
+                    {"projectID": project_id, "tag": ["line1.motor1.speed"]}).to_json())
+                assert response["results"][0]["values"][0]["value"] == value
+            assert len(registry.get("plant2").history_cache) == 1
+
+            devices = api_handler.query_devices({"projectID": "plant1"})
+            assert json.loads(devices.body)[0]["tag"] == "line1"
+            assert json.loads(api_handler.query_devices({"projectID": "plant2"}).body) == []
+
+            # 写值进入各自项目的流水线
+            result = api_handler.set_value({"projectID": "plant2", "tag": "line1.motor1.speed",
+                                            "value": 5.0, "ack": True})
+            assert result["code"] == "success"
+            assert registry.get("plant2").latest_values.get("line1.motor1.speed").value == 5.0
+            assert registry.get("plant1").latest_values.get("line1.motor1.speed").value == 1.0
+        finally:
+            api_handler.projects = original
+            for project in registry:
+                project.close()
+    print()
+
+
+def test_default_project_prefork():
+    """测试多进程模式下默认项目才创建共享内存表，导入时不创建"""
+    print("=== Testing default project in prefork mode ===")
+    from realtime_store import LatestValueStore, latest_values
+    from shared_values import SharedLatestValueStore
+    assert type(latest_values) is LatestValueStore
+
+    original = config.HTTP_PROCESSES
+    config.HTTP_PROCESSES = 2
+    try:
+        project = default_project()
+    finally:
+        config.HTTP_PROCESSES = original
+    try:
+        assert isinstance(project.latest_values, SharedLatestValueStore)
+        assert wait_all(project.write_pipeline.submit([{"tag": "a.b", "value": 1.0}]), 2.0) == [WRITE_SUCCESS]
+        assert project.latest_values.get("a.b").value == 1.0
+        assert latest_values.get("a.b") is None
+    finally:
+        project.write_pipeline.close(1.0)
+        project.latest_values.close(unlink=True)
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_registry()
+    test_isolation()
+    test_default_project_prefork()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
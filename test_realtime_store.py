@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+实时数据存储测试脚本
+"""
+
+from datetime import datetime
+from models import ValueItem
+from realtime_store import LatestValueStore, parent_tags
+
+
+def test_parent_tags():
+    """测试上级标签拆分"""
+    print("=== Testing parent_tags ===")
+    print(f"group1.dev1.a -> {parent_tags('group1.dev1.a')}")
+    assert parent_tags("group1.dev1.a") == ["group1", "group1.dev1"]
+    assert parent_tags("tag") == []
+    print()
+
+
+def test_latest_value_store():
+    """测试最新值写入与查询"""
+    print("=== Testing LatestValueStore ===")
+    store = LatestValueStore()
+    now = datetime.now()
+    store.update_many([
+        ValueItem("group1.dev1.a", now, 1.0),
+        ValueItem("group1.dev1.b", now, 2.0),
+        ValueItem("group1.dev2.a", now, 3.0),
+    ])
+    store.update(ValueItem("group1.dev1.a", now, 4.0))
+
+    print(f"group1.dev1.a: {store.get('group1.dev1.a').to_dict()}")
+    assert store.get("group1.dev1.a").value == 4.0
+    assert store.get("missing") is None
+
+    device = [item.tag for item in store.get_device("group1.dev1")]
+    print(f"group1.dev1: {device}")
+    assert device == ["group1.dev1.a", "group1.dev1.b"]
+    assert len(store.get_device("group1")) == 3
+
+    store.remove("group1.dev2.a")
+    assert store.get_device("group1.dev2") == []
+    assert len(store) == 2
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_parent_tags()
+    test_latest_value_store()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+断线重放缓冲区测试脚本
+"""
+
+import asyncio
+import json
+from datetime import datetime
+from models import ValueItem
+from realtime_store import LatestValueStore
+from history_store import HistoryStore
+from catalog import TagCatalog
+from nats_service import NatsPushService
+from replay_buffer import ReplayBuffer, DROP_OLDEST, DROP_NEWEST, KEEP_LATEST
+
+NOW = datetime.now()
+
+
+def _item(tag, value):
+    return ValueItem(tag, NOW, value, 1)
+
+
+def _values(items):
+    return [item.value for item in items]
+
+
+def test_policies():
+    """测试三种溢出策略"""
+    print("=== Testing overflow policies ===")
+    items = [_item(f"dev.{i % 3}", float(i)) for i in range(6)]
+
+    buffer = ReplayBuffer(4, DROP_OLDEST)
+    assert buffer.extend(items) == 2
+    assert _values(buffer.take(10)) == [2.0, 3.0, 4.0, 5.0]
+
+    buffer = ReplayBuffer(4, DROP_NEWEST)
+    assert buffer.extend(items) == 2
+    assert _values(buffer.take(10)) == [0.0, 1.0, 2.0, 3.0]
+
+    # 每个测点只保留最新值，测点在缓冲区中的位置不变
+    buffer = ReplayBuffer(4, KEEP_LATEST)
+    assert buffer.extend(items) == 0
+    assert _values(buffer.take(10)) == [3.0, 4.0, 5.0]
+    buffer = ReplayBuffer(2, KEEP_LATEST)
+    assert buffer.extend(items) == 4
+    print(f"Dropped: {buffer.dropped}")
+    print()
+
+
+def test_restore():
+    """测试重放失败时放回头部"""
+    print("=== Testing restore ===")
+    buffer = ReplayBuffer(4, DROP_OLDEST)
+    buffer.extend([_item("a", float(i)) for i in range(4)])
+    batch = buffer.take(2)
+    buffer.extend([_item("a", 4.0), _item("a", 5.0)])
+    assert buffer.restore(batch) == 2
+    assert _values(buffer.take(10)) == [2.0, 3.0, 4.0, 5.0]
+
+    buffer = ReplayBuffer(4, KEEP_LATEST)
+    buffer.extend([_item("a", 1.0), _item("b", 1.0)])
+    batch = buffer.take(2)
+    buffer.extend([_item("a", 2.0)])
+    buffer.restore(batch)
+    assert [(item.tag, item.value) for item in buffer.take(10)] == [("b", 1.0), ("a", 2.0)]
+    print()
+
+
+class FlakyNats:
+    """可切换连接状态的假 NATS 客户端"""
+
+    def __init__(self):
+        self.is_connected = False
+        self.published = []
+
+    async def publish(self, subject, payload):
+        if not self.is_connected:
+            raise ConnectionError("disconnected")
+        self.published.append(json.loads(payload)["value"])
+
+    async def flush(self, timeout=None):
+        if not self.is_connected:
+            raise ConnectionError("disconnected")
+
+
+def test_buffer_and_replay():
+    """测试断线期间缓存、重新连上后按顺序重放，重放完成前的新数据排在后面"""
+    print("=== Testing buffer and replay ===")
+
+    async def run():
+        service = NatsPushService(store=LatestValueStore(), history=HistoryStore(),
+                                  catalog=TagCatalog([]), report_by_exception=False,
+                                  buffer_size=100, replay_batch_size=3)
+        service.nc = nc = FlakyNats()
+        for i in range(5):
+            await service.publish_tick([_item("dev1.a", float(i))])
+        assert nc.published == [] and len(service.buffer) == 5
+
+        nc.is_connected = True
+        await service._on_reconnected()
+        await service.publish_tick([_item("dev1.a", 5.0)])
+        await service.replay_task
+        await service.publish_tick([_item("dev1.a", 6.0)])
+        return nc.published, len(service.buffer)
+
+    published, remaining = asyncio.run(run())
+    print(f"Published: {published}")
+    assert published == [float(i) for i in range(7)]
+    assert remaining == 0
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_policies()
+    test_restore()
+    test_buffer_and_replay()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
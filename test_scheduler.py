@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+周期调度测试脚本
+"""
+
+import asyncio
+import time
+from scheduler import TickScheduler
+
+
+async def _run_for(scheduler, seconds):
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(seconds)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def test_no_drift():
+    """测试每轮耗时不会累积成漂移"""
+    print("=== Testing no drift ===")
+    starts = []
+
+    async def work(tick):
+        starts.append(time.monotonic())
+        await asyncio.sleep(0.02)
+
+    scheduler = TickScheduler("test_drift", 0.05, work)
+    asyncio.run(_run_for(scheduler, 0.52))
+    print(f"Ticks: {scheduler.ticks}, missed: {scheduler.missed}")
+    # 按 sleep(周期) 实现时每轮间隔为 0.07 秒，只能运行约 8 轮
+    assert scheduler.ticks >= 10
+    assert scheduler.missed == 0
+    assert abs((starts[-1] - starts[0]) - 0.05 * (len(starts) - 1)) < 0.05
+    print()
+
+
+def test_missed_ticks():
+    """测试超时的轮次被跳过并计数，而不是连续补跑"""
+    print("=== Testing missed ticks ===")
+    ticks = []
+
+    async def work(tick):
+        ticks.append(tick)
+        if tick == 1:
+            await asyncio.sleep(0.17)
+
+    scheduler = TickScheduler("test_missed", 0.05, work)
+    asyncio.run(_run_for(scheduler, 0.4))
+    print(f"Ticks: {scheduler.ticks}, missed: {scheduler.missed}")
+    assert scheduler.missed >= 2
+    # 总轮数加错过的轮数与经过的周期数相符
+    assert 6 <= scheduler.ticks + scheduler.missed <= 10
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_no_drift()
+    test_missed_ticks()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
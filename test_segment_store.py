@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+历史数据持久化测试脚本
+"""
+
+import os
+import tempfile
+import threading
+import time
+from history_store import HistoryStore
+from segment_store import HEADER_SIZE, RECORD_SIZE, SegmentStore, tag_dirname
+
+BASE = 1640995200000
+
+
+def test_tag_dirname():
+    """测试标签目录名转义"""
+    print("=== Testing tag_dirname ===")
+    assert tag_dirname("group1.dev1.a") == "group1.dev1.a"
+    assert tag_dirname("a/b") == "a%2Fb"
+    assert tag_dirname("..") == "%2E."
+    print()
+
+
+def test_segment_store():
+    """测试写入、跨窗口范围查询和打开目录时截断不完整记录"""
+    print("=== Testing SegmentStore ===")
+    with tempfile.TemporaryDirectory() as base_dir:
+        store = SegmentStore(base_dir, window_ms=60 * 1000)
+        for i in range(300):
+            store.append("group1.dev1.a", BASE + i * 1000, float(i))
+        store.close()
+
+        directory = os.path.join(base_dir, "group1.dev1.a")
+        print(f"Segments: {sorted(os.listdir(directory))}")
+        assert len(os.listdir(directory)) == 5
+
+        with store.open_range("group1.dev1.a", BASE + 50 * 1000, BASE + 130 * 1000) as rng:
+            assert rng.count == 81
+            times, values = rng.read(0, rng.count)
+            assert list(values) == [float(i) for i in range(50, 131)]
+            times, values = rng.read(5, 15)
+            assert list(values) == [float(i) for i in range(55, 65)]
+
+        # 模拟异常退出留下的半条记录
+        last = os.path.join(directory, sorted(os.listdir(directory))[-1])
+        with open(last, 'ab') as f:
+            f.write(b'\x01\x02\x03')
+        size = os.path.getsize(last)
+
+        # 打开目录时即截断，不等第一次写入
+        reopened = SegmentStore(base_dir, window_ms=60 * 1000)
+        assert os.path.getsize(last) == size - 3
+        assert (os.path.getsize(last) - HEADER_SIZE) % RECORD_SIZE == 0
+        assert not reopened.append("group1.dev1.a", BASE, 0.0)
+        assert reopened.append("group1.dev1.a", BASE + 300 * 1000, 300.0)
+        reopened.close()
+        with reopened.open_range("group1.dev1.a", None, None) as rng:
+            assert rng.count == 301
+    print()
+
+
+def test_tiered_history():
+    """测试内存与段文件拼接查询，以及重启后直接从段文件查询"""
+    print("=== Testing tiered HistoryStore ===")
+    with tempfile.TemporaryDirectory() as base_dir:
+        history = HistoryStore(100, SegmentStore(base_dir, window_ms=60 * 1000))
+        for i in range(250):
+            history.append("group1.dev1.a", BASE + i * 1000, float(i))
+        history.close()
+
+        times, values = history.query("group1.dev1.a", BASE, None)
+        assert list(values) == [float(i) for i in range(250)]
+        times, values = history.query("group1.dev1.a", None, None, offset=140, limit=20)
+        assert list(values) == [float(i) for i in range(140, 160)]
+        times, values = history.query("group1.dev1.a", None, None, offset=5, limit=3, descending=True)
+        assert list(values) == [244.0, 243.0, 242.0]
+
+        restarted = HistoryStore(100, SegmentStore(base_dir, window_ms=60 * 1000))
+        times, values = restarted.query("group1.dev1.a", BASE + 10 * 1000, BASE + 19 * 1000)
+        print(f"After restart: {list(values)}")
+        assert list(values) == [float(i) for i in range(10, 20)]
+    print()
+
+
+def test_concurrent_flush():
+    """测试 flush 写出期间另一线程的 append 不会被清空丢失"""
+    print("=== Testing concurrent flush ===")
+    with tempfile.TemporaryDirectory() as base_dir:
+        store = SegmentStore(base_dir, window_ms=60 * 1000)
+        store.append("group1.dev1.a", BASE, 0.0)
+        writing = threading.Event()
+        real_write = os.write
+
+        def slow_write(fd, data):
+            # 写出过程中让出时间，主线程在此期间追加下一条记录
+            writing.set()
+            time.sleep(0.05)
+            return real_write(fd, data)
+
+        os.write = slow_write
+        try:
+            thread = threading.Thread(target=store.flush, args=(True,))
+            thread.start()
+            writing.wait(1)
+            store.append("group1.dev1.a", BASE + 1000, 1.0)
+            thread.join()
+        finally:
+            os.write = real_write
+        store.close()
+        with store.open_range("group1.dev1.a", None, None) as rng:
+            times, values = rng.read(0, rng.count)
+        print(list(values))
+        assert list(values) == [0.0, 1.0]
+    print()
+
+
+def test_open_files():
+    """测试当前窗口的段文件保持打开，切换窗口或空闲时关闭，打开的文件数不超过上限"""
+    print("=== Testing open files ===")
+    with tempfile.TemporaryDirectory() as base_dir:
+        store = SegmentStore(base_dir, window_ms=60 * 1000, max_open_files=2)
+        tags = [f"group1.dev{i}.a" for i in range(5)]
+        for i in range(3):
+            for tag in tags:
+                store.append(tag, BASE + i * 1000, float(i))
+            store.flush(force=True)
+            assert store._open_files == 2
+        writers = [store._writers[tag] for tag in tags]
+        fd = writers[0].fd
+        assert fd is not None and writers[-1].fd is None
+
+        # 只有最后一个测点有新数据：其他测点的文件关闭，名额留给它
+        store.append(tags[-1], BASE + 3000, 3.0)
+        store.flush(force=True)
+        assert writers[0].fd is None and writers[-1].fd is not None and store._open_files == 1
+        # 进入下一个窗口时关闭上一个窗口的文件
+        store.append(tags[-1], BASE + 60 * 1000, 60.0)
+        assert writers[-1].fd is None and store._open_files == 0
+        store.close()
+        assert store._open_files == 0
+        for tag in tags:
+            with store.open_range(tag, None, None) as rng:
+                assert rng.count == (5 if tag == tags[-1] else 3)
+    print()
+
+
+def test_background_writer():
+    """测试 append_many 只缓冲记录，段文件由后台写入线程写出"""
+    print("=== Testing background segment writer ===")
+    from datetime import datetime
+    from models import ValueItem
+    with tempfile.TemporaryDirectory() as base_dir:
+        history = HistoryStore(100, SegmentStore(base_dir, window_ms=60 * 1000, flush_interval=0.2))
+        writer_threads = set()
+        original_write = os.write
+
+        def tracking_write(fd, data):
+            writer_threads.add(threading.current_thread().name)
+            return original_write(fd, data)
+
+        os.write = tracking_write
+        try:
+            now = datetime.fromtimestamp(BASE / 1000)
+            history.append_many([ValueItem(f"group1.dev1.p{i}", now, float(i)) for i in range(3)])
+            assert writer_threads == set()
+            deadline = time.monotonic() + 2.0
+            while not writer_threads and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            os.write = original_write
+        history.close()
+        print(f"Writer threads: {writer_threads}")
+        assert writer_threads == {"segment-writer"}
+        with history.segments.open_range("group1.dev1.p2", None, None) as rng:
+            assert list(rng.read(0, rng.count)[1]) == [2.0]
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_tag_dirname()
+    test_segment_store()
+    test_tiered_history()
+    test_concurrent_flush()
+    test_open_files()
+    test_background_writer()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+共享内存最新值表测试脚本
+"""
+
+import os
+from datetime import datetime
+from models import ValueItem
+from shared_values import REJECTED, SharedLatestValueStore
+
+
+def test_shared_store():
+    """测试写入与查询，值类型和时间戳原样保留"""
+    print("=== Testing SharedLatestValueStore ===")
+    store = SharedLatestValueStore(8)
+    try:
+        now = datetime(2024, 1, 2, 3, 4, 5, 678901)
+        store.update_many([
+            ValueItem("group1.dev1.a", now, 1.5),
+            ValueItem("group1.dev1.b", now, 2),
+            ValueItem("group1.dev1.c", now, "25.5"),
+            ValueItem("group1.dev2.a", now, None, 0),
+        ])
+        store.update(ValueItem("group1.dev1.a", now, 4.0))
+
+        item = store.get("group1.dev1.a")
+        print(f"group1.dev1.a: {item.to_dict()}")
+        assert item.value == 4.0 and item.timestamp == now
+        assert store.get("group1.dev1.b").value == 2
+        assert store.get("group1.dev1.c").value == "25.5"
+        assert store.get("group1.dev2.a").quality == 0
+        assert store.get("missing") is None
+        assert [item.tag for item in store.get_device("group1.dev1")] == \
+            ["group1.dev1.a", "group1.dev1.b", "group1.dev1.c"]
+        assert len(store.get_device("group1")) == 4
+
+        store.remove("group1.dev2.a")
+        assert store.get("group1.dev2.a") is None
+        assert len(store.get_device("group1")) == 3
+
+        # 字符串过长时只跳过该测点，保留原值，同一批的其他测点照常写入
+        too_long, full = REJECTED.labels('too_long'), REJECTED.labels('full')
+        before = too_long.value
+        assert store.check("group1.dev1.c", "x" * 100) is not None
+        rejected = store.update_many([ValueItem("group1.dev1.a", now, 9.0), ValueItem("group1.dev1.c", now, "x" * 100),
+                                      ValueItem("group1.dev1.b", now, 3)])
+        assert rejected == ["group1.dev1.c"]
+        assert store.get("group1.dev1.a").value == 9.0 and store.get("group1.dev1.b").value == 3
+        assert store.get("group1.dev1.c").value == "25.5"
+        assert too_long.value == before + 1
+
+        # 超出容量的测点被忽略并计数
+        before = full.value
+        rejected = store.update_many([ValueItem(f"extra.{i}", now, float(i)) for i in range(10)])
+        assert rejected == [f"extra.{i}" for i in range(4, 10)]
+        assert len(store) == 8
+        assert store.check("extra.9", 1.0) is not None and store.check("extra.3", 1.0) is None
+        assert store.get("extra.3").value == 3.0
+        assert full.value == before + 6
+    finally:
+        store.close(unlink=True)
+    print()
+
+
+def test_shared_across_fork():
+    """测试 fork 出的子进程写入后父进程可直接读到"""
+    print("=== Testing shared across fork ===")
+    if not hasattr(os, 'fork'):
+        print("fork not available, skipped")
+        return
+    store = SharedLatestValueStore(16)
+    try:
+        pid = os.fork()
+        if pid == 0:
+            store.update(ValueItem("child.dev.a", datetime.now(), 42.0))
+            os._exit(0)
+        os.waitpid(pid, 0)
+        item = store.get("child.dev.a")
+        print(f"From child: {item.to_dict()}")
+        assert item.value == 42.0
+        assert [item.tag for item in store.get_device("child.dev")] == ["child.dev.a"]
+    finally:
+        store.close(unlink=True)
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_shared_store()
+    test_shared_across_fork()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+写值流水线测试脚本
+"""
+
+import threading
+from realtime_store import LatestValueStore
+from write_pipeline import WritePipeline, LatestValueSink, wait_all, WRITE_SUCCESS, WRITE_ERROR
+
+
+def test_coalescing():
+    """测试同一测点的写入合并"""
+    print("=== Testing coalescing ===")
+    batches = []
+    pipeline = WritePipeline(batches.append, max_pending=10, flush_interval=0.05)
+    futures = pipeline.submit([{"tag": "a", "value": i} for i in range(5)] + [{"tag": "b", "value": 9}])
+    results = wait_all(futures, 2.0)
+    pipeline.close(1.0)
+
+    applied = [(write.tag, write.value) for batch in batches for write in batch]
+    print(f"Applied: {applied}")
+    assert applied == [("a", 4), ("b", 9)]
+    assert results == [WRITE_SUCCESS] * 6
+    print()
+
+
+def test_backpressure():
+    """测试待写表满时整批拒绝"""
+    print("=== Testing backpressure ===")
+    release = threading.Event()
+    pipeline = WritePipeline(lambda batch: release.wait(2.0), max_pending=2, flush_interval=0.5)
+    assert pipeline.submit([{"tag": "a", "value": 1}, {"tag": "b", "value": 1}]) is not None
+    # 已在待写表中的测点可以继续合并，新测点被拒绝
+    assert pipeline.submit([{"tag": "a", "value": 2}]) is not None
+    assert pipeline.submit([{"tag": "c", "value": 1}]) is None
+    release.set()
+    pipeline.close(2.0)
+    assert pipeline.submit([{"tag": "a", "value": 3}]) is None
+    print()
+
+
+def test_sink_error():
+    """测试 sink 出错时的完成状态"""
+    print("=== Testing sink error ===")
+
+    def failing_sink(batch):
+        raise RuntimeError("device offline")
+
+    pipeline = WritePipeline(failing_sink, flush_interval=0.01)
+    assert wait_all(pipeline.submit([{"tag": "a", "value": 1}]), 2.0) == [WRITE_ERROR]
+    pipeline.close(1.0)
+    print()
+
+
+def test_latest_value_sink():
+    """测试默认 sink 写入最新值表"""
+    print("=== Testing LatestValueSink ===")
+    store = LatestValueStore()
+    pipeline = WritePipeline(LatestValueSink(store), flush_interval=0.01)
+    futures = pipeline.submit([{"tag": "group1.dev1.a", "value": 25.5, "time": 1640995200000}])
+    assert wait_all(futures, 2.0) == [WRITE_SUCCESS]
+    pipeline.close(1.0)
+    item = store.get("group1.dev1.a")
+    print(f"Stored: {item.to_dict()}")
+    assert item.value == 25.5
+    print()
+
+
+def test_rejected_tags():
+    """测试 sink 返回的被拒绝标签单独失败"""
+    print("=== Testing rejected tags ===")
+    pipeline = WritePipeline(lambda batch: ["b"], flush_interval=0.01)
+    futures = pipeline.submit([{"tag": "a", "value": 1}, {"tag": "b", "value": 2}])
+    assert wait_all(futures, 2.0) == [WRITE_SUCCESS, WRITE_ERROR]
+    pipeline.close(1.0)
+    print()
+
+
+def main():
+    """主测试函数"""
+    test_coalescing()
+    test_backpressure()
+    test_sink_error()
+    test_latest_value_sink()
+    test_rejected_tags()
+    print("All tests completed!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
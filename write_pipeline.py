@@ -0,0 +1,166 @@
+"""
+写值流水线
+
+set_value 只把写入请求放进有界的待写表后立即返回，由后台线程按刷新间隔批量交给下游 sink。
+待写表按测点合并：同一刷新窗口内对同一测点的多次写入只下发最后一次，被覆盖的写入
+以覆盖它的写入的结果作为完成结果。待写测点数达到上限时拒绝新的写入（返回 busy），
+调用方据此返回 503，而不是排队等待；读接口不经过这里，不受写入突发影响。
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+from models import ValueItem
+from realtime_store import LatestValueStore, latest_values
+from history_store import to_epoch_ms, from_epoch_ms
+import config
+
+logger = logging.getLogger(__name__)
+
+# 单条写入的完成状态
+WRITE_SUCCESS = "success"
+WRITE_ERROR = "error"
+WRITE_TIMEOUT = "timeout"
+# 待写表已满
+WRITE_BUSY = "busy"
+
+
+class PendingWrite:
+    """一条待下发的写入；futures 包含被合并掉的同测点写入"""
+    __slots__ = ('tag', 'value', 'time', 'futures')
+
+    def __init__(self, tag: str, value: Any, time: Any, future: Future):
+        self.tag = tag
+        self.value = value
+        self.time = time
+        self.futures = [future]
+
+
+class LatestValueSink:
+    """默认 sink：把写入的值更新到最新值表，find_last 即可读到；返回未能写入的标签"""
+
+    def __init__(self, store: LatestValueStore = latest_values):
+        self.store = store
+
+    def __call__(self, writes: Sequence[PendingWrite]) -> List[str]:
+        items = []
+        for write in writes:
+            ts = to_epoch_ms(write.time)
+            timestamp = from_epoch_ms(ts) if ts is not None else datetime.now()
+            items.append(ValueItem(write.tag, timestamp, write.value))
+        return self.store.update_many(items)
+
+
+class WritePipeline:
+    def __init__(self, sink: Callable[[Sequence[PendingWrite]], Optional[Iterable[str]]],
+                 max_pending: int = 10000, flush_interval: float = 0.05, batch_size: int = 1000):
+        self.sink = sink
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._cond = threading.Condition()
+        self._pending: Dict[str, PendingWrite] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        with self._cond:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="write-pipeline", daemon=True)
+                self._thread.start()
+
+    def submit(self, writes: Sequence[Dict[str, Any]]) -> Optional[List[Future]]:
+        """提交一批写入，返回每条写入的 Future（结果为完成状态）
+
+        整批要么全部进入待写表，要么在待写表容纳不下时全部拒绝并返回 None。
+        """
+        if self._thread is None:
+            self.start()
+        futures = []
+        with self._cond:
+            if self._closed:
+                return None
+            pending = self._pending
+            new_tags = {write["tag"] for write in writes if write["tag"] not in pending}
+            if len(pending) + len(new_tags) > self.max_pending:
+                return None
+            for write in writes:
+                future = Future()
+                tag = write["tag"]
+                current = pending.get(tag)
+                if current is None:
+                    pending[tag] = PendingWrite(tag, write.get("value"), write.get("time"), future)
+                else:
+                    # 同一窗口内的多次写入只保留最后一次
+                    current.value = write.get("value")
+                    current.time = write.get("time")
+                    current.futures.append(future)
+                futures.append(future)
+            self._cond.notify()
+        return futures
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            if not self._closed:
+                # 等待一个刷新窗口，让同一测点的连续写入在待写表中合并
+                time.sleep(self.flush_interval)
+            with self._cond:
+                writes = list(self._pending.values())
+                self._pending = {}
+            self._dispatch(writes)
+
+    def _dispatch(self, writes: List[PendingWrite]):
+        """按 batch_size 分批下发，并设置每条写入的完成状态
+
+        sink 抛出异常时整批失败；sink 返回标签列表时，其中的标签（例如共享表放不下的值）单独失败。
+        """
+        for i in range(0, len(writes), self.batch_size):
+            batch = writes[i:i + self.batch_size]
+            rejected = ()
+            try:
+                rejected = set(self.sink(batch) or ())
+                status = WRITE_SUCCESS
+            except Exception as e:
+                logger.error(f"Error applying {len(batch)} writes: {e}")
+                status = WRITE_ERROR
+            for write in batch:
+                write_status = WRITE_ERROR if write.tag in rejected else status
+                for future in write.futures:
+                    future.set_result(write_status)
+
+    def close(self, timeout: Optional[float] = None):
+        """停止接收写入，下发剩余的待写数据后退出后台线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+def wait_all(futures: Sequence[Future], timeout: float) -> List[str]:
+    """等待写入完成，超时未完成的写入状态为 timeout"""
+    deadline = time.monotonic() + timeout
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result(max(deadline - time.monotonic(), 0)))
+        except Exception:
+            results.append(WRITE_TIMEOUT)
+    return results
+
+
+# 进程内共享的写值流水线
+write_pipeline = WritePipeline(LatestValueSink(), config.WRITE_QUEUE_SIZE,
+                               config.WRITE_FLUSH_INTERVAL, config.WRITE_BATCH_SIZE)
\ No newline at end of file